@@ -8,46 +8,392 @@ lives inside it. You can run this using the command
 """
 
 import os
+import sys
+import io
 import csv
-from scipy.interpolate import interp1d
+import html
+import gzip
+import time
+import shutil
+import tempfile
+import json
+import argparse
+import pickle
+import sqlite3
+import hashlib
 import numpy as np 
+import queue
+import re
 import string
-
+import tarfile
+import zipfile
+import threading
+import multiprocessing
+from stat import S_ISDIR
+from datetime import datetime
+from itertools import count, islice
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Listener, Client, AuthenticationError
 
 
 try:
-    import originpro as op
-    # Copies the template we are using to the user files (thanks Robbie!): 
-    if not os.path.isfile(op.path('u')+r"/a^4/a4_template.otpu"):
-        # %@A is were the app lives, %Y is the user folder
-        op.lt_exec(r'file -c "%@Aa^4\a4_template.otpu" "%Ya4_template.otpu"')
-    if not os.path.isfile(op.path('u')+r"/a^4/a4_MPPT.otpu"):
-        # %@A is were the app lives, %Y is the user folder
-        op.lt_exec(r'file -c "%@Aa^4\a4_MPPT.otpu" "%Ya4_MPPT.otpu"')
+    import pandas as pd  # Only used to push whole sheets into Origin in one go, it's fine without it
 except ModuleNotFoundError:
-    print("I couldn't find Origin! I guess you are debuging, which is cool." +
-          "\nJust remember, if you have not commented out all the Origin garbage, I will crash...")
+    pd = None
+
+
+# Worker processes of the multi directory pool (see process_folders) only crunch numbers. They must not import
+# originpro, outside of Origin that goes and starts a whole new Origin:
+if __name__ != '__mp_main__':
+    try:
+        import originpro as op
+        # Copies the template we are using to the user files (thanks Robbie!): 
+        if not os.path.isfile(op.path('u')+r"/a^4/a4_template.otpu"):
+            # %@A is were the app lives, %Y is the user folder
+            op.lt_exec(r'file -c "%@Aa^4\a4_template.otpu" "%Ya4_template.otpu"')
+        if not os.path.isfile(op.path('u')+r"/a^4/a4_MPPT.otpu"):
+            # %@A is were the app lives, %Y is the user folder
+            op.lt_exec(r'file -c "%@Aa^4\a4_MPPT.otpu" "%Ya4_MPPT.otpu"')
+    except ModuleNotFoundError:
+        print("I couldn't find Origin! I guess you are debuging, which is cool." +
+              "\nJust remember, if you have not commented out all the Origin garbage, I will crash...")
+
+# How many processes parse and analyse folders in multi directory mode. None means one per CPU, 1 does it all in
+# this process like it used to:
+WORKERS = None
+
+# Parsed sweeps and analysis results are cached here between runs, so unchanged folders don't get re-parsed. None
+# turns the cache off (so does --no-cache, and --cache-dir moves it). It is kept under CACHE_MAX_BYTES by throwing out
+# whatever was used least recently:
+CACHE_DIR = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~/.cache"), "a4")
+CACHE_MAX_BYTES = 2 * 1024**3
+CACHE_HASH_CONTENTS = False  # Also hash every file, not just size + modified time. Slower, but paranoid
+
+# Every folder's results can also go into an SQLite database (see ResultStore), so they can be searched across runs
+# without opening any Origin projects. Only if asked for with --store, or always if RESULTS_DB is set to where the
+# database should go. RESULTS_DB_DEFAULT is where it goes otherwise (and where --query looks):
+RESULTS_DB = None
+RESULTS_DB_DEFAULT = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~/.local/share"), "a4",
+                                  "results.sqlite")
+
+# Lazy plotting (see origin_create_plots): draw graphs only for the best RENDER_TOP pixels by PCE up front, the rest
+# get drawn the first time someone clicks on them in the summary
+LAZY_GRAPHS = False
+RENDER_TOP = 10
+# What goes in the summary cell of a graph that hasn't been drawn yet. Clicking it runs the LabTalk, which calls
+# back into render_pixel (Origin keeps this script's functions around after it has run). It goes by a number rather
+# than the pixel key, so no key or user label can break the quoting:
+LAZY_LINK = "lt://run -pys \"render_pixel({number})\""
+# Longest a curve gets on its data sheet (so also on the graphs). Longer ones, mostly hours of MPPT, are cut down by
+# downsample_indices, which keeps the highs and lows. The full data is untouched in the database, cache and
+# archives. None puts every point in:
+PLOT_MAX_POINTS = 5000
+
+# Watch mode: how often the folder gets looked at, and how long a file has to sit unchanged before it's trusted to be
+# completely written:
+WATCH_POLL_SECONDS = 2.0
+WATCH_SETTLE_SECONDS = 5.0
+
+# Finding runs at any depth (see scan_campaign): how many threads list folders at once, folder names starting with
+# any of SCAN_SKIP that don't get looked in, and where what was found gets remembered so the next look only goes
+# through what changed. None doesn't remember anything:
+SCAN_WORKERS = 16
+SCAN_CHUNK = 64  # Most folders a thread gets at once
+SCAN_SKIP = (".", "__")
+SCAN_MANIFEST_DIR = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~/.cache"), "a4-manifests")
+
+# Resident analysis server (see serve): started once with python "a^4.py" --serve, after which A^4 (in Origin or not)
+# gets folders from it rather than parsing them itself, so anything looked at recently comes straight back. It keeps
+# the SERVER_MAX_FOLDERS most recently used folders in memory. Local only: a named pipe on Windows, a unix socket
+# anywhere else, and clients need the key it writes to SERVER_KEY_FILE:
+SERVER_DIR = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~/.cache"), "a4-server")
+SERVER_ADDRESS = (r"\\.\pipe\a4-" + os.environ.get("USERNAME", "") if sys.platform == "win32"
+                  else os.path.join(SERVER_DIR, "server.sock"))
+SERVER_KEY_FILE = os.path.join(SERVER_DIR, "server.key")
+SERVER_MAX_FOLDERS = 8
+
+# How many pixels (or folders) the background thread of prefetch is allowed to get ahead of Origin:
+PREFETCH_DEPTH = 4
+# Pixels analysed together by iter_results: up to ANALYSIS_BATCH of them, or fewer once their raw data adds up to
+# ANALYSIS_BATCH_BYTES. Bigger batches vectorise better, smaller ones keep less in memory at once:
+ANALYSIS_BATCH = 32
+ANALYSIS_BATCH_BYTES = 32 * 1024**2
+
+# Long MPPT / stability traces (see MpptStream) are read and crunched this many rows at a time, and boiled down into
+# at most STABILITY_MAX_BINS time bins, so memory doesn't grow with how long the run was. Rolling means are over
+# STABILITY_WINDOW_SECONDS, and the steady state is where the rolling mean stays within STABILITY_TOLERANCE of where
+# it ends up:
+CHUNK_ROWS = 65536
+STABILITY_MAX_BINS = 4096
+# MPPT files bigger than this many bytes are never loaded whole, they're streamed straight into the stability
+# numbers and a trace cut down for plotting (see stream_mppt_file). Packing (--pack) always reads them whole, None
+# loads them whole everywhere:
+MPPT_STREAM_BYTES = 16 * 1024**2
+STABILITY_WINDOW_SECONDS = 60.0
+STABILITY_TOLERANCE = 0.02
+
+# Single diode fits of every JV sweep (see fit_diode), False leaves those columns out. FIT_ITERATIONS is the most
+# Levenberg-Marquardt steps a curve gets (most settle well before), a fit that hasn't settled by then doesn't count.
+# Nor does one with an RMS residual over FIT_MAX_RMSE (mA/cm^2) in the light or FIT_MAX_RMSE_DARK (decades) in the
+# dark. THERMAL_VOLTAGE is kT/q at the measurement temperature:
+FIT_DIODE = True
+FIT_ITERATIONS = 100
+FIT_MAX_RMSE = 1.0
+FIT_MAX_RMSE_DARK = 0.2
+THERMAL_VOLTAGE = 0.025852  # 300 K
+
+# Hysteresis and dark current numbers (see compare_sweeps): the sweeps are compared on a voltage grid this fine (V),
+# leakage is the dark current density at LEAKAGE_BIAS, and rectification how many times bigger it is at
+# RECTIFICATION_BIAS. NaN for sweeps that don't get that far:
+COMPARE_GRID_STEP = 0.005
+LEAKAGE_BIAS = -0.2
+RECTIFICATION_BIAS = 1.0
+
+# Grouped statistics (see GroupStats): pixels whose best PCE (mW/cm^2) is at least this count as working in the yield
+YIELD_MIN_PCE = 5.0
+
+class Profiler:
+    """
+    Opt-in timing of everything A^4 does: finding files, parsing each one (with its size and rows), each analysis
+    step and every call into Origin. Each timed thing is an event tagged with the folder and pixel being worked on at
+    the time, so it can be totalled up per pixel and per folder, dumped as a trace (Chrome's about://tracing format,
+    or JSON lines) or boiled down to the slowest bits. Switched on by setting PROFILER, see profiled().
+    """
+
+    def __init__(self):
+        self.events = []  # dicts: name, cat, ts/dur (microseconds), pid, tid, folder, pixel, args
+        self.__local = threading.local()  # What each thread is working on right now, see context()
+        self.__epoch = time.time() - time.perf_counter()  # Wall clock, so events from pool workers line up
+
+    @property
+    def folder(self):
+        return getattr(self.__local, "folder", None)
+
+    @property
+    def pixel(self):
+        return getattr(self.__local, "pixel", None)
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """Times the with block. Yields the args dict, so numbers only known at the end (rows...) can go in it"""
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            self.events.append({"name": name, "cat": category, "ts": (self.__epoch + start) * 1e6,
+                                "dur": (end - start) * 1e6, "pid": os.getpid(), "tid": threading.get_ident(),
+                                "folder": self.folder, "pixel": self.pixel, "args": args})
+
+    @contextmanager
+    def context(self, **context):
+        """Tags events in the with block with a folder= and/or pixel="""
+        before = (self.folder, self.pixel)
+        self.__local.folder = context.get("folder", self.folder)
+        self.__local.pixel = context.get("pixel", self.pixel)
+        try:
+            yield
+        finally:
+            self.__local.folder, self.__local.pixel = before
+
+    def wrap_origin(self, origin):
+        """
+        originpro (or tests/fake_origin.py's FakeOrigin) with every call timed, as well as calls on the sheets and
+        graphs it hands out
+        """
+        return ProfiledProxy(self, origin, "op")
+
+    def write_trace(self, trace_path):
+        """Dumps every event, as JSON lines if the file ends in .jsonl, otherwise as a Chrome trace"""
+        with open(trace_path, 'w') as file:
+            if trace_path.endswith(".jsonl"):
+                for event in self.events:
+                    file.write(json.dumps(event, default=str) + "\n")
+                return
+            trace = [{"name": event["name"], "cat": event["cat"], "ph": "X", "ts": event["ts"],
+                      "dur": event["dur"], "pid": event["pid"], "tid": event.get("tid", event["pid"]),
+                      "args": dict(event["args"], folder=event["folder"], pixel=event["pixel"])}
+                     for event in self.events]
+            json.dump({"traceEvents": trace}, file, default=str)
+
+    def totals(self, by):
+        """{thing: [total microseconds, count]} with events grouped by a key ("name", "cat", "pixel", "folder")"""
+        totals = {}
+        for event in self.events:
+            if event[by] is None:
+                continue
+            total = totals.setdefault(event[by], [0.0, 0])
+            total[0] += event["dur"]
+            total[1] += 1
+        return totals
+
+    def summary(self, top=10):
+        """Prints where the time went: per stage, per folder, the slowest pixels and the slowest single events"""
+        print("\n" + "#" * 78 + "\nPROFILE")
+        for by, heading in (("name", "Per step"), ("folder", "Per folder"), ("pixel", f"Slowest {top} pixels")):
+            totals = sorted(self.totals(by).items(), key=lambda item: -item[1][0])
+            print(f"\n{heading}:")
+            for thing, (total, count) in totals[:top if by == "pixel" else None]:
+                print(f"  {str(thing):<50}{total / 1e3:>12.1f} ms{count:>8} calls")
+        print(f"\nSlowest {top} single events:")
+        for event in sorted(self.events, key=lambda event: -event["dur"])[:top]:
+            where = " / ".join(str(thing) for thing in (event["folder"], event["pixel"]) if thing)
+            print(f"  {event['name']:<20}{event['dur'] / 1e3:>10.1f} ms  {where} {event['args'] or ''}")
+
+    def merge(self, events):
+        """Adds on events recorded somewhere else (a pool worker)"""
+        self.events.extend(events)
+
+
+class ProfiledProxy:
+    """
+    Times every method call going through to the thing it wraps, and wraps whatever objects come back too. Proxies
+    passed back in (a sheet to graph.add_plot...) are unwrapped again first, originpro only knows its own objects.
+    """
+
+    def __init__(self, profiler, target, prefix):
+        self.__profiler = profiler
+        self.__target = target
+        self.__prefix = prefix
+
+    def __getattr__(self, name):
+        value = getattr(self.__target, name)
+        if not callable(value):
+            return value
+        def call(*args, **kwargs):
+            args = [unwrap_proxy(arg) for arg in args]
+            kwargs = {key: unwrap_proxy(arg) for key, arg in kwargs.items()}
+            with self.__profiler.span(f"{self.__prefix}.{name}", "origin"):
+                result = value(*args, **kwargs)
+            if result is None or isinstance(result, (str, bytes, int, float, bool, list, tuple, dict)):
+                return result
+            return ProfiledProxy(self.__profiler, result, type(result).__name__)
+        return call
+
+    def __setattr__(self, name, value):
+        if name.startswith("_ProfiledProxy__"):
+            object.__setattr__(self, name, value)
+            return
+        with self.__profiler.span(f"{self.__prefix}.{name}=", "origin"):
+            setattr(self.__target, name, unwrap_proxy(value))
+
+    def __getitem__(self, index):
+        return ProfiledProxy(self.__profiler, self.__target[index], self.__prefix)
+
+    def unwrap(self):
+        return self.__target
+
+
+def unwrap_proxy(value):
+    """The object a ProfiledProxy wraps, or value itself if it isn't one"""
+    return value.unwrap() if isinstance(value, ProfiledProxy) else value
+
+
+PROFILER = None  # Set to a Profiler to time everything
+
+
+def profiled(name, category, **args):
+    """Times a with block if profiling is on, otherwise does nothing. Either way yields a dict for extra args"""
+    if PROFILER is None:
+        return nullcontext(args)
+    return PROFILER.span(name, category, **args)
+
+
+def profiled_context(**context):
+    """Profiler.context if profiling is on, otherwise does nothing"""
+    return nullcontext() if PROFILER is None else PROFILER.context(**context)
+
+
+def prefetch(items, depth=PREFETCH_DEPTH):
+    """
+    Runs an iterator in a background thread, at most depth items ahead of whoever is using it, so the parsing of the
+    next pixels (or folders) happens while this thread is busy feeding Origin. Errors come out here, in order, and
+    stopping early stops the background thread too.
+    :param items: Iterator to run, e.g. iter_db(path)
+    :param depth: Most finished items waiting around at once
+    :return: Generator of the same items
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    finished = object()
+    context = {} if PROFILER is None else {"folder": PROFILER.folder, "pixel": PROFILER.pixel}
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            with profiled_context(**context):
+                for item in items:
+                    if not put((item, None)):
+                        return
+        except BaseException as err:
+            put((finished, err))
+        else:
+            put((finished, None))
+
+    thread = threading.Thread(target=produce, name="a4-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, err = buffer.get()
+            if item is finished:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Every per-pixel file is named <key><anything>.<sweep>.tsv, these are the sweeps we know about:
+SWEEP_SUFFIXES = {".div1.tsv": "div1",
+                  ".div2.tsv": "div2",
+                  ".liv1.tsv": "liv1",
+                  ".liv2.tsv": "liv2",
+                  ".it.tsv": "it",
+                  ".vt.tsv": "vt",
+                  ".mppt.tsv": "mppt"}
+SWEEP_TYPES = tuple(SWEEP_SUFFIXES.values())
+SWEEP_FIELDS = ("V", "I", "t", "stat")  # Row order of every sweep array
+# Any of the files can also be gzipped on their own (e.g. .liv1.tsv.gz), and whole run folders (or folders of them)
+# can be in a zip or tar, which then gets treated just like a folder:
+COMPRESSED_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
 
 class PixelData:
     """
     Class holds, for each pixel on a solar cell tested, the parameters recorded, as well as all the I/V data taken.
     Simply a set of getters and setters, just makes it easier to spool together a bunch of files into one object
 
+    Each sweep is a single (4, n) float64 array as it comes out of load_tsv, rows are V, I, time, stat (see
+    SWEEP_FIELDS), so sweep[0] is still the voltage, sweep[1] the current etc. Sweeps that weren't measured are None.
+    The arrays are stored as they are given, nothing is copied. An MPPT trace that was streamed (see
+    stream_mppt_file) is only the cut down trace for plotting, its numbers are in the MPPT summary.
     """
+    __slots__ = ("__id", "__vars", "__sweeps", "__mppt_summary")
 
     def __init__(self, sys_label=None, user_label=None,
                  layout=None, area=None, dark_area=None, mux_index=None):
         """
         Initial class constructor. On creation can populate the id dict with all the parameters in the csv file. Data
-        not initially added, but empty lists where they would go are created.
+        not initially added, every sweep starts off as None.
         :param sys_label: Label the solar sim software made (A, B, etc)
         :param user_label: User's label of the whole cell
-        :param substrate: Substrate name
         :param layout: Layout id
         :param area: Area of pixel
         :param dark_area: Unsure
         :param mux_index: Index of pixel on device
-        :param weather: Weather config
         """
         self.__id = {"sys_label": sys_label,
                      "user_label": user_label,
@@ -55,64 +401,70 @@ class PixelData:
                      "area": area,
                      "dark_area": dark_area,
                      "mux_index": mux_index}  # This will hold all the parameters
-        
+
         self.__vars = {}
+        self.__sweeps = dict.fromkeys(SWEEP_TYPES)  # sweep name (see SWEEP_SUFFIXES) -> data
+        self.__mppt_summary = None
 
-        # Format: V,I,time, stat
-        self.__dark_iv_1 = [None, None, None, None]
-        self.__dark_iv_2 = [None, None, None, None]
-        self.__light_iv_1 = [None, None, None, None]
-        self.__light_iv_2 = [None, None, None, None]
-        self.__vt = [None, None, None, None]
-        self.__it = [None, None, None, None]
-        self.__mppt = [None, None, None, None]
-
-    def set_dark_iv(self, I=None, V=None, t=None, stat=None, index=1):
-        if index == 1:  # there's 2 because of hysteresis testing
-            self.__dark_iv_1 = [V, I, t, stat]
-        elif index == 2:
-            self.__dark_iv_2 = [V, I, t, stat]
-        else:
+    def set_sweep(self, sweep, data):
+        if sweep not in self.__sweeps:
+            raise KeyError(f"Unknown sweep {sweep}, should be one of {SWEEP_TYPES}")
+        self.__sweeps[sweep] = data
+
+    def set_dark_iv(self, data, index=1):
+        if index not in (1, 2):  # there's 2 because of hysteresis testing
             raise IndexError("Out of range: index only between 1 and 2")
+        self.__sweeps[f"div{index}"] = data
 
-    def set_light_iv(self, I=None, V=None, t=None, stat=None, index=1):
-        if index == 1:
-            self.__light_iv_1 = [V, I, t, stat]
-        elif index == 2:
-            self.__light_iv_2 = [V, I, t, stat]
-        else:
+    def set_light_iv(self, data, index=1):
+        if index not in (1, 2):
             raise IndexError("Out of range: index only between 1 and 2")
+        self.__sweeps[f"liv{index}"] = data
 
-    def set_vt(self, I=None, V=None, t=None, stat=None):
-        self.__vt = [V, I, t, stat]
+    def set_vt(self, data):
+        self.__sweeps["vt"] = data
 
-    def set_it(self, I=None, V=None, t=None, stat=None):
-        self.__it = [V, I, t, stat]
+    def set_it(self, data):
+        self.__sweeps["it"] = data
+
+    def set_mppt(self, data):
+        self.__sweeps["mppt"] = data
+
+    def set_mppt_summary(self, summary):
+        self.__mppt_summary = summary
 
-    def set_mppt(self, I=None, V=None, t=None, stat=None):
-        self.__mppt = [V, I, t, stat]
-        
     def append_var(self, key, value):
         self.__vars[key] = value
 
+    def release(self):
+        """Lets go of every sweep (the IDs and extra variables stay), once they've been plotted/analysed"""
+        self.__sweeps = dict.fromkeys(SWEEP_TYPES)
+        self.__mppt_summary = None
+
     def get_id(self):
         return self.__id
 
+    def get_sweep(self, sweep):
+        return self.__sweeps[sweep]
+
     def get_dark_iv(self):
-        return (self.__dark_iv_1, self.__dark_iv_2)
+        return (self.__sweeps["div1"], self.__sweeps["div2"])
 
     def get_light_iv(self):
-        return (self.__light_iv_1, self.__light_iv_2)
+        return (self.__sweeps["liv1"], self.__sweeps["liv2"])
 
     def get_vt(self):
-        return self.__vt
+        return self.__sweeps["vt"]
 
     def get_it(self):
-        return self.__it
+        return self.__sweeps["it"]
 
     def get_mppt(self):
-        return self.__mppt
-    
+        return self.__sweeps["mppt"]
+
+    def get_mppt_summary(self):
+        return self.__mppt_summary
+
     def get_var(self):
         return self.__vars
 
@@ -152,6 +504,470 @@ def find_starts_with(starts_with, path):
     return file_paths
 
 
+def iscompressed(path):
+    """Whether path is a zip or tar file (that can be looked in like a folder)"""
+    return path.lower().endswith(COMPRESSED_SUFFIXES) and os.path.isfile(path)
+
+
+def split_compressed(path):
+    """
+    Splits a path that goes into a zip/tar, e.g. D:/runs.zip/run1/A_x_device1.liv1.tsv becomes
+    ("D:/runs.zip", "run1/A_x_device1.liv1.tsv").
+    :param path: Any path
+    :return: (zip/tar, path inside it with / separators, "" for the top of it), or (None, path) if it's a normal path
+    """
+    head, inside = os.path.normpath(path), []
+    while not os.path.exists(head):
+        head, name = os.path.split(head)
+        if not name:
+            return None, path
+        inside.append(name)
+    if iscompressed(head):
+        return head, "/".join(reversed(inside))
+    return None, path
+
+
+class CompressedFile:
+    """
+    A zip or tar file looked at as if it were a folder. The list of what's in it is read once, and files are streamed
+    out of it (decompressing as they go), nothing ever gets extracted to disk. Zips and plain tars can go straight to
+    any file in them. Compressed tars can't (getting to a file means decompressing everything before it), so the first
+    time a file in one of their folders is opened, that whole folder is read into memory in a single pass through the
+    tar, and the rest of its files come from there.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The .zip/.tar/.tar.gz/... file
+        """
+        self.path = path
+        stat = os.stat(path)
+        self.state = (stat.st_size, stat.st_mtime_ns)
+        self.files = {"": {}}  # {folder inside: {file name: size}}, "" is the top level
+        self.folders = {"": set()}  # {folder inside: {subfolder names}}
+        self.__members = {}  # {path inside: ZipInfo/TarInfo}
+        self.__lock = threading.Lock()  # The prefetch thread reads from these too
+        self.__buffered = {}  # {path inside: bytes} for the one folder of a compressed tar that's been read
+        self.__buffered_folder = None
+
+        if zipfile.is_zipfile(path):
+            self.__zip, self.__tar = zipfile.ZipFile(path), None
+            members = [(info.filename, info) for info in self.__zip.infolist() if not info.is_dir()]
+        else:
+            self.__zip, self.__tar = None, tarfile.open(path, 'r:*')
+            members = [(member.name, member) for member in self.__tar.getmembers() if member.isfile()]
+            if not path.lower().endswith(".tar"):
+                self.__tar.close()  # Only any use for jumping around uncompressed tars
+                self.__tar = None
+        for name, member in members:
+            name = self.clean(name)
+            self.__members[name] = member
+            folder, _, file_name = name.rpartition("/")
+            self.files.setdefault(folder, {})[file_name] = member.file_size if self.__zip else member.size
+            while folder:  # Zips don't have to list the folders themselves, so they're worked out from the files
+                parent, _, subfolder = folder.rpartition("/")
+                self.folders.setdefault(folder, set())
+                self.folders.setdefault(parent, set()).add(subfolder)
+                folder = parent
+
+    @staticmethod
+    def clean(name):
+        """Member names the same way whatever made the archive, e.g. ./run1//a.tsv -> run1/a.tsv"""
+        return "/".join(part for part in name.split("/") if part not in ("", "."))
+
+    def size(self, name):
+        folder, _, file_name = name.rpartition("/")
+        return self.files[folder][file_name]
+
+    def open(self, name):
+        """
+        :param name: Path of the file inside, / separators
+        :return: Binary file object
+        """
+        member = self.__members[name]
+        if self.__zip is not None:
+            return self.__zip.open(member)
+        with self.__lock:
+            if self.__tar is not None:
+                return io.BytesIO(self.__tar.extractfile(member).read())
+            folder = name.rpartition("/")[0]
+            if self.__buffered_folder != folder:
+                self.__buffered = {}
+                with tarfile.open(self.path, 'r|*') as stream:
+                    for member in stream:
+                        member_name = self.clean(member.name)
+                        if member.isfile() and member_name.rpartition("/")[0] == folder:
+                            self.__buffered[member_name] = stream.extractfile(member).read()
+                self.__buffered_folder = folder
+            return io.BytesIO(self.__buffered[name])
+
+    def close(self):
+        for handle in (self.__zip, self.__tar):
+            if handle is not None:
+                handle.close()
+        self.__buffered = {}
+
+
+COMPRESSED_OPEN = 16  # Most zips/tars kept open at once by open_compressed
+_compressed_files = {}  # {path: CompressedFile}, oldest first
+_compressed_lock = threading.Lock()
+
+
+def open_compressed(path):
+    """The CompressedFile for a zip/tar, kept open between calls and reopened if it has changed on disk"""
+    stat = os.stat(path)
+    with _compressed_lock:
+        compressed = _compressed_files.pop(path, None)
+        if compressed is not None and compressed.state != (stat.st_size, stat.st_mtime_ns):
+            compressed.close()
+            compressed = None
+        if compressed is None:
+            compressed = CompressedFile(path)
+        _compressed_files[path] = compressed  # (Back) on the end, as the most recently used
+        while len(_compressed_files) > COMPRESSED_OPEN:
+            _compressed_files.pop(next(iter(_compressed_files))).close()
+    return compressed
+
+
+def list_files(path):
+    """
+    Lists the files directly in a folder, which can also be a zip/tar or a folder inside one.
+    :return: List of (file name, full path)
+    """
+    archive, inside = split_compressed(path)
+    if archive is None:
+        with os.scandir(path) as entries:
+            return [(entry.name, entry.path) for entry in entries if entry.is_file()]
+    return [(name, os.path.join(path, name)) for name in open_compressed(archive).files.get(inside, {})]
+
+
+def list_dirs(path):
+    """
+    Lists the folders directly in a folder (which can also be a zip/tar or a folder inside one). Zips and tars count as
+    folders.
+    :return: List of full paths
+    """
+    archive, inside = split_compressed(path)
+    if archive is None:
+        with os.scandir(path) as entries:
+            return [entry.path for entry in entries
+                    if entry.is_dir() or entry.name.lower().endswith(COMPRESSED_SUFFIXES) and entry.is_file()]
+    return [os.path.join(path, name) for name in open_compressed(archive).folders.get(inside, ())]
+
+
+def open_file(path):
+    """
+    Opens a file for reading wherever it is, on disk or inside a zip/tar. Gzipped files (.gz) are decompressed on the
+    fly.
+    :return: Binary file object
+    """
+    archive, inside = split_compressed(path)
+    if archive is None:
+        return gzip.open(path, 'rb') if path.endswith(".gz") else open(path, 'rb')
+    file = open_compressed(archive).open(inside)
+    return gzip.GzipFile(fileobj=file, mode='rb') if path.endswith(".gz") else file
+
+
+def file_state(path):
+    """
+    (size, modified time in ns) of a file wherever it is. Files inside a zip/tar get the modified time of the zip/tar.
+    """
+    archive, inside = split_compressed(path)
+    if archive is None:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    compressed = open_compressed(archive)
+    return compressed.size(inside), compressed.state[1]
+
+
+class RunIndex:
+    """
+    Discovery index for one run folder (or zip/tar, see list_files). The folder is listed exactly once, and every
+    per-pixel .tsv is then matched to its pixel key with dict lookups, instead of re-walking the folder for
+    every pixel like find_starts_with does.
+
+    After match() is called:
+    files: {key: {sweep: path}} for every key, sweeps that weren't found just aren't in the inner dict
+    orphans: paths of sweep files that don't belong to any key in the csv
+    missing: {key: [sweeps]} for every key that didn't get the full set of sweeps
+    """
+
+    def __init__(self, path):
+        """
+        Lists the folder. Non-recursive, same as find_ext/find_starts_with.
+        :param path: Path to the run folder
+        """
+        self.path = path
+        self.csv_files = []
+        self.yaml_files = []
+        self.files = {}
+        self.orphans = []
+        self.missing = {}
+        self.sweep_files = []  # (filename without the suffix, sweep, full path) of every .tsv we know how to read
+
+        with profiled("discovery", "discovery", path=path):
+            for name, file_path in list_files(path):
+                if name.endswith(".gz"):
+                    name = name[:-3]  # Gzipped on its own, open_file takes care of that
+                if name.endswith(".csv"):
+                    self.csv_files.append(file_path)
+                elif name.endswith(".yaml"):
+                    self.yaml_files.append(file_path)
+                elif name.endswith(".tsv"):
+                    # Suffix is always the last two dot separated bits, e.g ".liv1.tsv":
+                    suffix = name[name.rfind(".", 0, -4):]
+                    if suffix in SWEEP_SUFFIXES:
+                        self.sweep_files.append((name[:-len(suffix)], SWEEP_SUFFIXES[suffix], file_path))
+        self.csv_files.sort()
+        self.yaml_files.sort()
+
+    def match(self, keys):
+        """
+        Assigns each sweep file to the longest key its name starts with. The character after the key can't be a
+        digit, so "A_device1" doesn't swallow the files for "A_device10".
+        :param keys: Pixel keys (slot_label_deviceN) from the run csv
+        :return: self.files
+        """
+        keys = set(keys)
+        self.files = {key: {} for key in keys}
+        self.orphans = []
+        for stem, sweep, file_path in self.sweep_files:
+            key = None
+            for end in range(len(stem), 0, -1):
+                if stem[:end] in keys and not (end < len(stem) and stem[end].isdigit()):
+                    key = stem[:end]
+                    break
+            if key is None:
+                self.orphans.append(file_path)
+            else:
+                self.files[key][sweep] = file_path
+        self.orphans.sort()
+        self.missing = {key: [sweep for sweep in SWEEP_TYPES if sweep not in sweeps]
+                        for key, sweeps in self.files.items() if len(sweeps) < len(SWEEP_TYPES)}
+        return self.files
+
+    def report(self, shown=3):
+        """
+        Prints what didn't line up between the csv and the files on disk, one line per kind of sweep that some pixels
+        don't have (how many, and the first few of them) rather than one per pixel.
+        :param shown: How many pixel keys to name for each sweep
+        """
+        for file_path in self.orphans:
+            print(f"Found {os.path.basename(file_path)}, but it isn't in the csv. Ignoring it...")
+        for sweep in SWEEP_TYPES:
+            keys = sorted(key for key, sweeps in self.missing.items() if sweep in sweeps)
+            if keys:
+                more = ", ..." if len(keys) > shown else ""
+                print(f"No {sweep} sweep for {len(keys)} of {len(self.files)} pixels ({', '.join(keys[:shown])}{more})")
+
+
+def parse_tsv(lines, filename=""):
+    """
+    Parses the data rows of a sweep file. Same rules as reading it cell by cell with csv: tab separated, only the first
+    len(SWEEP_FIELDS) columns are used, anything after them is ignored, and a short row or a cell that isn't a number
+    is an error rather than being quietly skipped.
+    :param lines: Rows of the file, header already taken off
+    :param filename: Only for the error message
+    :return: (4, n) float64 array, rows in SWEEP_FIELDS order
+    """
+    if not any(line.strip() for line in lines):
+        return np.empty((len(SWEEP_FIELDS), 0))
+    try:
+        data = np.loadtxt(lines, dtype=np.float64, delimiter='\t', usecols=range(len(SWEEP_FIELDS)), ndmin=2)
+    except ValueError as e:
+        raise ValueError(f"Couldn't read {os.path.basename(filename) or 'sweep file'}: {e}") from None
+    return data.T
+
+
+def load_tsv(filename):
+    """
+    Reads one sweep file in a single go, rather than row by row.
+    :param filename: Path to the .tsv (or .tsv.gz, and either can be inside a zip/tar, see open_file), header row then
+    V, I, t, stat columns
+    :return: (4, n) float64 array, a view on one contiguous block, rows in SWEEP_FIELDS order
+    """
+    with profiled("parse", "parse", file=os.path.basename(filename)) as info:
+        with open_file(filename) as file:
+            file.readline()  # header
+            text = file.read().decode()
+        data = parse_tsv(text.splitlines(), filename)
+        info.update(bytes=len(text), rows=data.shape[1])
+    return data
+
+
+def iter_tsv_chunks(filename, rows=CHUNK_ROWS):
+    """
+    Reads a sweep file a bit at a time, for traces too long to want in memory all at once.
+    :param filename: Path to the .tsv, same layout as load_tsv
+    :param rows: Rows per chunk
+    :return: Generator of (4, <= rows) float64 arrays, rows in SWEEP_FIELDS order
+    """
+    with io.TextIOWrapper(open_file(filename)) as file:
+        file.readline()  # header
+        while True:
+            lines = list(islice(file, rows))
+            if not lines:
+                return
+            yield parse_tsv(lines, filename)
+
+
+class ResultCache:
+    """
+    Persistent cache of parsed sweeps (one .npy per .tsv) and of analysis results (one pickle per run folder). Every
+    entry is keyed on the fingerprint of the files it came from (path, size, modified time, and optionally a hash of
+    the contents), so anything that changes on disk just misses and gets redone. Hits bump the entry's modified time,
+    which is what evict() uses to throw out the least recently used stuff when the cache gets too big.
+    """
+    VERSION = 6  # Bump when the parsing or analysis changes, so old entries stop matching
+    # Settings the analysis results (and streamed MPPT traces) come out of, changing any of them also stops those
+    # entries matching:
+    SETTINGS = ("CHUNK_ROWS", "STABILITY_MAX_BINS", "STABILITY_WINDOW_SECONDS", "STABILITY_TOLERANCE",
+                "PLOT_MAX_POINTS", "FIT_DIODE", "FIT_ITERATIONS", "FIT_MAX_RMSE", "FIT_MAX_RMSE_DARK", "THERMAL_VOLTAGE",
+                "COMPARE_GRID_STEP", "LEAKAGE_BIAS", "RECTIFICATION_BIAS")
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, hash_contents=CACHE_HASH_CONTENTS):
+        """
+        :param cache_dir: Where the cache lives, made if it doesn't exist
+        :param max_bytes: Size evict() trims the cache down to
+        :param hash_contents: Fingerprint the file contents as well as size and modified time
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"hits": 0, "misses": 0, "bytes_read": 0, "bytes_written": 0, "evicted": 0}
+
+    def add_stats(self, stats):
+        """Adds on stats from a copy of the cache used somewhere else (e.g. in a pool worker)"""
+        for name, value in stats.items():
+            self.stats[name] += value
+
+    def fingerprint(self, path):
+        """What has to stay the same for a cached copy of this file to still count"""
+        size, mtime_ns = file_state(path)
+        parts = [os.path.abspath(path), str(size), str(mtime_ns)]
+        if self.hash_contents:
+            with open_file(path) as file:
+                parts.append(hashlib.sha1(file.read()).hexdigest())
+        return "|".join(parts)
+
+    def settings(self):
+        """The SETTINGS as they are right now, as a fingerprint"""
+        return "|".join(f"{name}={globals()[name]!r}" for name in self.SETTINGS)
+
+    def _entry_path(self, kind, fingerprints, ext):
+        key = hashlib.sha1(f"{kind}|{self.VERSION}|".encode() + "\n".join(fingerprints).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def _read(self, entry_path, read):
+        try:
+            value = read(entry_path)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.stats["bytes_read"] += os.path.getsize(entry_path)
+        os.utime(entry_path)  # most recently used now
+        return value
+
+    def _write(self, entry_path, write):
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        temp_path = f"{entry_path}.{os.getpid()}.tmp"  # Written to the side and moved in, so readers never see half
+        try:
+            write(temp_path)
+            os.replace(temp_path, entry_path)
+            self.stats["bytes_written"] += os.path.getsize(entry_path)
+        except OSError as err:
+            print(f"Couldn't write to the cache ({err}), carrying on without it...")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def load_tsv(self, filename):
+        """load_tsv, but from the cache if this exact file has been parsed before"""
+        entry_path = self._entry_path("tsv", [self.fingerprint(filename)], ".npy")
+        data = self._read(entry_path, np.load)
+        if data is None:
+            data = load_tsv(filename)
+            def write(temp_path):
+                with open(temp_path, 'wb') as file:
+                    np.save(file, data)
+            self._write(entry_path, write)
+        return data
+
+    def stream_mppt_file(self, filename, area):
+        """stream_mppt_file, but from the cache if this exact file has been streamed before"""
+        entry_path = self._entry_path("mppt", [self.fingerprint(filename), repr(area), self.settings()], ".pkl")
+        def read(entry_path):
+            with open(entry_path, 'rb') as file:
+                return pickle.load(file)
+        streamed = self._read(entry_path, read)
+        if streamed is None:
+            streamed = stream_mppt_file(filename, area)
+            def write(temp_path):
+                with open(temp_path, 'wb') as file:
+                    pickle.dump(streamed, file, protocol=pickle.HIGHEST_PROTOCOL)
+            self._write(entry_path, write)
+        return streamed
+
+    def _folder_entry_path(self, path):
+        return self._entry_path("results", [self.fingerprint(file_path) for file_path in run_files(path)]
+                                + [self.settings()], ".pkl")
+
+    def get_results(self, path):
+        """Cached analyze_db results for a run folder, None if it's not cached or anything in it has changed"""
+        def read(entry_path):
+            with open(entry_path, 'rb') as file:
+                return pickle.load(file)
+        return self._read(self._folder_entry_path(path), read)
+
+    def put_results(self, path, results):
+        """Stores the analyze_db results for a run folder"""
+        def write(temp_path):
+            with open(temp_path, 'wb') as file:
+                pickle.dump(results, file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(self._folder_entry_path(path), write)
+
+    def entries(self):
+        """(modified time, size, path) of every file in the cache"""
+        found = []
+        if not os.path.isdir(self.cache_dir):
+            return found
+        with os.scandir(self.cache_dir) as buckets:
+            for bucket in buckets:
+                if not bucket.is_dir():
+                    continue
+                with os.scandir(bucket.path) as files:
+                    for entry in files:
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, stat.st_size, entry.path))
+        return found
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            total -= size
+            self.stats["evicted"] += 1
+
+    def report(self):
+        """Prints how well the cache did this run"""
+        entries = self.entries()
+        looked_up = self.stats["hits"] + self.stats["misses"]
+        print(f"Cache: {self.stats['hits']}/{looked_up} hits, "
+              f"{self.stats['bytes_read'] / 1e6:.1f} MB read, {self.stats['bytes_written'] / 1e6:.1f} MB written, "
+              f"{self.stats['evicted']} evicted. "
+              f"Holding {len(entries)} entries, {sum(size for _, size, _ in entries) / 1e6:.1f} MB in {self.cache_dir}")
+
+
 def print_logo():
     """ pretty unnecessary but also cool"""
     print("""
@@ -170,12 +986,14 @@ Thanks for running my software. For help: akash.dasgupta@physics.ox.ac.uk
           """)
 
 
-def create_db(path):
-    db = {}  # This dude will hold all the PixelData instances
-
-    csv_file_path = find_ext('.csv', path)[0]  # Assuming only 1 csv
-    # Opens CSV and extracts the parameters for each run:
-    with open(csv_file_path, 'r') as file:
+def read_run_csv(csv_file_path):
+    """
+    Opens CSV and extracts the parameters for each run.
+    :param csv_file_path: The run csv
+    :return: {key: PixelData} with the IDs and extra variables filled in but no data yet, in the order of the csv
+    """
+    db = {}
+    with io.TextIOWrapper(open_file(csv_file_path), newline='') as file:
         reader = csv.reader(file)
 
         for rownum, row in enumerate(reader):
@@ -221,422 +1039,2855 @@ def create_db(path):
                                     row[area_index],
                                     row[dark_area_index],
                                     row[pad_index] )  # Populates ID
-    # Loops over each pixel, sweep through and mines the data:
             for i, varkey in enumerate(reversed(extra_vars)):
                 db[key_str].append_var(varkey, row[pad_index+1+i])
+    return db
+
+
+def iter_db(path, cache=None, stream_bytes=MPPT_STREAM_BYTES):
+    """
+    Reads a run folder a pixel at a time: the csv for the IDs and extra variables, then each pixel's sweeps just
+    before it's handed over.
+    :param path: Run folder
+    :param cache: ResultCache to get already parsed sweeps from, None to parse everything
+    :param stream_bytes: MPPT files bigger than this are streamed rather than loaded (see stream_mppt_file), None to
+    load them all whole
+    :return: Generator of (key, PixelData), in the order of the csv
+    """
+    load = load_tsv if cache is None else cache.load_tsv
+    stream = stream_mppt_file if cache is None else cache.stream_mppt_file
+
+    index = RunIndex(path)  # Only place the folder gets listed
+    db = read_run_csv(index.csv_files[0])  # Assuming only 1 csv
+    # Loops over each pixel, sweep through and mines the data:
+    index.match(db.keys())
+    index.report()
+    while db:
+        # Popped, so nothing here hangs on to a pixel once it's been handed over:
+        key = next(iter(db))
+        pixel = db.pop(key)
+        with profiled_context(pixel=key):
+            for sweep, filename in index.files[key].items():
+                if sweep == "mppt" and stream_bytes is not None and file_state(filename)[0] > stream_bytes:
+                    trace, summary = stream(filename, float(pixel.get_id()["area"]))
+                    pixel.set_mppt(trace)
+                    pixel.set_mppt_summary(summary)
+                else:
+                    pixel.set_sweep(sweep, load(filename))
+        yield key, pixel
+
+
+def create_db(path, cache=None, stream_bytes=MPPT_STREAM_BYTES):
+    """
+    Reads a whole run folder, see iter_db.
+    :return: {key: PixelData}, in the order of the csv
+    """
+    return dict(iter_db(path, cache, stream_bytes))
+
+
+# Columns of the results table analyze_db makes. The extra variables from the run csv sit between the ID columns
+# and the metrics, under their own names from the csv header.
+ID_COLUMNS = ("key", "sys_label", "user_label", "mux_index")
+# name: (long name, units) as they go onto the summary sheet, in order:
+METRIC_COLUMNS = {"voc_1": ("V_oc(1)", "V"),
+                  "jsc_1": ("J_sc(1)", "mA/cm^-2"),
+                  "pce_1": ("Max power point(1)", "mWcm^-2"),
+                  "ff_1": ("Fill Factor(1)", ""),
+                  "vmp_1": ("V_mp(1)", "V"),
+                  "jmp_1": ("I_mp(1)", "mA/cm^-2"),
+                  "voc_2": ("V_oc(2)", "V"),
+                  "jsc_2": ("J_sc(2)", "mA/cm^-2"),
+                  "pce_2": ("Max power point(2)", "mWcm^-2"),
+                  "ff_2": ("Fill Factor(2)", ""),
+                  "vmp_2": ("V_mp(2)", "V"),
+                  "jmp_2": ("I_mp(2)", "mA/cm^-2"),
+                  # stabalised values, these columns only go on the summary if they were measured:
+                  "voc_st": ("V (STABALISED)", "V"),
+                  "jsc_st": ("I (STABALISED)", "mA/cm^2"),
+                  "pce_st": ("Max power point (MPPT)", "mWcm^-2"),
+                  "vmp_st": ("V_mp (MPPT)", "V"),
+                  "jmp_st": ("I_mp (MPPT)", "mA/cm^2"),
+                  # from the whole MPPT trace, see MpptStream:
+                  "pce_peak_st": ("Peak power (MPPT)", "mWcm^-2"),
+                  "pce_final_st": ("Final rolling power (MPPT)", "mWcm^-2"),
+                  "t_steady_st": ("Time to steady state (MPPT)", "s"),
+                  "t95_st": ("T95 (MPPT)", "s"),
+                  "t80_st": ("T80 (MPPT)", "s"),
+                  "burn_in_st": ("Burn-in loss (MPPT)", "%")}
+# Single diode fits, 1 and 2 are the light sweeps, d1 and d2 the dark ones. Only on the summary if they were done:
+DIODE_COLUMNS = {f"{name}_{sweep}": (f"{lname}({sweep})", units if units is not None else
+                                     ("decades" if sweep.startswith("d") else "mA/cm^2"))
+                 for sweep in ("1", "2", "d1", "d2")
+                 for name, lname, units in (("rs", "R_s", "ohm cm^2"), ("rsh", "R_sh", "ohm cm^2"),
+                                            ("n", "Ideality", ""), ("j0", "J_0", "mA/cm^2"),
+                                            ("rmse", "Fit RMSE", None))}
+METRIC_COLUMNS.update(DIODE_COLUMNS)
+# Forward vs reverse light sweeps and the dark sweeps at fixed biases, see compare_sweeps. Also only on the summary if
+# there are any:
+COMPARE_COLUMNS = {"hi": ("Hysteresis index", ""),
+                   "pce_ratio": ("PCE forward/reverse", ""),
+                   "hi_area": ("Hysteresis index (area)", ""),
+                   **{f"{name}_{sweep}": (f"{lname}({sweep})", units) for sweep in ("d1", "d2")
+                      for name, lname, units in (("leak", f"Leakage at {LEAKAGE_BIAS:g} V", "mA/cm^2"),
+                                                 ("rect", f"Rectification {RECTIFICATION_BIAS:g}/{LEAKAGE_BIAS:g} V",
+                                                  ""))}}
+METRIC_COLUMNS.update(COMPARE_COLUMNS)
+
+
+def var_columns(results):
+    """Names of the extra variable columns in a results table"""
+    return [name for name in results if name not in ID_COLUMNS and name not in METRIC_COLUMNS]
+
+
+def pad_sweeps(sweeps):
+    """
+    Stacks a bunch of (x, y) curves of different lengths into two NaN padded 2D arrays, one row per curve, so they
+    can all be crunched at once. Points with a NaN in them are dropped, missing curves (None) become empty rows.
+    :param sweeps: List of (x, y) pairs of 1D arrays, or None
+    :return: X, Y arrays of shape (number of curves, longest curve)
+    """
+    cleaned = []
+    for sweep in sweeps:
+        if sweep is None:
+            cleaned.append((np.empty(0), np.empty(0)))
+            continue
+        x, y = np.asarray(sweep[0], dtype=np.float64), np.asarray(sweep[1], dtype=np.float64)
+        ok = np.isfinite(x) & np.isfinite(y)
+        cleaned.append((x[ok], y[ok]))
+    width = max([len(x) for x, _ in cleaned] + [2])  # At least one segment wide, even if every row is empty
+    X = np.full((len(cleaned), width), np.nan)
+    Y = np.full((len(cleaned), width), np.nan)
+    for row, (x, y) in enumerate(cleaned):
+        X[row, :len(x)] = x
+        Y[row, :len(y)] = y
+    return X, Y
+
+
+def sort_rows(X, Y):
+    """Sorts every row of padded X ascending (the NaN padding stays at the end), and Y along with it"""
+    order = np.argsort(X, axis=1, kind='stable')
+    return np.take_along_axis(X, order, axis=1), np.take_along_axis(Y, order, axis=1)
+
+
+def interp_rows(x_new, X, Y):
+    """
+    Linear interpolation of every row at the same point. Same answer as interp1d(x, y, bounds_error=False)(x_new)
+    used to give for each row: NaN outside the data (for really bad stuff, thanks Joel!) or with less than 2 points.
+    :param x_new: Where to evaluate
+    :param X: Padded x values, rows sorted ascending (see sort_rows)
+    :param Y: Padded y values
+    :return: 1D array, one value per row
+    """
+    rows = np.arange(X.shape[0])
+    n = np.sum(np.isfinite(X), axis=1)
+    hi = np.clip(np.sum(X < x_new, axis=1), 1, np.maximum(n - 1, 1))
+    lo = hi - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (Y[rows, hi] - Y[rows, lo]) / (X[rows, hi] - X[rows, lo])
+        y_new = Y[rows, lo] + slope * (x_new - X[rows, lo])
+    outside = (n < 2) | (x_new < X[:, 0]) | (x_new > X[rows, np.maximum(n - 1, 0)])
+    y_new[outside] = np.nan
+    return y_new
+
+
+def solve_light_iv(V, J):
+    """
+    Figures of merit of a whole batch of illuminated sweeps at once. The curve is treated as the straight lines
+    between the measured points, on each of those segments V*J is a parabola, so the max power point is exactly
+    either a measured point or the bottom of one of those parabolas. No grids, so no grid resolution to worry about.
+    :param V: Padded voltages, one sweep per row (see pad_sweeps)
+    :param J: Padded current densities (mA/cm^2), negative in the power quadrant
+    :return: voc, jsc, vmp, jmp, ff, pce, each a 1D array with one value per sweep, NaN where it couldn't be done
+    """
+    V, J = sort_rows(V, J)
+    voc = interp_rows(0, *sort_rows(J, V))
+    jsc = interp_rows(0, V, J)
+
+    # Candidates for the max power point: every measured point...
+    v_candidates = [V]
+    j_candidates = [J]
+    # ...and the turning point of V*J on each segment. With J = j0 + s(V - v0), d(VJ)/dV = 0 at V = (s*v0 - j0)/2s,
+    # which is a minimum (i.e. most power, power is negative here) only when s > 0:
+    v0, v1, j0, j1 = V[:, :-1], V[:, 1:], J[:, :-1], J[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (j1 - j0) / (v1 - v0)
+        v_turn = (slope * v0 - j0) / (2 * slope)
+        inside = (slope > 0) & (v_turn > v0) & (v_turn < v1)
+        v_candidates.append(np.where(inside, v_turn, np.nan))
+        j_candidates.append(np.where(inside, j0 + slope * (v_turn - v0), np.nan))
+    v_candidates = np.concatenate(v_candidates, axis=1)
+    j_candidates = np.concatenate(j_candidates, axis=1)
+
+    power = v_candidates * j_candidates
+    found = np.isfinite(power).any(axis=1)  # nothing usable, e.g. current compliance ate the whole sweep
+    best = np.argmin(np.where(np.isfinite(power), power, np.inf), axis=1)
+    rows = np.arange(V.shape[0])
+    vmp = np.where(found, v_candidates[rows, best], np.nan)
+    jmp = np.where(found, j_candidates[rows, best], np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ff = (vmp * jmp) / (voc * jsc)
+    return voc, jsc, vmp, jmp, ff, np.abs(vmp * jmp)
+
+
+def wright_omega(x):
+    """
+    W(e^x), the Lambert W function of an exponential, without ever working out e^x (which overflows for the diode
+    equation at any decent forward bias). A handful of Newton steps on w + ln(w) = x, for every element at once.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        w = np.where(x > 1, x - np.log(np.maximum(x, 1)), np.exp(np.minimum(x, 1)))
+        for _ in range(8):
+            w = np.maximum(w * (1 + x - np.log(w)) / (1 + w), 1e-300)
+    return w
+
+
+def diode_current(V, jph, j0, n, rs, rsh):
+    """
+    Single diode model, solved exactly with the Lambert W function rather than iterated.
+    :param V: Voltages, any shape that broadcasts against the parameters
+    :param jph: Photocurrent (A/cm^2), 0 in the dark
+    :param j0: Saturation current (A/cm^2)
+    :param n: Ideality factor
+    :param rs: Series resistance (ohm cm^2)
+    :param rsh: Shunt resistance (ohm cm^2)
+    :return: Current density (mA/cm^2), negative in the power quadrant like the measurements
+    """
+    nvt = n * THERMAL_VOLTAGE
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        x = np.log(rs * rsh * j0 / (nvt * (rs + rsh))) + rsh * (rs * (jph + j0) + V) / (nvt * (rs + rsh))
+        current = (rsh * (jph + j0) - V) / (rs + rsh) - nvt / rs * wright_omega(x)
+    return -1e3 * current
+
+
+def diode_seeds(voc, jsc, vmp, jmp, n=1.5, rsh=1e3):
+    """
+    Starting points for fitting light sweeps, from their figures of merit: the photocurrent is Jsc, J0 is whatever
+    puts the ideal diode's Voc in the right place, and Rs is what it takes to then get the max power point right.
+    :return: (curves, 5) array of jph, j0, n, rs, rsh (A/cm^2 and ohm cm^2), NaN where there's nothing to go on
+    """
+    jph, j_mp = -1e-3 * np.asarray(jsc), -1e-3 * np.asarray(jmp)
+    nvt = n * THERMAL_VOLTAGE
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        j0 = jph / np.expm1(voc / nvt)
+        rs = np.clip((nvt * np.log((jph - j_mp) / j0 + 1) - vmp) / j_mp, 1e-3, 100)
+    seeds = np.column_stack([jph, j0, np.full_like(jph, n), rs, np.full_like(jph, rsh)])
+    seeds[~(np.isfinite(seeds).all(axis=1) & (jph > 0) & (j0 > 0))] = np.nan
+    return seeds
+
+
+def fit_diode(V, J, seeds, dark=False, iterations=FIT_ITERATIONS):
+    """
+    Fits the single diode model to a whole batch of sweeps at once: every curve takes its own Levenberg-Marquardt
+    steps, but each step is worked out for all of them together (Jacobians by finite differences, then a stack of
+    little 5x5 solves). Light curves are fitted on the current itself, dark ones on its log (asinh, so it copes with
+    the sign change at 0 V) since they go over many decades.
+    :param V: Padded voltages, one sweep per row (see pad_sweeps)
+    :param J: Padded current densities (mA/cm^2)
+    :param seeds: (curves, 5) starting jph, j0, n, rs, rsh (see diode_seeds), rows with NaN aren't fitted
+    :param dark: Dark sweeps, jph is held at 0
+    :param iterations: Most Levenberg-Marquardt steps
+    :return: ((curves, 5) fitted parameters, (curves,) RMS residual, (curves,) True where the fit settled), NaN for
+    the ones that weren't fitted. A parameter that ended up stuck on one of its limits is NaN too, since all that
+    says is the curve doesn't pin it down (or the fit went somewhere daft). The residual is in mA/cm^2 for light
+    sweeps, decades of current for dark ones
+    """
+    # Fitted as jph, ln(j0), n, ln(rs), ln(rsh), which keeps everything positive that should be:
+    p = np.array(seeds, dtype=np.float64, ndmin=2, copy=True)
+    if dark:
+        p[:, 0] = 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p[:, [1, 3, 4]] = np.log(p[:, [1, 3, 4]])
+    free = [1, 2, 3, 4] if dark else [0, 1, 2, 3, 4]
+    lower = np.array([0, -80, 0.5, np.log(1e-4), 0])
+    upper = np.array([1, 0, 10, np.log(1e3), np.log(1e9)])
+    measured = np.isfinite(V) & np.isfinite(J)
+    fitted = np.isfinite(p).all(axis=1) & (measured.sum(axis=1) > len(free))
+    p[~fitted] = (lower + upper) / 2  # Anything sensible, they get dropped at the end
+    points = np.maximum(measured.sum(axis=1), 1)
+
+    def scale(current):
+        return np.arcsinh(current / 1e-5) / np.log(10) if dark else current
+
+    target = scale(np.where(measured, J, 0))
+
+    def residuals(params, rows):
+        model = diode_current(V[rows], params[:, [0]], np.exp(params[:, [1]]), params[:, [2]],
+                              np.exp(params[:, [3]]), np.exp(params[:, [4]]))
+        return np.where(measured[rows], scale(model) - target[rows], 0)
+
+    r = np.zeros(V.shape)
+    r[fitted] = residuals(p[fitted], fitted)
+    cost = np.sum(r**2, axis=1)
+    damping = np.full(len(p), 1e-2)
+    eye = np.eye(len(free))
+    active = fitted.copy()  # Curves drop out once they've settled, so the stragglers don't cost the rest anything
+    for _ in range(iterations):
+        rows = np.flatnonzero(active)
+        if not len(rows):
+            break
+        p_rows, r_rows = p[rows], r[rows]
+        jacobian = np.empty(r_rows.shape + (len(free),))
+        for column, index in enumerate(free):
+            step = 1e-6 * np.maximum(np.abs(p_rows[:, index]), 1)
+            stepped = p_rows.copy()
+            stepped[:, index] += step
+            jacobian[:, :, column] = (residuals(stepped, rows) - r_rows) / step[:, None]
+        jacobian = np.nan_to_num(jacobian, nan=0, posinf=0, neginf=0)
+        normal = np.einsum('rpi,rpj->rij', jacobian, jacobian)
+        gradient = np.einsum('rpi,rp->ri', jacobian, np.nan_to_num(r_rows))
+        damped = normal + damping[rows, None, None] * (normal * eye) + 1e-12 * eye
+        step = -np.linalg.solve(damped, gradient[:, :, None])[:, :, 0]
+        trial = p_rows.copy()
+        trial[:, free] = np.clip(p_rows[:, free] + step, lower[free], upper[free])
+        r_trial = residuals(trial, rows)
+        cost_trial = np.sum(r_trial**2, axis=1)
+        better = np.isfinite(cost_trial) & (cost_trial < cost[rows])
+        settled = np.where(better, cost[rows] - cost_trial <= 1e-6 * cost[rows], damping[rows] > 1e4)
+        improved = rows[better]
+        p[improved], r[improved], cost[improved] = trial[better], r_trial[better], cost_trial[better]
+        damping[rows] = np.clip(np.where(better, damping[rows] / 3, damping[rows] * 4), 1e-9, 1e9)
+        active[rows[settled]] = False
+
+    at_limit = np.zeros(p.shape, dtype=bool)
+    span = upper[free] - lower[free]
+    at_limit[:, free] = (p[:, free] - lower[free] < 1e-6 * span) | (upper[free] - p[:, free] < 1e-6 * span)
+    p[at_limit] = np.nan
+    p[:, [1, 3, 4]] = np.exp(p[:, [1, 3, 4]])
+    p[~fitted] = np.nan
+    rmse = np.where(fitted, np.sqrt(cost / points), np.nan)
+    return p, rmse, fitted & ~active
+
+
+def diode_fits(light, dark, metrics):
+    """
+    Fits every sweep of a batch of pixels. Light sweep 1 starts from its figures of merit, after that every fit
+    starts from the one before it (sweep 2 from sweep 1, dark 1 from light 1, dark 2 from dark 1). Any fit that
+    doesn't come good (didn't settle, a parameter stuck on a limit, or too big a residual) gets another go from the
+    generic guess, and whichever of the two is better is kept. Fits that still aren't good give NaN for everything
+    but the RMSE (see fit_diode for the parameters stuck on a limit).
+    :param light: {1: (V, J), 2: (V, J)} padded light sweeps, as from pad_sweeps
+    :param dark: Same for the dark sweeps
+    :param metrics: {metric: np.array} with the light figures of merit already in
+    :return: {column: np.array} for every column in DIODE_COLUMNS
+    """
+    fits = {}
+    fitted = {}
+    warm_from = {"2": "1", "d1": "1", "d2": "d1"}
+    for sweep, (V, J) in (("1", light[1]), ("2", light[2]), ("d1", dark[1]), ("d2", dark[2])):
+        is_dark = sweep.startswith("d")
+        max_rmse = FIT_MAX_RMSE_DARK if is_dark else FIT_MAX_RMSE
+        generic = np.tile([0, 1e-12, 1.5, 1.0, 1e4], (len(V), 1))
+        seeds = generic.copy()
+        if not is_dark:
+            # e.g. sweeps that stop short of Voc only get the generic guess, with the right photocurrent:
+            generic[:, 0] = seeds[:, 0] = -1e-3 * metrics[f"jsc_{sweep}"]
+            from_metrics = diode_seeds(metrics[f"voc_{sweep}"], metrics[f"jsc_{sweep}"],
+                                       metrics[f"vmp_{sweep}"], metrics[f"jmp_{sweep}"])
+            usable = np.isfinite(from_metrics).all(axis=1)
+            seeds[usable] = from_metrics[usable]
+        if sweep in warm_from:
+            previous = fitted[warm_from[sweep]]
+            warm = np.isfinite(previous).all(axis=1)
+            seeds[warm] = previous[warm]
+        with profiled("fit_diode", "analysis", sweep=sweep, pixels=len(V)):
+            params, rmse, settled = fit_diode(V, J, seeds, dark=is_dark)
+            good = settled & np.isfinite(params).all(axis=1) & (rmse <= max_rmse)
+            retry = np.flatnonzero(~good & np.isfinite(generic).all(axis=1) & (seeds != generic).any(axis=1))
+            if len(retry):
+                params_2, rmse_2, settled_2 = fit_diode(V[retry], J[retry], generic[retry], dark=is_dark)
+                good_2 = settled_2 & np.isfinite(params_2).all(axis=1) & (rmse_2 <= max_rmse)
+                # A good fit beats a bad one, otherwise the smaller residual wins:
+                better = (good_2 > good[retry]) | ((good_2 == good[retry]) & (rmse_2 < rmse[retry]))
+                take = retry[better]
+                params[take], rmse[take], settled[take] = params_2[better], rmse_2[better], settled_2[better]
+                good[take] = good_2[better]
+        params[~settled | ~(rmse <= max_rmse)] = np.nan
+        fitted[sweep] = np.where(good[:, None], params, np.nan)
+        for name, values in zip(("rs", "rsh", "n", "j0"), (params[:, 3], params[:, 4], params[:, 2], params[:, 1])):
+            fits[f"{name}_{sweep}"] = values * 1e3 if name == "j0" else values
+        fits[f"rmse_{sweep}"] = rmse
+    return fits
+
+
+def stabilised_params(pixel):
+    """
+    Stabilised values from the stability and MPPT files of one pixel.
+    :param pixel: PixelData instance
+    :return: {metric: value} for the *_st metrics, NaN for whatever wasn't measured
+    """
+    area = float(pixel.get_id()["area"])
+    metrics = dict.fromkeys([name for name in METRIC_COLUMNS if name.endswith("_st")], np.nan)
+    vt, it, mppt = pixel.get_vt(), pixel.get_it(), pixel.get_mppt()
+    if vt is not None and vt.shape[1]:
+        metrics["voc_st"] = float(vt[0][-1])  # Open circuit voltage, from stability file
+    if it is not None and it.shape[1]:
+        metrics["jsc_st"] = float(it[1][-1]) * (1e3/area)  # Short circuit current, from stability file
+    if pixel.get_mppt_summary() is not None:
+        metrics.update(pixel.get_mppt_summary()["metrics"])
+    elif mppt is not None and mppt.shape[1]:
+        metrics["jmp_st"] = float(np.mean(mppt[1][-5:])) * (1e3/area)
+        metrics["vmp_st"] = float(np.mean(mppt[0][-5:]))
+        metrics["pce_st"] = -1 * metrics["vmp_st"] * metrics["jmp_st"]
+        metrics.update(mppt_stability(mppt, area))
+    return metrics
+
+
+class MpptStream:
+    """
+    Stability numbers for an MPPT trace of any length, fed to it a chunk at a time. Nothing is kept per point: the
+    power is summed into fixed time bins, and when the trace outgrows max_bins, neighbouring bins get merged (so the
+    bins get twice as wide). Everything at the end is worked out from the bins, so it's as good as the bin width,
+    which is plenty for trends over minutes to days.
+    """
+
+    def __init__(self, area, window=STABILITY_WINDOW_SECONDS, max_bins=STABILITY_MAX_BINS,
+                 tolerance=STABILITY_TOLERANCE):
+        """
+        :param area: Pixel area (cm^2), the trace is in A
+        :param window: Rolling mean window (s)
+        :param max_bins: Most bins to keep, even number
+        :param tolerance: Fraction the rolling mean can wander and still count as steady
+        """
+        self.area = area
+        self.window = window
+        self.tolerance = tolerance
+        self.bin_width = window / 16  # Starts off finer than the window, gets coarser for long traces
+        self.sums = np.zeros(max_bins)
+        self.counts = np.zeros(max_bins)
+        self.start = None
+        self.points = 0
+
+    def update(self, chunk):
+        """
+        :param chunk: (4, n) array, rows in SWEEP_FIELDS order, the next bit of the trace
+        """
+        power = -chunk[0] * chunk[1] * (1e3/self.area)  # mW/cm^2
+        t = chunk[2]
+        keep = np.isfinite(power) & np.isfinite(t)
+        power, t = power[keep], t[keep]
+        if not len(t):
+            return
+        if self.start is None:
+            self.start = t[0]
+        elapsed = np.maximum(t - self.start, 0)
+        while elapsed.max() >= self.bin_width * len(self.sums):
+            self._merge()
+        bins = (elapsed // self.bin_width).astype(np.int64)
+        self.sums += np.bincount(bins, weights=power, minlength=len(self.sums))
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        self.points += len(t)
+
+    def _merge(self):
+        half = len(self.sums) // 2
+        for totals in (self.sums, self.counts):
+            totals[:half] = totals.reshape(half, 2).sum(axis=1)
+            totals[half:] = 0
+        self.bin_width *= 2
+
+    def rolling(self):
+        """
+        :return: (times since the start (s), rolling mean power (mW/cm^2)), one per bin, NaN before there's data
+        """
+        used = np.flatnonzero(self.counts)
+        n_bins = used[-1] + 1 if len(used) else 0
+        width = max(1, int(round(self.window / self.bin_width)))
+        sums = np.concatenate([[0], np.cumsum(self.sums[:n_bins])])
+        counts = np.concatenate([[0], np.cumsum(self.counts[:n_bins])])
+        lower = np.maximum(np.arange(1, n_bins + 1) - width, 0)
+        window_counts = counts[1:] - counts[lower]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (sums[1:] - sums[lower]) / window_counts
+        return (np.arange(n_bins) + 1) * self.bin_width, np.where(window_counts > 0, mean, np.nan)
+
+    def result(self):
+        """
+        :return: {metric: value} for the MpptStream metrics in METRIC_COLUMNS, NaN for whatever the trace was too
+        short (or too stable) to tell. Times are from the start of the trace, the burn-in loss is how far the steady
+        power sits below the peak, as a percentage of the peak
+        """
+        metrics = dict.fromkeys(["pce_peak_st", "pce_final_st", "t_steady_st", "t95_st", "t80_st", "burn_in_st"],
+                                np.nan)
+        times, mean = self.rolling()
+        if not np.isfinite(mean).any():
+            return metrics
+        peak = int(np.nanargmax(mean))
+        metrics["pce_peak_st"] = float(mean[peak])
+        metrics["pce_final_st"] = final = float(mean[-1])
+        for name, fraction in (("t95_st", 0.95), ("t80_st", 0.8)):
+            below = np.flatnonzero(mean[peak:] < fraction * mean[peak])
+            if len(below):
+                metrics[name] = float(times[peak + below[0]])
+        # Steady from the last time it was outside the tolerance:
+        wandering = np.flatnonzero(~(np.abs(mean - final) <= self.tolerance * abs(final)))
+        steady = wandering[-1] + 1 if len(wandering) else 0
+        metrics["t_steady_st"] = float(times[steady - 1]) if steady else 0.0
+        steady_power = self.sums[steady:len(mean)].sum() / self.counts[steady:len(mean)].sum()
+        if mean[peak] > 0:
+            metrics["burn_in_st"] = float(100 * (mean[peak] - steady_power) / mean[peak])
+        return metrics
+
+
+def mppt_stability(mppt, area, rows=CHUNK_ROWS):
+    """
+    MpptStream metrics of a trace that's already loaded (or memory mapped from an archive), fed through in chunks.
+    :param mppt: (4, n) MPPT array
+    :param area: Pixel area (cm^2)
+    :return: {metric: value}, see MpptStream.result
+    """
+    stream = MpptStream(area)
+    with profiled("mppt_stability", "analysis", rows=mppt.shape[1]):
+        for start in range(0, mppt.shape[1], rows):
+            stream.update(mppt[:, start:start + rows])
+    return stream.result()
+
+
+def stream_mppt_file(filename, area, rows=CHUNK_ROWS, target=None):
+    """
+    Everything A^4 wants from an MPPT file, read rows at a time so it's never all in memory: the MPPT numbers
+    stabilised_params would have worked out from the whole trace (the same ones, chunked the same way), and the
+    trace cut down for plotting. Each chunk is cut down to target points the same way plot_curves does it (see
+    downsample_indices), and whatever has piled up gets cut down again whenever it's twice that, so the highs and
+    lows survive all the way through.
+    :param filename: Path to the MPPT file
+    :param area: Pixel area (cm^2)
+    :param rows: Rows read at a time
+    :param target: Most points in the cut down trace, None for PLOT_MAX_POINTS (which can also be None: every point)
+    :return: ((4, <= target) float64 trace, rows in SWEEP_FIELDS order, {"metrics": {metric: value} for every MPPT
+    *_st metric, "points": how many points the whole trace has})
+    """
+    target = PLOT_MAX_POINTS if target is None else target
+    stream = MpptStream(area)
+    kept, kept_points, points = [], 0, 0
+    tail = np.empty((len(SWEEP_FIELDS), 0))
+
+    def cut_down(trace):
+        if target is None:
+            return trace
+        v, i = np.abs(trace[0]), np.abs(trace[1] * (1e3/area))
+        return trace[:, downsample_indices((v, i, v * i), target)]
+
+    with profiled("stream_mppt_file", "parse", file=os.path.basename(filename)) as info:
+        for chunk in iter_tsv_chunks(filename, rows):
+            stream.update(chunk)
+            points += chunk.shape[1]
+            tail = np.concatenate([tail, chunk[:, -5:]], axis=1)[:, -5:]
+            kept.append(cut_down(chunk))
+            kept_points += kept[-1].shape[1]
+            if target is not None and kept_points > 2 * target:
+                kept = [cut_down(np.concatenate(kept, axis=1))]
+                kept_points = kept[0].shape[1]
+        info.update(rows=points)
+    trace = cut_down(np.concatenate(kept, axis=1)) if kept else tail
+
+    metrics = {}
+    if points:
+        metrics["jmp_st"] = float(np.mean(tail[1])) * (1e3/area)
+        metrics["vmp_st"] = float(np.mean(tail[0]))
+        metrics["pce_st"] = -1 * metrics["vmp_st"] * metrics["jmp_st"]
+        metrics.update(stream.result())
+    return trace, {"metrics": metrics, "points": points}
+
+
+def resample_rows(grid, X, Y):
+    """
+    Linear interpolation of every row onto the same grid, all of them at once (interp_rows, for a whole grid). Each
+    row is shifted onto its own stretch of one long sorted line, so a single searchsorted finds every segment.
+    :param grid: Where to evaluate, ascending
+    :param X: Padded x values, rows sorted ascending (see sort_rows)
+    :param Y: Padded y values
+    :return: (rows, len(grid)) array, NaN outside each row's data and for rows with less than 2 points
+    """
+    rows, width = X.shape
+    n = np.sum(np.isfinite(X), axis=1)
+    low = min(np.nanmin(X), grid[0]) if n.any() else grid[0]
+    span = max(np.nanmax(X), grid[-1]) - low + 1 if n.any() else grid[-1] - low + 1
+    offsets = np.arange(rows)[:, None] * (span + 1)
+    line = (np.where(np.isfinite(X), X - low, span) + offsets).ravel()  # Padding goes to the end of its stretch
+    found = np.searchsorted(line, ((grid - low)[None, :] + offsets).ravel()).reshape(rows, len(grid))
+    hi = np.clip(found - np.arange(rows)[:, None] * width, 1, np.maximum(n - 1, 1)[:, None])
+    lo = hi - 1
+    x_lo, x_hi = np.take_along_axis(X, lo, axis=1), np.take_along_axis(X, hi, axis=1)
+    y_lo, y_hi = np.take_along_axis(Y, lo, axis=1), np.take_along_axis(Y, hi, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resampled = y_lo + (y_hi - y_lo) / (x_hi - x_lo) * (grid - x_lo)
+    last = X[np.arange(rows), np.maximum(n - 1, 0)]
+    resampled[(n[:, None] < 2) | (grid < X[:, :1]) | (grid > last[:, None])] = np.nan
+    return resampled
+
+
+def rising_rows(X):
+    """Whether each padded row (in the order it was measured) ends at a higher x than it started"""
+    n = np.sum(np.isfinite(X), axis=1)
+    return X[np.arange(X.shape[0]), np.maximum(n - 1, 0)] > X[:, 0]
+
+
+def compare_sweeps(light, dark, metrics):
+    """
+    Hysteresis and dark current numbers for a batch of pixels. Every sweep gets put on the same voltage grid (every
+    COMPARE_GRID_STEP, plus the biases), so comparing them is whole-array sums over pixels x voltages. The forward
+    light sweep is whichever one goes up in voltage, the reverse one the one coming down, and pixels without one of
+    each just get NaN for the hysteresis.
+    :param light: {1: (V, J), 2: (V, J)} padded light sweeps, as from pad_sweeps
+    :param dark: Same for the dark sweeps
+    :param metrics: {metric: np.array} with the light figures of merit already in
+    :return: {column: np.array} for every column in COMPARE_COLUMNS
+    """
+    sweeps = {"1": light[1], "2": light[2], "d1": dark[1], "d2": dark[2]}
+    biases = np.array([LEAKAGE_BIAS, RECTIFICATION_BIAS])
+    voltages = np.concatenate([V[np.isfinite(V)] for V, _ in sweeps.values()] + [biases])
+    step = COMPARE_GRID_STEP
+    grid = np.union1d(np.arange(np.floor(voltages.min() / step), np.ceil(voltages.max() / step) + 1) * step, biases)
+    on_grid = {sweep: resample_rows(grid, *sort_rows(V, J)) for sweep, (V, J) in sweeps.items()}
+
+    compared = {}
+    forward_1 = rising_rows(light[1][0])
+    paired = forward_1 != rising_rows(light[2][0])
+    pce_forward = np.where(forward_1, metrics["pce_1"], metrics["pce_2"])
+    pce_reverse = np.where(forward_1, metrics["pce_2"], metrics["pce_1"])
+    voc_reverse = np.where(forward_1, metrics["voc_2"], metrics["voc_1"])
+    j_forward = np.where(forward_1[:, None], on_grid["1"], on_grid["2"])
+    j_reverse = np.where(forward_1[:, None], on_grid["2"], on_grid["1"])
+    # Area between the two sweeps over the power quadrant of the reverse one, as a fraction of the area under it:
+    power_quadrant = (grid >= 0) & (grid <= voc_reverse[:, None])
+    widths = np.diff(grid)
+    inside = power_quadrant[:, 1:] & power_quadrant[:, :-1]  # Segments with both ends in it
+    def area(values):
+        segments = (values[:, 1:] + values[:, :-1]) * widths / 2
+        return np.sum(np.where(inside, segments, 0), axis=1)  # NaN inside (a sweep that stopped short) stays NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        compared["hi"] = np.where(paired, (pce_reverse - pce_forward) / pce_reverse, np.nan)
+        compared["pce_ratio"] = np.where(paired, pce_forward / pce_reverse, np.nan)
+        compared["hi_area"] = np.where(paired, area(np.abs(j_reverse - j_forward)) / area(np.abs(j_reverse)), np.nan)
+
+        leakage_at, rectification_at = np.searchsorted(grid, biases)
+        for sweep in ("d1", "d2"):
+            compared[f"leak_{sweep}"] = np.abs(on_grid[sweep][:, leakage_at])
+            compared[f"rect_{sweep}"] = np.abs(on_grid[sweep][:, rectification_at]) / compared[f"leak_{sweep}"]
+    return compared
+
+
+def analyze_pixels(pixels):
+    """
+    Works out all the summary numbers for a list of pixels, the light sweeps all in one go. Pure number crunching,
+    Origin is never touched.
+    :param pixels: List of PixelData instances, all with a first light sweep
+    :return: {metric: np.array} with every key in METRIC_COLUMNS, one value per pixel (NaN for the DIODE_COLUMNS
+    ones if FIT_DIODE is off)
+    """
+    metrics = {}
+    light, dark = {}, {}
+    for index in (1, 2):
+        sweeps, dark_sweeps = [], []
+        for pixel in pixels:
+            light_iv = pixel.get_light_iv()[index - 1]
+            dark_iv = pixel.get_dark_iv()[index - 1]
+            area = float(pixel.get_id()["area"])
+            dark_area = float(pixel.get_id()["dark_area"])
+            sweeps.append(None if light_iv is None else (light_iv[0], light_iv[1] * (1e3 / area)))
+            dark_sweeps.append(None if dark_iv is None else (dark_iv[0], dark_iv[1] * (1e3 / dark_area)))
+        light[index], dark[index] = pad_sweeps(sweeps), pad_sweeps(dark_sweeps)
+        with profiled("solve_light_iv", "analysis", sweep=index, pixels=len(pixels)):
+            params = solve_light_iv(*light[index])
+        for name, values in zip(("voc", "jsc", "vmp", "jmp", "ff", "pce"), params):
+            metrics[f"{name}_{index}"] = values
+    if pixels:
+        with profiled("compare_sweeps", "analysis", pixels=len(pixels)):
+            metrics.update(compare_sweeps(light, dark, metrics))
+    if FIT_DIODE and pixels:
+        metrics.update(diode_fits(light, dark, metrics))
+
+    with profiled("stabilised_params", "analysis", pixels=len(pixels)):
+        stabilised = [stabilised_params(pixel) for pixel in pixels]
+    for name in stabilised[0] if stabilised else ():
+        metrics[name] = np.array([row[name] for row in stabilised], dtype=np.float64)
+    return {name: metrics.get(name, np.full(len(pixels), np.nan)) for name in METRIC_COLUMNS}
+
+
+def analyze_pixel(pixel):
+    """
+    Works out all the summary numbers for one pixel.
+    :param pixel: PixelData instance
+    :return: {metric: value} with every key in METRIC_COLUMNS, None if there's no first light sweep to analyse
+    """
+    if pixel.get_light_iv()[0] is None:
+        return None
+    return {name: float(values[0]) for name, values in analyze_pixels([pixel]).items()}
+
+
+def analyze_db(db):
+    """
+    Headless analysis stage: crunches every pixel in a create_db database without going anywhere near Origin, so
+    it'll happily run on a machine without it.
+    :param db: Output of create_db
+    :return: Columnar results table, {column: np.array}, one entry per pixel that had a light sweep. ID_COLUMNS
+    first, then the extra variables from the csv, then METRIC_COLUMNS as float arrays (NaN where not measured)
+    """
+    keys = []
+    for key, pixel in db.items():
+        if pixel.get_light_iv()[0] is None:
+            print(f"Didn't find {key}, moving on...")
+            continue
+        keys.append(key)
+    pixels = [db[key] for key in keys]
+    return results_table(keys, pixels, analyze_pixels(pixels))
+
+
+def iter_results(path, cache=None, batch=ANALYSIS_BATCH, batch_bytes=ANALYSIS_BATCH_BYTES):
+    """
+    Reads and analyses a run folder a few pixels at a time, so only about a batch of pixels' raw data is ever in
+    memory however big the folder is (and never more than one pixel, for pixels bigger than batch_bytes). Whoever
+    uses this decides what to keep, see collect_results.
+    :param path: Run folder
+    :param cache: See iter_db
+    :param batch: Most pixels analysed together (see analyze_pixels), 1 for the least memory
+    :param batch_bytes: Start on a batch as soon as its raw data is at least this big
+    :return: Generator of (key, PixelData, {metric: value}), in the order of the csv. The metrics are None for
+    pixels without a light sweep, which don't go in the results table
+    """
+    group = []
+    group_bytes = 0
+    pixels = iter_db(path, cache)
+    while True:
+        item = next(pixels, None)
+        if item is not None:
+            group.append(item)
+            group_bytes += sum(item[1].get_sweep(sweep).nbytes for sweep in SWEEP_TYPES
+                               if item[1].get_sweep(sweep) is not None)
+            if len(group) < batch and group_bytes < batch_bytes:
+                continue
+        lit = [pixel for _, pixel in group if pixel.get_light_iv()[0] is not None]
+        metrics = analyze_pixels(lit)
+        row = 0
+        for key, pixel in group:
+            if pixel.get_light_iv()[0] is None:
+                print(f"Didn't find {key}, moving on...")
+                yield key, pixel, None
+                continue
+            yield key, pixel, {name: float(values[row]) for name, values in metrics.items()}
+            row += 1
+        group = []
+        group_bytes = 0
+        if item is None:
+            return
+
+
+def collect_results(rows, release=True):
+    """
+    Builds the results table from iter_results, keeping just the numbers.
+    :param rows: (key, PixelData, metrics) as from iter_results
+    :param release: Drop each pixel's sweeps once it's been counted
+    :return: Columnar results table, same as analyze_db
+    """
+    keys, pixels, metrics = [], [], {name: [] for name in METRIC_COLUMNS}
+    for key, pixel, values in rows:
+        if values is not None:
+            keys.append(key)
+            pixels.append(pixel)
+            for name in METRIC_COLUMNS:
+                metrics[name].append(values[name])
+        if release:
+            pixel.release()
+    return results_table(keys, pixels, metrics)
+
+
+def results_table(keys, pixels, metrics):
+    """
+    Puts the IDs and extra variables of some pixels next to their metrics, in the layout analyze_db returns.
+    :param keys: Pixel keys
+    :param pixels: PixelData for each key
+    :param metrics: {metric: np.array} for every metric in METRIC_COLUMNS, in the same order as keys
+    :return: Columnar results table
+    """
+    results = {"key": np.array(keys, dtype=object)}
+    for name in ID_COLUMNS[1:]:
+        results[name] = np.array([pixel.get_id()[name] for pixel in pixels], dtype=object)
+    var_names = list(pixels[0].get_var().keys()) if pixels else []
+    for name in var_names:
+        results[name] = np.array([pixel.get_var().get(name) for pixel in pixels], dtype=object)
+    for name in METRIC_COLUMNS:
+        results[name] = np.asarray(metrics[name], dtype=np.float64)
+    return results
+
+
+def downsample_indices(columns, target):
+    """
+    Picks which points of a long trace to plot: the trace is cut into equal buckets, and the smallest and biggest
+    point of every column in each bucket is kept (plus the very first and last), so spikes and drops survive that
+    plain decimation would skip over. Done on all the buckets at once.
+    :param columns: Equal length 1D arrays that share the points (e.g. V, J and P of an MPPT trace)
+    :param target: Roughly how many points to keep at most, None for all of them
+    :return: Sorted indices to keep
+    """
+    columns = np.atleast_2d(np.asarray(columns, dtype=np.float64))
+    n_points = columns.shape[1]
+    per_bucket = 2 * len(columns)
+    if target is None or n_points <= max(target, per_bucket + 2):
+        return np.arange(n_points)
+    n_buckets = max(1, (target - 2) // per_bucket)
+    size = -(-(n_points - 2) // n_buckets)
+    inner = np.full((len(columns), n_buckets * size), np.nan)
+    inner[:, :n_points - 2] = columns[:, 1:-1]
+    inner = inner.reshape(len(columns), n_buckets, size)
+    nans = np.isnan(inner)
+    lows = np.argmin(np.where(nans, np.inf, inner), axis=2)
+    highs = np.argmax(np.where(nans, -np.inf, inner), axis=2)
+    starts = np.arange(n_buckets) * size + 1
+    picked = np.concatenate([[0, n_points - 1], (starts + lows).ravel(), (starts + highs).ravel()])
+    return np.unique(np.minimum(picked, n_points - 1))
+
+
+def write_sheet(wks, columns):
+    """
+    Fills a worksheet in a handful of calls to Origin rather than a couple per column: the sheet is sized once, the
+    data goes across in one go (with pandas, otherwise one from_list per column), then one call each for the long
+    names, units, comments and designations.
+    :param wks: Worksheet from op.new_sheet
+    :param columns: List of (data, long name, units, comments, designation ('X', 'Y' or 'Z')), in column order.
+    Columns can be different lengths
+    """
+    wks.cols = len(columns)
+    if pd is not None:
+        wks.from_df(pd.DataFrame({index: pd.Series(np.asarray(column[0]))
+                                  for index, column in enumerate(columns)}))
+    else:
+        for index, column in enumerate(columns):
+            wks.from_list(index, column[0])
+    wks.set_labels([column[1] for column in columns], 'L')
+    wks.set_labels([column[2] for column in columns], 'U')
+    wks.set_labels([column[3] for column in columns], 'C')
+    wks.cols_axis("".join(column[4] for column in columns).lower(), repeat=False)
+
+
+def has_mppt(pixel):
+    """Whether a pixel has any MPPT points to plot, an empty (header only) file or streamed tail counts as none"""
+    mppt = pixel.get_mppt()
+    return mppt is not None and mppt.shape[1] > 0
+
+
+def plot_curves(pixel):
+    """
+    A pixel's curves the way they get plotted: current densities in mA/cm^2, MPPT time counted from the start, and
+    anything longer than PLOT_MAX_POINTS cut down (see downsample_indices).
+    :param pixel: PixelData instance
+    :return: {"jv": [(sweep, V, J, comment)] for liv1, liv2, div1, div2 (the ones there are, in that order),
+    "mppt": (t, V, J, P, comment on t) or None if there's no MPPT}
+    """
+    area = float(pixel.get_id()["area"])
+    dark_area = float(pixel.get_id()["dark_area"])
+    jv = []
+    for sweep, scale, comment in (("liv1", 1e3 / area, "Illuminated, 1"),
+                                  ("liv2", 1e3 / area, "Illuminated, 2"),
+                                  ("div1", 1e3 / dark_area, "Dark, 1"),
+                                  ("div2", 1e3 / dark_area, "Dark, 2")):
+        data = pixel.get_sweep(sweep)
+        if data is not None:
+            keep = downsample_indices(data[:2], PLOT_MAX_POINTS)
+            jv.append((sweep, data[0][keep], data[1][keep] * scale, comment))
+
+    # Max power data (By request of mike)
+    if not has_mppt(pixel):
+        return {"jv": jv, "mppt": None}
+    i_mppt = np.abs(pixel.get_mppt()[1] * (1e3/area))
+    v_mppt = np.abs(pixel.get_mppt()[0])
+    p_mppt = v_mppt * i_mppt
+    t_mppt = pixel.get_mppt()[2]
+    t_mppt_scaled = t_mppt - t_mppt[0]
+    keep = downsample_indices((v_mppt, i_mppt, p_mppt), PLOT_MAX_POINTS)
+    # A streamed trace has already been cut down, it just needs saying how far:
+    points = len(t_mppt) if pixel.get_mppt_summary() is None else pixel.get_mppt_summary()["points"]
+    time_comment = ''
+    if len(keep) < points:
+        time_comment = f"{len(keep)} of {points} points"
+        t_mppt_scaled, v_mppt, i_mppt, p_mppt = (column[keep] for column in (t_mppt_scaled, v_mppt, i_mppt, p_mppt))
+    return {"jv": jv, "mppt": (t_mppt_scaled, v_mppt, i_mppt, p_mppt, time_comment)}
+
+
+def origin_data_sheets(key, pixel):
+    """
+    Makes the folder for a pixel under FULL_IV_CURVES and puts its curves in there.
+    :param key: Pixel key
+    :param pixel: PixelData instance
+    :return: (JV worksheet, MPPT worksheet or None if there's no MPPT)
+    """
+    # move into the full iv curve dir, create new dir per pixel:
+    op.lt_exec('pe_cd /; pe_cd "FULL_IV_CURVES"; pe_mkdir "' + key + '"; pe_cd "' + key + '"')
+
+    # Create worksheet:
+    wks = op.new_sheet(lname="DATA for " + key)  # Long name is linked to key
+    curves = plot_curves(pixel)
+
+    # Push the curves into the cols on sheet, labels and type as appropriate:
+    columns = []
+    for _, voltage, current, comment in curves["jv"]:
+        columns.append((voltage, 'Voltage', 'V', '', 'X'))
+        columns.append((current, 'Current', 'mA/cm^2', comment, 'Y'))
+    write_sheet(wks, columns)
+
+    if curves["mppt"] is None:
+        return wks, None
+    t_mppt_scaled, v_mppt, i_mppt, p_mppt, time_comment = curves["mppt"]
+    wks_mpp = op.new_sheet(lname="MPPT DATA for " + key)  # Long name is linked to key
+    write_sheet(wks_mpp, [(t_mppt_scaled, 'Time', 's', time_comment, 'X'),
+                          (v_mppt, 'Voltage', 'V', '', 'Y'),
+                          (i_mppt, 'Current', 'mA/cm^2', '', 'Y'),
+                          (p_mppt, 'Power Density', 'mW/cm^2', '', 'Y')])
+    return wks, wks_mpp
+
+
+def origin_graphs(key, wks, wks_mpp):
+    """
+    Draws the JV graph (and MPPT graph, if there's MPPT data) of a pixel from its data sheets.
+    :param key: Pixel key
+    :param wks: JV worksheet from origin_data_sheets
+    :param wks_mpp: MPPT worksheet from origin_data_sheets, or None
+    :return: (JV graph hyperlink, MPPT graph hyperlink or None)
+    """
+    # Create graph to plot into:
+    #graph = op.new_graph(lname="IV: " + key, template=op.path('u') + 'a4_template.otpu')
+    # !!! a custom template is used in line above, change it to "line" if this is missing!!!
+    graph = op.new_graph(lname="JV: " + key, template='a4_template.otpu')
+
+    # First 2 (solid line) plots on base layer:
+    plot1 = graph[0].add_plot(wks, coly="F", colx="E", type='line')
+    plot2 = graph[0].add_plot(wks, coly="B", colx="A", type='line')
+    # Rescales axis, sets linewidth up, sets up autocolour:        
+    op.lt_exec("Rescale; set %C -w 2000; layer -g; layer.X.showAxes=3; layer.Y.showAxes=3;")
     
-                
-                
-                
-                
-                
-    for key in db.keys():
-        files_in_class = find_starts_with(key, path)
-        for filename in files_in_class:
-
-            # They have same rows/cols, so every file will fill these lists:
-            I, V, t, stat = [[], [], [], []]
-            with open(filename, 'r') as file:
-                reader = csv.reader(file, delimiter='\t')
-                skip = True
-                for row in reader:
-                    if skip:
-                        skip = False
-                        continue
-                    V.append(float(row[0]))
-                    I.append(float(row[1]))
-                    t.append(float(row[2]))
-                    stat.append(float(row[3]))
+    layer2 = graph.add_layer(type="noxy")  # new layer, noax allows us to use the same axis as before
+    plot3 = graph[1].add_plot(wks, coly="H", colx="G", type='line')
+    plot4 = graph[1].add_plot(wks, coly="D", colx="C", type='line')
+    # Rescales axis, sets linewidth up, Changes linestyle to dash, sets up autocolour:
+    op.lt_exec("Rescale; set %C -w 2000; layer -g; set %C -d 1")
+    
+    #op.wait()  # wait until operation is done
+    #op.wait('s', 0.05)  # wait further for graph to update
+
+    graph_num = op.graph_list()[0].get_str("name")
+    graph_str = "graph://" + graph_num + " - " + "IV: " + key  # creates hyperlink
+    if wks_mpp is None:
+        return graph_str, None
+
+    # Add data plots onto the graph
+    mppt_graph = op.new_graph(lname="MPPT: " + key,template='a4_MPPT') 
+    
+    # Loop over layers and worksheets to add individual curve.
+    mpptlayer1 = mppt_graph[0]
+    plotmppt1 = mpptlayer1.add_plot(wks_mpp, coly='B', colx="A", type='y')
+    mpptlayer1.rescale()
+    
+    mpptlayer2 = mppt_graph[1]
+    plotmppt2 = mpptlayer2.add_plot(wks_mpp, coly='C', colx="A",type='y')
+    mpptlayer2.rescale()
+    
+    mpptlayer3 = mppt_graph[2]
+    plotmppt3 = mpptlayer3.add_plot(wks_mpp, coly="D", colx="A",type='y')
+    mpptlayer3.rescale()
+    
+    mppt_graph_num = op.graph_list()[1].get_str("name")
+    return graph_str, "graph://" + mppt_graph_num + " - " + "MPPT: " + key
 
-            # Add it to the appropriate member var:
-            if filename.endswith(".div1.tsv"):
-                db[key].set_dark_iv(I, V, t, stat, 1)
 
-            elif filename.endswith(".div2.tsv"):
-                db[key].set_dark_iv(I, V, t, stat, 2)
+# Pixels whose graphs haven't been drawn yet in lazy mode, key: everything render_pixel needs to do it
+PENDING_GRAPHS = {}  # {number in the LAZY_LINK: everything render_pixel needs}, for every pixel left for later
+_pending_numbers = count(1)  # Never reused, so runs plotted one after the other (maybe with the same keys) don't mix
 
-            elif filename.endswith(".liv1.tsv"):
-                db[key].set_light_iv(I, V, t, stat, 1)
 
-            elif filename.endswith(".liv2.tsv"):
-                db[key].set_light_iv(I, V, t, stat, 2)
+def render_pixel(number):
+    """
+    Draws the graphs of a pixel left out by origin_create_plots in lazy mode, swaps its summary cells over to the
+    real hyperlinks and brings the JV graph up. This is what the LAZY_LINK cells call, so it only does anything the
+    first time.
+    :param number: The pixel's number in PENDING_GRAPHS
+    """
+    if number not in PENDING_GRAPHS:
+        return
+    pending = PENDING_GRAPHS.pop(number)
+    key = pending["key"]
+    if pending["sheets"] is None:
+        wks, wks_mpp = origin_data_sheets(key, pending["pixel"])
+    else:
+        # The graphs go in the pixel's folder with its sheets, not wherever the project happens to be looking:
+        op.lt_exec('pe_cd /; pe_cd "FULL_IV_CURVES"; pe_cd "' + key + '"')
+        wks, wks_mpp = pending["sheets"]
+    graph_str, mppt_graph_str = origin_graphs(key, wks, wks_mpp)
+    pending["summary"].from_list(pending["iv_col"], [graph_str], start=pending["row"])
+    if mppt_graph_str is not None and pending["mppt_col"] is not None:
+        pending["summary"].from_list(pending["mppt_col"], [mppt_graph_str], start=pending["row"])
+    op.lt_exec(f'win -a {graph_str[len("graph://"):].split(" - ")[0]};')
 
-            elif filename.endswith(".it.tsv"):
-                db[key].set_it(I, V, t, stat)
 
-            elif filename.endswith(".vt.tsv"):
-                db[key].set_vt(I, V, t, stat)
+def render_pending():
+    """Draws every graph still left to draw in lazy mode"""
+    for number in list(PENDING_GRAPHS):
+        render_pixel(number)
+
+
+def summary_columns(results):
+    """
+    Columns of the summary for a results table (see analyze_db), everything but the links to the graphs.
+    :return: List of (values, long name, units, comment, designation), same as write_sheet takes
+    """
+    # Info cols:
+    columns = [(results["sys_label"], 'Cell', '', '', 'X'),
+               (results["user_label"], 'Name', '', '', 'X'),
+               (results["mux_index"], 'Device number', '', '', 'X')]
+    for single_var in var_columns(results):
+        columns.append((results[single_var], single_var, '', '', 'X'))
+
+    # Data cols, the stabalised ones only if they were measured at all:
+    for name, (lname, units) in METRIC_COLUMNS.items():
+        if (name.endswith("_st") or name in DIODE_COLUMNS or name in COMPARE_COLUMNS) \
+                and not np.isfinite(results[name]).any():
+            continue
+        columns.append((results[name], lname, units, '', 'Y'))
+    return columns
+
+
+class RenderBackend:
+    """
+    What origin_create_plots draws with, so the same plots can go somewhere other than Origin. A backend can do any
+    number of runs, each one goes begin(), then draw() (or defer()) for every pixel in the order of the summary, then
+    summary(). close() once it's done with altogether.
+    """
+    lazy = False  # Whether defer() can really leave a pixel to be drawn later
+
+    def begin(self, name):
+        """Starts on a run, name is what it's called (usually its folder)"""
+
+    def draw(self, key, pixel):
+        """
+        Draws one pixel's JV graph, and MPPT graph if it has MPPT.
+        :return: (link to the JV graph, link to the MPPT graph or None), these go in the summary
+        """
+        raise NotImplementedError
+
+    def defer(self, key, pixel, data_sheets=True):
+        """draw, but the drawing can be left until someone wants it. Backends that can't do that just draw now"""
+        return self.draw(key, pixel)
+
+    def summary(self, results, graph_strs, mppt_graph_strs):
+        """Makes the summary of the run: the results table (see analyze_db), with the links from draw for every row"""
+        raise NotImplementedError
+
+    def close(self):
+        """Finishes off after the last run"""
 
-            elif filename.endswith(".mppt.tsv"):
-                db[key].set_mppt(I, V, t, stat)
-            # Maybe an else is safe?
-    return db
 
+class OriginBackend(RenderBackend):
+    """
+    Draws into the open Origin project: each pixel's data sheets and graphs under FULL_IV_CURVES (see
+    origin_data_sheets, origin_graphs), and the DATA SUMMARY sheet with hyperlinks to them under SUMMARY. Pixels left
+    for later are drawn when their cell gets clicked, see render_pixel.
+    """
+    lazy = True
+
+    def begin(self, name):
+        # Creates the folders needed:
+        op.lt_exec('pe_cd /; pe_mkdir "SUMMARY"; pe_cd /;pe_mkdir "FULL_IV_CURVES";')
+        self.rows = 0
+        self.pending = {}  # number: everything render_pixel needs, for the ones left for later
+
+    def draw(self, key, pixel):
+        self.rows += 1
+        links = origin_graphs(key, *origin_data_sheets(key, pixel))
+        op.wait()
+        return links
+
+    def defer(self, key, pixel, data_sheets=True):
+        sheets = origin_data_sheets(key, pixel) if data_sheets else None
+        number = next(_pending_numbers)
+        self.pending[number] = {"key": key, "pixel": pixel, "sheets": sheets, "row": self.rows}
+        self.rows += 1
+        link = LAZY_LINK.format(number=number)
+        return link, link if has_mppt(pixel) else None
+
+    def summary(self, results, graph_strs, mppt_graph_strs):
+        op.lt_exec('pe_cd /; pe_cd "SUMMARY";')  # moves to summary dir
+        wks_sum = op.new_sheet(lname="DATA SUMMARY ")  # Creates sheet for summary
+
+        columns = summary_columns(results)
+        # Hyperlinks to graphs:
+        iv_col, mppt_col = len(columns), None
+        columns.append((graph_strs, 'IV curve', '', 'CLICK the cell', 'Z'))
+        if any(mppt_graph_strs):
+            mppt_col = len(columns)
+            columns.append((mppt_graph_strs, 'MPPT', '', 'CLICK the cell', 'Z'))
+        write_sheet(wks_sum, columns)
+        # All the rows in one go, rather than a trip to Origin per row:
+        op.lt_exec("".join(f"wrowheight [{i+1}] (3);" for i in range(len(graph_strs))))
+
+        for number, left in self.pending.items():
+            left.update(summary=wks_sum, iv_col=iv_col, mppt_col=mppt_col)
+            PENDING_GRAPHS[number] = left
+        if self.pending:
+            print(f"Drew {len(graph_strs) - len(self.pending)} pixels, "
+                  f"the other {len(self.pending)} get drawn when you click on them")
+
+
+RENDER_FORMATS = ("png", "svg")
+
+
+def _render_figures(stem, key, curves, fmt):
+    """
+    Draws one pixel's graphs with matplotlib for MatplotlibBackend. Lives at the top level so the pool can run it.
+    :param stem: Path the files go to, minus the "_JV.png" / "_MPPT.png" bit
+    :param key: Pixel key, for the titles
+    :param curves: From plot_curves
+    :param fmt: One of RENDER_FORMATS
+    """
+    from matplotlib.figure import Figure  # Not pyplot, so nothing needs a screen (it's the Agg canvas)
+
+    # Same as a4_template: sweep 1 solid on the first layer, sweep 2 dashed on a second one sharing its axes, and
+    # the colours going round separately in each (black then red, Origin's first two):
+    figure = Figure(figsize=(6.4, 4.8))
+    axes = figure.add_subplot()
+    for sweep, voltage, current, comment in sorted(curves["jv"], key=lambda curve: (curve[0][-1], curve[0][0])):
+        axes.plot(voltage, current, color="black" if sweep.startswith("d") else "red",
+                  linestyle="-" if sweep.endswith("1") else "--", linewidth=2, label=comment)
+    axes.set_title(f"JV: {key}")
+    axes.set_xlabel("Voltage (V)")
+    axes.set_ylabel("Current density (mA/cm$^2$)")
+    axes.tick_params(top=True, right=True, direction="in")
+    if curves["jv"]:
+        axes.legend(frameon=False)
+    figure.savefig(f"{stem}_JV.{fmt}")
+
+    if curves["mppt"] is None:
+        return
+    # Same as a4_MPPT, voltage, current density and power density over time on three layers:
+    t_mppt, *traces, _ = curves["mppt"]
+    figure = Figure(figsize=(6.4, 7.2))
+    layers = figure.subplots(3, 1, sharex=True)
+    for axes, trace, label, colour in zip(layers, traces,
+                                          ("Voltage (V)", "Current density (mA/cm$^2$)", "Power density (mW/cm$^2$)"),
+                                          ("black", "red", "blue")):
+        axes.plot(t_mppt, trace, color=colour, marker=".", markersize=3, linewidth=1)
+        axes.set_ylabel(label)
+        axes.tick_params(top=True, right=True, direction="in")
+    layers[0].set_title(f"MPPT: {key}")
+    layers[-1].set_xlabel("Time (s)")
+    figure.savefig(f"{stem}_MPPT.{fmt}")
+
+
+class MatplotlibBackend(RenderBackend):
+    """
+    Draws the same graphs as the Origin templates with matplotlib into image files, so plots can be made without
+    Origin (or Windows, or a screen) and put up on a web page. Every run gets a folder of graphs and a summary.html
+    (the summary table, with links to the graphs), and out_dir gets an index.html linking to all of them.
+
+    Each pixel is one task for a pool of processes, so the graphs of a run draw in parallel while the rest of it is
+    still coming in. summary() waits for them to be done.
+    """
 
-def origin_create_plots(db):
+    def __init__(self, out_dir, fmt="png", workers=WORKERS):
+        """
+        :param out_dir: Where everything goes, made if it doesn't exist
+        :param fmt: One of RENDER_FORMATS
+        :param workers: Processes to draw with, None means one per CPU, 1 draws here without a pool
+        """
+        try:
+            import matplotlib
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("Drawing without Origin needs matplotlib (pip install matplotlib)") from None
+        if fmt not in RENDER_FORMATS:
+            raise ValueError(f"Can't draw {fmt} graphs, only {', '.join(RENDER_FORMATS)}")
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.workers = workers
+        self.runs = []  # (name, summary.html relative to out_dir, pixels)
+        self.__pool = None
+        self.__tasks = []  # (arguments of _render_figures, future or None) for the run being drawn
+        self.__name = self.__folder = None
+
+    def _pool(self):
+        """The pool, started the first time it's needed. None if drawing here instead"""
+        if self.__pool is None and self.workers != 1:
+            executable = _pool_executable()
+            if executable is None:
+                self.workers = 1
+                return None
+            multiprocessing.set_executable(executable)
+            self.__pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.__pool
+
+    def begin(self, name):
+        folder = re.sub(r"[^\w.-]+", "_", os.path.basename(os.path.normpath(name))) or "run"
+        taken = {os.path.dirname(page) for _, page, _ in self.runs}
+        self.__folder, number = folder, 1
+        while self.__folder in taken:  # Runs from different places can have the same name
+            number += 1
+            self.__folder = f"{folder}_{number}"
+        self.__name = name
+        self.__tasks = []
+        os.makedirs(os.path.join(self.out_dir, self.__folder), exist_ok=True)
+
+    def draw(self, key, pixel):
+        curves = plot_curves(pixel)
+        stem = re.sub(r"[^\w.-]+", "_", key)
+        arguments = (os.path.join(self.out_dir, self.__folder, stem), key, curves, self.fmt)
+        future = None
+        try:
+            if self._pool() is not None:
+                future = self.__pool.submit(_render_figures, *arguments)
+        except (BrokenProcessPool, OSError, RuntimeError) as err:
+            print(f"Couldn't draw in parallel ({err}), drawing here instead...")
+            self.workers, self.__pool = 1, None
+        if future is None:
+            _render_figures(*arguments)
+        self.__tasks.append((arguments, future))
+        return f"{stem}_JV.{self.fmt}", None if curves["mppt"] is None else f"{stem}_MPPT.{self.fmt}"
+
+    def summary(self, results, graph_strs, mppt_graph_strs):
+        for arguments, future in self.__tasks:
+            if future is None:
+                continue
+            try:
+                future.result()
+            except (BrokenProcessPool, OSError) as err:
+                print(f"Drawing {arguments[1]} in parallel went wrong ({err}), drawing it here instead...")
+                _render_figures(*arguments)
+        self.__tasks = []
+
+        columns = summary_columns(results)
+        header = "".join(f"<th>{html.escape(lname)}{f' ({html.escape(units)})' if units else ''}</th>"
+                         for _, lname, units, _, _ in columns)
+        rows = []
+        for row in range(len(graph_strs)):
+            cells = []
+            for values, _, _, _, designation in columns:
+                value = values[row]
+                if designation == 'Y':
+                    value = "" if not np.isfinite(value) else f"{value:.4g}"
+                cells.append(f"<td>{html.escape(str(value))}</td>")
+            for link, text in ((graph_strs[row], "JV"), (mppt_graph_strs[row], "MPPT")):
+                cells.append(f'<td><a href="{html.escape(link)}">{text}</a></td>' if link else "<td></td>")
+            rows.append(f"<tr>{''.join(cells)}</tr>")
+        page = os.path.join(self.__folder, "summary.html")
+        _write_html(os.path.join(self.out_dir, page), self.__name,
+                    f"<table>\n<tr>{header}<th>IV curve</th><th>MPPT</th></tr>\n" + "\n".join(rows) + "\n</table>")
+        self.runs.append((self.__name, page, len(graph_strs)))
+        self._write_index()
+
+    def _write_index(self):
+        items = "\n".join(f'<li><a href="{html.escape(page.replace(os.sep, "/"))}">{html.escape(name)}</a> '
+                          f'({pixels} pixels)</li>' for name, page, pixels in self.runs)
+        _write_html(os.path.join(self.out_dir, "index.html"), "A^4 runs", f"<ul>\n{items}\n</ul>")
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+        print(f"Graphs of {len(self.runs)} runs in {os.path.join(self.out_dir, 'index.html')}")
+
+
+def _write_html(path, title, body):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>{html.escape(title)}</title>\n"
+                   "<style>body{font-family:sans-serif} table{border-collapse:collapse} "
+                   "th,td{border:1px solid #ccc;padding:2px 6px;text-align:right}</style>\n</head>\n<body>\n"
+                   f"<h1>{html.escape(title)}</h1>\n{body}\n</body>\n</html>\n")
+
+
+def origin_create_plots(db, results=None, lazy=LAZY_GRAPHS, top=RENDER_TOP, data_sheets=True, pixels=None,
+                        release=False, backend=None, name=""):
+    """
+    Draws everything, in Origin unless given another backend. All the numbers come from the analyze_db results
+    table, this just plots them.
+    :param db: Output of create_db, for the curves
+    :param results: Output of analyze_db for the same db, worked out here if not given
+    :param lazy: Only draw the graphs for the top pixels now, the others are drawn when clicked on in the summary
+    (if the backend can do that)
+    :param top: In lazy mode, how many of the best pixels (by PCE) to draw up front
+    :param data_sheets: In lazy mode, still write every pixel's data sheets up front. False leaves just the summary
+    :param pixels: (key, PixelData, metrics) still on their way, e.g. prefetch(iter_results(path)). Each one is
+    drawn as soon as it turns up and added to db, and the results table is put together once they're all in. If the
+    results are given, the metrics are None and the pixels are just the ones in the results, in the same order (see
+    iter_plot_pixels). Lazy mode needs the whole ranking first, so there they're all collected before anything gets
+    drawn
+    :param release: With pixels, drop each pixel's sweeps as soon as its sheets are written (db keeps just the IDs),
+    so only the few pixels in flight are ever in memory
+    :param backend: RenderBackend to draw with, None for an OriginBackend
+    :param name: What the run is called (its folder), for backends that keep runs apart
+    :return: The results table
+    """
+    backend = OriginBackend() if backend is None else backend
+    lazy = lazy and backend.lazy
+    if pixels is not None and lazy:
+        db.update((key, pixel) for key, pixel, _ in pixels)
+        pixels = None
+    release = release and pixels is not None
+    if pixels is None:
+        if results is None:
+            results = analyze_db(db)
+        pixels = ((key, db[key], None) for key in results["key"])
+    incoming = results is None  # Still to be put together from the metrics coming in with the pixels
     print("Plotting... (this may take a few sec)")
-    # Creates the folders needed:
-    op.lt_exec('pe_cd /; pe_mkdir "SUMMARY"; pe_cd /;pe_mkdir "FULL_IV_CURVES";')
-
-    # Lists that will populate summary pages:
-    voc_list = []  # Open circuit voltage
-    isc_list = []  # Short circuit current
-    ff_list = []  # Fill factor
-    vm_list = []  # Voltage at max power
-    im_list = []  # Current at max power
-    pce_list = []
-    
-    voc_list2 = []  # Open circuit voltage
-    isc_list2 = []  # Short circuit current
-    ff_list2 = []  # Fill factor
-    vm_list2 = []  # Voltage at max power
-    im_list2 = []  # Current at max power
-    pce_list2 = []
-
-    # stabalised values:
-    voc_st_list = []  # Open circuit voltage
-    isc_st_list = []  # Short circuit current
-    vm_st_list = []  # Voltage at max power
-    im_st_list = []  # Current at max power
-    pce_st_list = []
-
-    ids = []  # The ID dict (for info cols)
-    vars = [] # variables
+    backend.begin(name)
+
+    render_now = None  # Everything
+    if lazy:
+        best_pce = np.fmax(results["pce_1"], results["pce_2"])
+        best_first = np.argsort(np.where(np.isnan(best_pce), -np.inf, -best_pce), kind='stable')
+        render_now = set(results["key"][best_first[:top]])
+
     graph_strs = []  # Holds hyperlinks to plotted graphs
     mppt_graph_strs = []
+    summary_rows = []  # (key, pixel, metrics) of incoming pixels
+    for key, pixel, metrics in pixels:
+        if incoming:
+            db[key] = pixel
+            if metrics is None:
+                if release:
+                    pixel.release()
+                continue  # Not in the results table (iter_results has said so)
+            summary_rows.append((key, pixel, metrics))
+        with profiled_context(pixel=key):
+            if render_now is None or key in render_now:
+                graph_str, mppt_graph_str = backend.draw(key, pixel)
+            else:
+                graph_str, mppt_graph_str = backend.defer(key, pixel, data_sheets)
+        graph_strs.append(graph_str)
+        mppt_graph_strs.append(mppt_graph_str)
+        if release:
+            pixel.release()  # Everything from here on only needs the sheets
+    if incoming:
+        results = collect_results(summary_rows, release=False)
 
-    Graph_index = 1  # Keep track of how many graphs, needed for the hyperlinking
-    for key in db.keys():
-        # move into the full iv curve dir, create new dir per pixel:
-        op.lt_exec('pe_cd /; pe_cd "FULL_IV_CURVES"; pe_mkdir "' + key + '"; pe_cd "' + key + '"')
-        #print("NOW PLOTING: Graph" + str(Graph_index) + " - " + key)
-
-        # Create worksheet:
-        wks = op.new_sheet(lname="DATA for " + key)  # Long name is linked to key
-        # super hacky way to get more cols but like leave me alone
-        for i in range(10):
-            op.lt_exec('wks.addCol()')
-            
-        ######################################################################  
-        # Extract data from PixelData class for convenience:
-        area = float(db[key].get_id()["area"])
-        dark_area = float(db[key].get_id()["dark_area"])
+    backend.summary(results, graph_strs, mppt_graph_strs)
+    return results
 
-        dx1 = db[key].get_dark_iv()[0][0]
-        try:
-            dy1 = [i *(1e3 / dark_area) for i in db[key].get_dark_iv()[0][1]]
-        except:
-            dy1 = None
-        dx2 = db[key].get_dark_iv()[1][0]
-        try:
-            dy2 = [i *(1e3 / dark_area) for i in db[key].get_dark_iv()[1][1]]
-        except:
-            dy2 = None
+ARCHIVE_EXT = ".a4"  # Packed runs are folders with this on the end
 
-        lx1 = db[key].get_light_iv()[0][0]
 
-        try:
-            ly1 = [i *(1e3 / area) for i in db[key].get_light_iv()[0][1]]
-        except:
-            print(f"Didn't find {key}, moving on...")
+def export_archive(db, archive_path):
+    """
+    Packs a whole create_db database into one archive folder, so it can be opened again without touching any text:
+    data.npy        every sweep of every pixel back to back, one (points, 4) float64 block, V/I/t/stat columns
+    offsets.npy     (pixels, SWEEP_TYPES, 2) int64, where each sweep starts in data.npy and how many points it has
+                    (-1 points for sweeps that weren't measured)
+    id.<name>.npy   the ID columns, one string per pixel, key first
+    var.<name>.npy  the extra variables from the csv, same again
+    index.json      what's in there. Written last, so a half written archive doesn't load
+    :param db: Output of create_db
+    :param archive_path: Folder to write, ARCHIVE_EXT gets added if it's not on the end
+    :return: Path of the archive
+    """
+    if not archive_path.endswith(ARCHIVE_EXT):
+        archive_path += ARCHIVE_EXT
+    keys = list(db.keys())
+    pixels = [db[key] for key in keys]
+    if any(pixel.get_mppt_summary() is not None for pixel in pixels):
+        raise ValueError("Some MPPT traces were streamed, so only a cut down copy is loaded. Read the folder with "
+                         "stream_bytes=None to pack it")
+    os.makedirs(archive_path, exist_ok=True)
+
+    offsets = np.full((len(keys), len(SWEEP_TYPES), 2), -1, dtype=np.int64)
+    total = 0
+    for row, pixel in enumerate(pixels):
+        for column, sweep in enumerate(SWEEP_TYPES):
+            data = pixel.get_sweep(sweep)
+            if data is not None:
+                offsets[row, column] = (total, data.shape[1])
+                total += data.shape[1]
+
+    # Filled in place on disk, so there's never a second copy of everything in memory:
+    packed = np.lib.format.open_memmap(os.path.join(archive_path, "data.npy"), mode='w+',
+                                       dtype=np.float64, shape=(total, len(SWEEP_FIELDS)))
+    for row, pixel in enumerate(pixels):
+        for column, sweep in enumerate(SWEEP_TYPES):
+            start, length = offsets[row, column]
+            if length >= 0:
+                packed[start:start + length] = pixel.get_sweep(sweep).T
+    packed.flush()
+    del packed
+    np.save(os.path.join(archive_path, "offsets.npy"), offsets)
+
+    id_names = ["key"] + [name for name in pixels[0].get_id()] if pixels else ["key"]
+    var_names = list(pixels[0].get_var().keys()) if pixels else []
+    np.save(os.path.join(archive_path, "id.key.npy"), np.array(keys, dtype=str))
+    for name in id_names[1:]:
+        column = ["" if pixel.get_id()[name] is None else pixel.get_id()[name] for pixel in pixels]
+        np.save(os.path.join(archive_path, f"id.{name}.npy"), np.array(column, dtype=str))
+    for name in var_names:
+        np.save(os.path.join(archive_path, f"var.{name}.npy"),
+                np.array([pixel.get_var().get(name, "") for pixel in pixels], dtype=str))
+
+    with open(os.path.join(archive_path, "index.json"), 'w') as file:
+        json.dump({"version": 1, "sweeps": list(SWEEP_TYPES), "fields": list(SWEEP_FIELDS),
+                   "id_columns": id_names, "var_columns": var_names, "pixels": len(keys), "points": total}, file)
+    return archive_path
+
+
+def isarchive(path):
+    return os.path.isfile(os.path.join(path, "index.json")) and os.path.isfile(os.path.join(path, "data.npy"))
+
+
+def load_archive(archive_path):
+    """
+    Opens an archive from export_archive. The data is memory mapped, so this is instant whatever the size, and only
+    the curves that actually get used are ever read off the disk.
+    :param archive_path: Archive folder
+    :return: {key: PixelData}, same as create_db gives. The sweeps are read only views into the archive
+    """
+    with open(os.path.join(archive_path, "index.json"), 'r') as file:
+        index = json.load(file)
+    packed = np.load(os.path.join(archive_path, "data.npy"), mmap_mode='r')
+    offsets = np.load(os.path.join(archive_path, "offsets.npy"))
+    columns = {name: np.load(os.path.join(archive_path, f"id.{name}.npy")) for name in index["id_columns"]}
+    variables = {name: np.load(os.path.join(archive_path, f"var.{name}.npy")) for name in index["var_columns"]}
+
+    db = {}
+    for row, key in enumerate(columns["key"]):
+        pixel = PixelData(**{name: str(columns[name][row]) for name in index["id_columns"][1:]})
+        for name in index["var_columns"]:
+            pixel.append_var(name, str(variables[name][row]))
+        for column, sweep in enumerate(index["sweeps"]):
+            start, length = offsets[row, column]
+            if length >= 0:
+                pixel.set_sweep(sweep, packed[start:start + length].T)
+        db[str(key)] = pixel
+    return db
+
+
+def _pack_task(path, archive_path, cache):
+    """Reads a run folder whole and packs it, for the pool workers. Only the archive's path comes back"""
+    return export_archive(create_db(path, cache, stream_bytes=None), archive_path)
+
+
+def convert_tree(path, dest=None, workers=WORKERS, cache=None, depth=1):
+    """
+    Packs run folders into archives in bulk: the path itself if it's a run folder, otherwise every run folder
+    found below it (see find_data_folders). Each folder is read and packed by one of the pool's processes, so
+    nothing but the archive's path ever comes back here.
+    :param path: Run folder, or a folder of them
+    :param dest: Where the archives go, None puts each one next to its run folder
+    :param workers: See process_folders
+    :param cache: See process_folders
+    :param depth: See find_data_folders
+    :return: List of the archives written
+    """
+    jobs = []
+    for folder in find_data_folders(path, depth):
+        if isarchive(folder):
             continue
-        lx2 = db[key].get_light_iv()[1][0]
+        name = os.path.basename(os.path.normpath(folder))
+        parent = os.path.dirname(os.path.normpath(folder)) if dest is None else dest
+        compressed, _ = split_compressed(folder)
+        if compressed is not None:  # Goes next to the zip/tar rather than in it, named without the .zip/.tar.gz/...
+            parent = os.path.dirname(compressed) if dest is None else dest
+            for ext in COMPRESSED_SUFFIXES:
+                if name.lower().endswith(ext):
+                    name = name[:-len(ext)]
+                    break
+        jobs.append((folder, os.path.join(parent, name)))
+    if not jobs:
+        hint = "" if depth is None else f" within {depth} level(s), a bigger --depth or -r looks further down"
+        print(f"Couldn't find any run folders to pack in {path}{hint}")
+
+    written = []
+    executable = _pool_executable()
+    if workers != 1 and len(jobs) > 1 and executable is not None:
+        multiprocessing.set_executable(executable)
         try:
-            ly2 = [i *(1e3 / area) for i in db[key].get_light_iv()[1][1]]
-        except:
-            ly2 = None
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_pack_task, folder, archive_path, cache) for folder, archive_path in jobs]
+                for (folder, _), future in zip(jobs, futures):
+                    written.append(future.result())
+                    print(f"Packed {folder} -> {written[-1]}")
+        except (BrokenProcessPool, OSError) as err:
+            print(f"Couldn't pack folders in parallel ({err}), doing them one by one instead...")
+    for folder, archive_path in jobs[len(written):]:
+        written.append(_pack_task(folder, archive_path, cache))
+        print(f"Packed {folder} -> {written[-1]}")
+    return written
+
+
+def process_folder(path, cache=None, keep_db=True):
+    """
+    Parses and analyses one run folder, everything but the plotting.
+    :param path: Run folder
+    :param cache: ResultCache to reuse (and store) parsed sweeps and results, None to do it all from scratch
+    :param keep_db: False when only the numbers are wanted: the folder goes through iter_results a batch of pixels
+    at a time and none of the raw data is kept (or even read, if the results are cached)
+    :return: (database or None, results), from create_db and analyze_db. All plain dicts and numpy arrays, cheap to
+    pickle
+    """
+    with profiled_context(folder=path):
+        if isarchive(path):
+            db = load_archive(path)
+            return db if keep_db else None, analyze_db(db)
+        results = None if cache is None else cache.get_results(path)
+        if not keep_db:
+            if results is None:
+                results = collect_results(iter_results(path, cache))
+                if cache is not None:
+                    cache.put_results(path, results)
+            return None, results
+        db = create_db(path, cache)
+        if results is None:
+            results = analyze_db(db)
+            if cache is not None:
+                cache.put_results(path, results)
+        return db, results
+
+
+def plot_folder(path, cache=None, lazy=LAZY_GRAPHS, top=RENDER_TOP, backend=None):
+    """
+    process_folder and origin_create_plots for one folder, overlapped: the pixels are parsed and analysed in a
+    background thread (see prefetch, iter_results) and each one is drawn as soon as it's ready, so Origin isn't left
+    waiting for the whole folder. Once drawn, a pixel's raw data is let go of, so memory goes with the biggest few
+    pixels rather than the folder. Archives, folders with cached results and lazy mode have (or need) everything up
+    front, so those just go one after the other.
+    :param path: Run folder or archive
+    :param cache: See process_folder
+    :param lazy: See origin_create_plots
+    :param top: See origin_create_plots
+    :param backend: See origin_create_plots
+    :return: (database, results), same as process_folder. When overlapped the database only has the IDs left in it
+    """
+    with profiled_context(folder=path):
+        if lazy or isarchive(path) or (cache is not None and cache.get_results(path) is not None):
+            db, results = process_folder(path, cache)
+            origin_create_plots(db, results, lazy, top, backend=backend, name=path)
+            return db, results
+        db = {}
+        results = origin_create_plots(db, pixels=prefetch(iter_results(path, cache)), release=True, backend=backend,
+                                      name=path)
+        if cache is not None:
+            cache.put_results(path, results)
+        return db, results
+
+
+def iter_plot_pixels(path, results, cache=None):
+    """
+    Reads a folder's pixels back in a pixel at a time, for plotting a folder whose results came from somewhere else
+    (e.g. the pool, see process_folders), so the whole folder never has to be in memory at once.
+    :param path: Run folder or archive
+    :param results: Its results table
+    :param cache: See iter_db
+    :return: Generator of (key, PixelData, None) for every pixel in the results, in the same order, for
+    origin_create_plots
+    """
+    keys = set(results["key"])
+    pixels = load_archive(path).items() if isarchive(path) else iter_db(path, cache)
+    for key, pixel in pixels:
+        if key in keys:
+            yield key, pixel, None
 
-        ######################################################################
-        # Calculate the parameters:
 
-        
-       # Stability file data: 
+def _pool_task(path, cache, profile, keep_db=True):
+    """
+    process_folder for the pool workers, lives at the top level so it can be sent to them.
+    :return: (database, results, cache stats or None, profiler events or None)
+    """
+    global PROFILER
+    if cache is not None:
+        cache.reset_stats()
+    PROFILER = Profiler() if profile else None
+    db, results = process_folder(path, cache, keep_db)
+    return db, results, None if cache is None else cache.stats, None if PROFILER is None else PROFILER.events
+
 
+def _pool_executable():
+    """
+    Python interpreter for the worker processes. Inside Origin, sys.executable is Origin itself (spawning that would
+    be bad), so look for the embedded python next to it.
+    :return: Path to a python executable, None if there isn't one to use
+    """
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    for name in ("python.exe", "pythonw.exe", "python"):
+        candidate = os.path.join(sys.exec_prefix, name)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+@contextmanager
+def scratch_cache():
+    """A ResultCache in a new temporary folder, deleted again (with everything in it) afterwards"""
+    cache_dir = tempfile.mkdtemp(prefix="a4-")
+    try:
+        yield ResultCache(cache_dir)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def process_folders(paths, workers=WORKERS, cache=None, keep_db=True):
+    """
+    Parses and analyses a bunch of run folders across a pool of processes, since every folder is independent. Only
+    the numbers come back here, so the plotting (which Origin needs done one thing at a time) can happen in this
+    process as each folder is ready (see iter_plot_pixels). That reads the curves back through the cache the workers
+    parsed them into, so give it one when plotting (scratch_cache if there isn't a real one), or every folder gets
+    parsed twice. Falls back to doing it all here if the pool can't be used.
+    :param paths: Run folders
+    :param workers: Number of processes, None means one per CPU, 1 means don't bother with a pool
+    :param cache: ResultCache for process_folder, None for no caching
+    :param keep_db: See process_folder. Whole databases are never sent back from the pool, since a few of them
+    finished at once would all sit here together: with keep_db the folders are read here one at a time instead (the
+    next one while this one is being used), so there's never more than one in use, one waiting and one being read
+    :return: Generator of (path, database, results), in the same order as paths
+    """
+    paths = list(paths)
+    done = 0
+    executable = _pool_executable()
+    if workers != 1 and len(paths) > 1 and executable is not None and not keep_db:
+        multiprocessing.set_executable(executable)
         try:
-            voc_st = float(db[key].get_vt()[0][-1])  # Open circuit voltage, from stability file
-        except:
-            voc_st = None
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Only a few folders ahead of whoever is consuming these, so a slow consumer (Origin) doesn't end
+                # up with every parsed folder of a big batch sat in memory at once:
+                window = 2 * (workers or os.cpu_count() or 1)
+                in_flight = deque()
+                while done < len(paths):
+                    while len(in_flight) < window and done + len(in_flight) < len(paths):
+                        path = paths[done + len(in_flight)]
+                        in_flight.append((path, pool.submit(_pool_task, path, cache, PROFILER is not None,
+                                                                      keep_db)))
+                    path, future = in_flight.popleft()
+                    db, results, stats, events = future.result()
+                    if cache is not None:
+                        cache.add_stats(stats)
+                    if PROFILER is not None:
+                        PROFILER.merge(events)
+                    yield path, db, results
+                    done += 1
+        except (BrokenProcessPool, OSError) as err:
+            print(f"Couldn't run folders in parallel ({err}), doing them one by one instead...")
+    # One by one, but still with the next folder being read while this one gets plotted:
+    yield from prefetch(((path,) + process_folder(path, cache, keep_db) for path in paths[done:]),
+                        depth=1 if keep_db else PREFETCH_DEPTH)
+
+
+class RunWatcher:
+    """
+    Follows a run folder while the Wavelabs software is still writing it. Every poll lists the folder once, reads
+    whatever per-pixel files have finished being written (same size and modified time for settle seconds) and
+    re-analyses the pixels that got new data, so the summary builds up pixel by pixel during the session.
+    """
+    # What goes in the table printed as pixels come in, metric: heading
+    TABLE_COLUMNS = {"voc_1": "Voc(1)", "jsc_1": "Jsc(1)", "ff_1": "FF(1)",
+                     "pce_1": "PCE(1)", "pce_2": "PCE(2)", "pce_st": "PCE(MPPT)"}
+
+    def __init__(self, path, cache=None, settle=WATCH_SETTLE_SECONDS):
+        """
+        :param path: Run folder, doesn't have to exist yet
+        :param cache: ResultCache to read sweeps through, None to parse directly
+        :param settle: Seconds a file has to stay unchanged before it gets read
+        """
+        self.path = path
+        self.cache = cache
+        self.settle = settle
+        self.db = {}  # Same as create_db makes, filled in as files turn up
+        self.metrics = {}  # key: {metric: value}, for every pixel analysed so far
+        self.__csv = None  # (path, (size, modified time)) of the csv self.db came from
+        self.__seen = {}  # file path: ((size, modified time), when it was first seen like that)
+        self.__loaded = {}  # file path: (size, modified time) of the version sitting in self.db
+
+    def _settled(self, file_path, now):
+        """(size, modified time) of a file if it's stopped changing, None if it's still being written"""
         try:
-            isc_st = float(db[key].get_it()[1][-1])* (1e3/area)  # Short circuit current, from stability file
-        except:
-            isc_st = None
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        state = (stat.st_size, stat.st_mtime_ns)
+        if file_path not in self.__seen or self.__seen[file_path][0] != state:
+            self.__seen[file_path] = (state, now)
+        return state if now - self.__seen[file_path][1] >= self.settle else None
+
+    def poll(self, now=None):
+        """
+        Looks at the folder once, and reads/analyses anything new.
+        :param now: time.monotonic() to use, mostly for testing
+        :return: Keys of the pixels that were (re)analysed, in csv order
+        """
+        now = time.monotonic() if now is None else now
+        if not os.path.isdir(self.path):
+            return []
+        index = RunIndex(self.path)
+        if not index.csv_files:
+            return []
+        csv_state = self._settled(index.csv_files[0], now)
+        if csv_state is None:
+            return []
+        if self.__csv != (index.csv_files[0], csv_state):
+            # New (or rewritten) csv, start again. Files already parsed will come out of the cache, if there is one
+            self.db = read_run_csv(index.csv_files[0])
+            self.metrics = {}
+            self.__loaded = {}
+            self.__csv = (index.csv_files[0], csv_state)
+
+        index.match(self.db.keys())
+        load = load_tsv if self.cache is None else self.cache.load_tsv
+        updated = []
+        for key, pixel in self.db.items():
+            changed = False
+            for sweep, file_path in index.files[key].items():
+                state = self._settled(file_path, now)
+                if state is None or self.__loaded.get(file_path) == state:
+                    continue
+                try:
+                    data = load(file_path)
+                except (OSError, ValueError):
+                    continue  # Not really finished after all, have another go next time
+                pixel.set_sweep(sweep, data)
+                self.__loaded[file_path] = state
+                changed = True
+            if changed and pixel.get_light_iv()[0] is not None:
+                self.metrics[key] = analyze_pixel(pixel)
+                updated.append(key)
+        return updated
+
+    def summary(self):
+        """Results table (same layout as analyze_db) of every pixel analysed so far"""
+        keys = [key for key in self.db if key in self.metrics]
+        metrics = {name: [self.metrics[key][name] for key in keys] for name in METRIC_COLUMNS}
+        return results_table(keys, [self.db[key] for key in keys], metrics)
+
+    def print_row(self, key):
+        metrics = self.metrics[key]
+        print(f"{key:<30}" + "".join(f"{metrics[name]:>12.4g}" for name in self.TABLE_COLUMNS))
+
+    def run(self, poll=WATCH_POLL_SECONDS, idle_timeout=None):
+        """
+        Keeps polling (and printing a row of the summary for every pixel as it comes in) until Ctrl+C, or until
+        nothing has changed for idle_timeout seconds.
+        :param poll: Seconds between looks at the folder
+        :param idle_timeout: Stop after this many seconds without new data, None to go on until interrupted
+        :return: summary()
+        """
+        print(f"Watching {self.path}, Ctrl+C to stop")
+        print(f"{'Pixel':<30}" + "".join(f"{heading:>12}" for heading in self.TABLE_COLUMNS.values()))
+        last_change = time.monotonic()
         try:
-            im_st = np.mean(db[key].get_mppt()[1][-5:])* (1e3/area)
-            vm_st = np.mean(db[key].get_mppt()[0][-5:])
-            mpp_st = vm_st * im_st 
-            
-        except:
-            im_st, vm_st, mpp_st = (None, None, None)
-  
-        # Bound error is false, for really bad stuff it'll output NaN (Thanks Joel!)
-        j_from_v = interp1d(lx1, ly1,bounds_error=False)
-        v_from_j = interp1d(ly1, lx1, bounds_error=False)
-        voc = v_from_j(0)
-        isc = j_from_v(0)
-
-        # Catches if current compliance caused device to not span full quadrent:
+            while idle_timeout is None or time.monotonic() - last_change < idle_timeout:
+                updated = self.poll()
+                for key in updated:
+                    self.print_row(key)
+                if updated:
+                    last_change = time.monotonic()
+                time.sleep(poll)
+        except KeyboardInterrupt:
+            pass
+        return self.summary()
+
+
+def isrunlisting(names):
+    """Whether a folder holding files with these names is a run folder: a csv and a yaml (either can be gzipped)"""
+    has_csv = has_yaml = False
+    for name in names:
+        if name.endswith(".gz"):
+            name = name[:-3]
+        has_csv = has_csv or name.endswith(".csv")
+        has_yaml = has_yaml or name.endswith(".yaml")
+        if has_csv and has_yaml:
+            return True
+    return False
+
+
+def isdatafolder(path):
+    try:
+        return isrunlisting(name for name, _ in list_files(path))
+    except OSError:
+        return False
+
+def find_data_folders(path, depth=1):
+    """
+    Finds the run folders (and archives) to work on: the path itself if it is one, otherwise whatever is in the
+    folders below it, looking at most depth levels down. Zips and tars are looked in like any other folder.
+    :param path: Run folder, or a folder of them
+    :param depth: How many levels down to look, 1 is the folders directly inside path (multi directory mode). None
+    is any depth, see scan_campaign
+    :return: Sorted list of run folder / archive paths
+    """
+    if depth is None:
+        return scan_campaign(path)
+    if isdatafolder(path) or isarchive(path):
+        return [path]
+    folders = []
+    if depth > 0:
         try:
-            temp_v = np.arange(min(lx1), max(lx1), (max(lx1)-min(lx1))/10000)
-            mpp_index = np.nanargmin(temp_v*j_from_v(temp_v)) # nanargmin because sometimes NaNs come from interpolation (Thanks Melissa!)
-            vm = temp_v[mpp_index]
-            im = j_from_v(temp_v[mpp_index])
-        except ValueError: 
-            vm = np.nan
-            im = np.nan
+            subfolders = sorted(list_dirs(path))
+        except OSError:
+            return folders
+        for subfolder in subfolders:
+            folders += find_data_folders(subfolder, depth - 1)
+    return folders
 
-        # Check second curve in case it's better:
 
+def _scan_folder(path, known):
+    """
+    Looks at one folder for scan_campaign.
+    :param path: Folder (or zip/tar, or folder in one)
+    :param known: What the manifest had for it last time, None if nothing
+    :return: [modified time ns, whether it's a run folder / archive, names of the subfolders to look in]. known
+    itself if the folder hasn't changed since, which costs one stat rather than a listing
+    """
+    try:
+        folder_stat = os.stat(path)
+        compressed = None if S_ISDIR(folder_stat.st_mode) else path
+    except OSError:  # Inside a zip/tar then?, which counts as changed when the zip/tar does
+        compressed, _ = split_compressed(path)
+        if compressed is None:
+            raise
+        folder_stat = os.stat(compressed)
+    if known is not None and known[0] == folder_stat.st_mtime_ns:
+        return known
+    if compressed is None:
+        files, folders = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    folders.append(entry.name)
+                elif entry.is_file():
+                    (folders if entry.name.lower().endswith(COMPRESSED_SUFFIXES) else files).append(entry.name)
+    else:
+        files = [name for name, _ in list_files(path)]
+        folders = [os.path.basename(folder) for folder in list_dirs(path)]
+    if isrunlisting(files) or "index.json" in files and "data.npy" in files:  # Run folder or archive, stop here
+        return [folder_stat.st_mtime_ns, True, []]
+    return [folder_stat.st_mtime_ns, False, sorted(name for name in folders if not name.startswith(SCAN_SKIP))]
+
+
+def _scan_folders(path, relatives, known):
+    """_scan_folder on a bunch of folders (relative to path) in one go, None for any that can't be looked in"""
+    scanned = []
+    for relative in relatives:
         try:
-            j_from_v2 = interp1d(lx2, ly2, bounds_error=False)
-            v_from_j2 = interp1d(ly2, lx2, bounds_error=False)
-            voc2 = v_from_j2(0)
-            isc2 = j_from_v2(0)
-            try:
-                temp_v2 = np.arange(min(lx2), max(lx2), (max(lx2)-min(lx2))/10000)
-                mpp_index2 = np.nanargmin(temp_v2*j_from_v2(temp_v2)) # nanargmin because sometimes NaNs come from interpolation (Thanks Melissa!)
-                vm2 = temp_v2[mpp_index2]
-                im2 = j_from_v2(temp_v2[mpp_index2])
-            except ValueError: 
-                vm2 = np.nan
-                im2 = np.nan
-        except:
-            pass
-            
-        ff = (vm*im)/(voc*isc)
-        ff2 = (vm2*im2)/(voc2*isc2)
+            scanned.append(_scan_folder(os.path.join(path, relative) if relative else path, known.get(relative)))
+        except OSError:  # Gone since its parent was listed, or not allowed in
+            scanned.append(None)
+    return scanned
+
 
+def _manifest_path(path):
+    return os.path.join(SCAN_MANIFEST_DIR, hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + ".json")
 
-        voc_st_list.append(voc_st)
-        isc_st_list.append(isc_st)
-        vm_st_list.append(vm_st)
-        im_st_list.append(im_st)
+
+def scan_campaign(path, workers=SCAN_WORKERS, manifest=SCAN_MANIFEST_DIR is not None):
+    """
+    Finds every run folder (and archive) below path, however deep, e.g. for a campaign sorted into
+    year/month/user/session folders. Folders are listed in parallel by a pool of threads (os.scandir lets go of the
+    GIL while it waits on the disk), nothing below a run folder is looked at, and neither are hidden folders (see
+    SCAN_SKIP).
+
+    What every folder held is kept in a manifest, with its modified time. A folder's modified time only changes when
+    something is added, removed or renamed directly inside it, so next time, every folder whose time is the same just
+    gets its subfolders from the manifest instead of being listed again, and only the parts that changed get looked
+    through properly.
+    :param path: Folder to look through
+    :param workers: Threads listing folders
+    :param manifest: Use (and update) the manifest in SCAN_MANIFEST_DIR
+    :return: Sorted list of run folder / archive paths
+    """
+    manifest_path = _manifest_path(path) if manifest else None
+    known = {}
+    if manifest_path is not None:
         try:
-            pce_st_list.append(-1 * mpp_st)
-        except TypeError:
-            pce_st_list.append(mpp_st)
-
-        voc_list2.append(float(voc2))
-        isc_list2.append(float(isc2))
-        ff_list2.append(float(ff2))
-        vm_list2.append(float(vm2))
-        im_list2.append(float(im2))
-        pce_list2.append(abs(float(vm2*im2)))
-        
-        voc_list.append(float(voc))
-        isc_list.append(float(isc))
-        ff_list.append(float(ff))
-        vm_list.append(float(vm))
-        im_list.append(float(im))
-        pce_list.append(abs(float(vm*im)))
-              
-        ids.append(db[key].get_id())
-        vars.append(db[key].get_var())
-        
-        ######################################################################
-        # Push lists into the cols on sheet, labels and type as appropriate:
-        
-        counter = 1
-        if ly1:
-            wks.from_list(letter_i(counter), lx1, 'Voltage', 'V', axis='X')
-            counter += 1
-            wks.from_list(letter_i(counter), ly1, 'Current', 'mA/cm^2', "Illuminated, 1", axis='Y')
-            counter += 1
-        if ly2:
-            wks.from_list(letter_i(counter), lx2, 'Voltage', 'V', axis='X')
-            counter += 1
-            wks.from_list(letter_i(counter), ly2, 'Current', 'mA/cm^2', "Illuminated, 2", axis='Y')
-            counter += 1
-
-        if dy1:
-            wks.from_list(letter_i(counter), dx1, 'Voltage', 'V', axis='X')
-            counter += 1
-            wks.from_list(letter_i(counter), dy1, 'Current', 'mA/cm^2', "Dark, 1", axis='Y')
-            counter += 1
-        if dy2:
-            wks.from_list(letter_i(counter), dx2, 'Voltage', 'V', axis='X')
-            counter += 1
-            wks.from_list(letter_i(counter), dy2, 'Current', 'mA/cm^2', "Dark, 2", axis='Y')
-            counter += 1
-
-        # Create graph to plot into:
-        #graph = op.new_graph(lname="IV: " + key, template=op.path('u') + 'a4_template.otpu')
-        # !!! a custom template is used in line above, change it to "line" if this is missing!!!
-        graph = op.new_graph(lname="JV: " + key, template='a4_template.otpu')
-
-        # First 2 (solid line) plots on base layer:
-        plot1 = graph[0].add_plot(wks, coly="F", colx="E", type='line')
-        plot2 = graph[0].add_plot(wks, coly="B", colx="A", type='line')
-        # Rescales axis, sets linewidth up, sets up autocolour:        
-        op.lt_exec("Rescale; set %C -w 2000; layer -g; layer.X.showAxes=3; layer.Y.showAxes=3;")
-        
-        layer2 = graph.add_layer(type="noxy")  # new layer, noax allows us to use the same axis as before
-        plot3 = graph[1].add_plot(wks, coly="H", colx="G", type='line')
-        plot4 = graph[1].add_plot(wks, coly="D", colx="C", type='line')
-        # Rescales axis, sets linewidth up, Changes linestyle to dash, sets up autocolour:
-        op.lt_exec("Rescale; set %C -w 2000; layer -g; set %C -d 1")
-        
-        #op.wait()  # wait until operation is done
-        #op.wait('s', 0.05)  # wait further for graph to update
+            with open(manifest_path, 'r') as file:
+                saved = json.load(file)
+            if saved.get("version") == 1:
+                known = saved["folders"]
+        except (OSError, ValueError, KeyError):
+            pass
 
-        graph_num = op.graph_list()[0].get_str("name")
-        graph_strs.append("graph://" + graph_num + " - " + "IV: " + key)  # creates hyperlink
-        ######################################################################
-        # Max power plots (By request of mike)
-        
+    scanned = {}  # Same as the manifest: {path relative to the top: [modified time ns, is run, subfolders]}
+    with profiled("discovery", "discovery", path=path), ThreadPoolExecutor(workers) as pool:
+        level = [""]
+        while level:  # A level of the tree at a time, split between the threads in chunks
+            size = max(1, min(SCAN_CHUNK, len(level) // (4 * workers)))
+            chunks = [level[start:start + size] for start in range(0, len(level), size)]
+            level = []
+            for chunk, results in zip(chunks, pool.map(lambda chunk: _scan_folders(path, chunk, known), chunks)):
+                for relative, result in zip(chunk, results):
+                    if result is None:
+                        continue
+                    scanned[relative] = result
+                    level += [os.path.join(relative, name) if relative else name for name in result[2]]
+
+    if manifest_path is not None:
+        os.makedirs(SCAN_MANIFEST_DIR, exist_ok=True)
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
         try:
-            i_mppt = abs(np.array(db[key].get_mppt()[1])* (1e3/area))
-            v_mppt = abs(np.array(db[key].get_mppt()[0]))
-            p_mppt = v_mppt * i_mppt 
-            t_mppt = np.array(db[key].get_mppt()[2])
-            t_mppt_scaled = [i-t_mppt[0] for i in t_mppt]
-            wks_mpp = op.new_sheet(lname="MPPT DATA for " + key)  # Long name is linked to key
-            # more like maxium hackiness point tracking...
-            for i in range(10):
-                op.lt_exec('wks.addCol()')
-            
-            wks_mpp.from_list('A', t_mppt_scaled, 'Time', 's', axis='X')
-            wks_mpp.from_list('B', v_mppt, 'Voltage', 'V', axis='Y')
-            wks_mpp.from_list('C', i_mppt, 'Current', 'mA/cm^2', axis='Y')
-            wks_mpp.from_list('D', p_mppt, 'Power Density', 'mW/cm^2', axis='Y')
+            with open(temp_path, 'w') as file:
+                json.dump({"version": 1, "path": os.path.abspath(path), "folders": scanned}, file)
+            os.replace(temp_path, manifest_path)
+        except OSError as err:
+            print(f"Couldn't save the discovery manifest ({err}), next time will have to look everywhere again...")
+    return sorted(os.path.join(path, relative) if relative else path
+                  for relative, (_, is_run, _) in scanned.items() if is_run)
 
-            
-            # Add data plots onto the graph
-            mppt_graph = op.new_graph(lname="MPPT: " + key,template='a4_MPPT') 
-            
-            mpp_letters= ['B', 'C', 'D']
-            # Loop over layers and worksheets to add individual curve.
-            mpptlayer1 = mppt_graph[0]
-            plotmppt1 = mpptlayer1.add_plot(wks_mpp, coly='B', colx="A", type='y')
-            mpptlayer1.rescale()
-            
-            mpptlayer2 = mppt_graph[1]
-            plotmppt2 = mpptlayer2.add_plot(wks_mpp, coly='C', colx="A",type='y')
-            mpptlayer2.rescale()
-            
-            mpptlayer3 = mppt_graph[2]
-            plotmppt3 = mpptlayer3.add_plot(wks_mpp, coly="D", colx="A",type='y')
-            mpptlayer3.rescale()
-            
-            mppt_graph_num = op.graph_list()[1].get_str("name")
-            mppt_graph_strs.append("graph://" + mppt_graph_num + " - " + "MPPT: " + key)
-        
-        except:
-            mppt_graph_strs = [None]
 
-        ######################################################################      
-        op.wait()
-        Graph_index += 1
+SUMMARY_FORMATS = ("csv", "json", "parquet")
 
-    op.lt_exec('pe_cd /; pe_cd "SUMMARY";')  # moves to summary dir
-    wks_sum = op.new_sheet(lname="DATA SUMMARY ")  # Creates sheet for summary
-    # super hacky way to get more cols but like leave me alone
-    for i in range(30):
-        op.lt_exec('wks.addCol()')  # more hackyness, just forgive me
 
-    letter_counter = 1    
+class SummaryWriter:
+    """
+    Writes the summary table (one row per pixel: the folder it came from, then the same columns as the DATA SUMMARY
+    sheet) to a file a folder at a time, so a big batch never has to be held in memory and whatever finished is
+    already on disk if it gets stopped halfway. The extra variable columns are the ones in the first folder written,
+    variables that only turn up in later folders go in "other_vars" as name=value pairs.
+    csv and json need nothing extra, parquet needs pyarrow.
+    """
 
-    # Info cols:
-    wks_sum.from_list(letter_i(letter_counter), [i['sys_label'] for i in ids], 'Cell', axis='X')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), [i['user_label'] for i in ids], 'Name', axis='X')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), [i['mux_index'] for i in ids], 'Device number', axis='X')
-    letter_counter += 1
-    for single_var in vars[0].keys():
-        list_with_random_names = [i[single_var] for i in vars]
-        wks_sum.from_list(letter_i(letter_counter), list_with_random_names,single_var, axis='X')
-        letter_counter += 1
-  
-    # Data cols:
-    wks_sum.from_list(letter_i(letter_counter), voc_list, 'V_oc(1)', 'V', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), isc_list, 'J_sc(1)', 'mA/cm^-2', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), pce_list, 'Max power point(1)', 'mWcm^-2', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), ff_list, 'Fill Factor(1)', '', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), vm_list, 'V_mp(1)', 'V', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), im_list, 'I_mp(1)', 'mA/cm^-2', axis='Y')
-    letter_counter += 1
-
-    wks_sum.from_list(letter_i(letter_counter), voc_list2, 'V_oc(2)', 'V', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), isc_list2, 'J_sc(2)', 'mA/cm^-2', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), pce_list2, 'Max power point(2)', 'mWcm^-2', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), ff_list2, 'Fill Factor(2)', '', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), vm_list2, 'V_mp(2)', 'V', axis='Y')
-    letter_counter += 1
-    wks_sum.from_list(letter_i(letter_counter), im_list2, 'I_mp(2)', 'mA/cm^-2', axis='Y')
-    letter_counter += 1
+    def __init__(self, path, fmt=None):
+        """
+        :param path: File to write
+        :param fmt: One of SUMMARY_FORMATS, None goes by the file extension
+        """
+        self.path = path
+        self.format = (fmt or os.path.splitext(path)[1].lstrip('.')).lower()
+        if self.format not in SUMMARY_FORMATS:
+            raise ValueError(f"Can't write a summary as '{self.format}', it has to be one of: "
+                             f"{', '.join(SUMMARY_FORMATS)}")
+        if self.format == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ModuleNotFoundError:
+                raise ModuleNotFoundError("Writing parquet needs pyarrow (pip install pyarrow)") from None
+            self.__pa = pyarrow
+        self.columns = None  # Fixed by the first folder written
+        self.rows = 0
+        self.__file = None
+        self.__writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        if self.format == "csv":
+            self.__file = open(self.path, 'w', newline='')
+            self.__writer = csv.writer(self.__file)
+            self.__writer.writerow(self.columns)
+        elif self.format == "json":
+            self.__file = open(self.path, 'w')
+            self.__file.write("[")
+        else:
+            pa = self.__pa
+            schema = pa.schema([(name, pa.float64() if name in METRIC_COLUMNS else pa.string())
+                                for name in self.columns])
+            self.__writer = pa.parquet.ParquetWriter(self.path, schema)
 
-    
-    # Get ready....here comes...MORE HACKYNESS
-    
-    if voc_st_list[0]:
-        wks_sum.from_list(letter_i(letter_counter), voc_st_list, 'V (STABALISED)', 'V', axis='Y')
-        letter_counter += 1
-    if isc_st_list[0]:
-        wks_sum.from_list(letter_i(letter_counter), isc_st_list, 'I (STABALISED)', 'mA/cm^2', axis='Y')
-        letter_counter += 1
-    if pce_st_list[0]:
-        wks_sum.from_list(letter_i(letter_counter), pce_st_list, 'Max power point (MPPT)', 'mWcm^-2', axis='Y')
-        letter_counter += 1
-    if vm_st_list[0]:
-        wks_sum.from_list(letter_i(letter_counter), vm_st_list, 'V_mp (MPPT)', 'V', axis='Y')
-        letter_counter += 1
-    if im_st_list[0]:
-        wks_sum.from_list(letter_i(letter_counter), im_st_list, 'I_mp (MPPT)', 'mA/cm^2', axis='Y')
-        letter_counter += 1
-    # Hyperlinks to graphs:
-    wks_sum.from_list(letter_i(letter_counter), graph_strs, 'IV curve', comments='CLICK the cell', axis='Z')
-    letter_counter += 1
-    if mppt_graph_strs[0]:
-        wks_sum.from_list(letter_i(letter_counter), mppt_graph_strs, 'MPPT', comments='CLICK the cell', axis='Z')
-    for i in range(len(graph_strs)):
-        op.lt_exec(f"wrowheight [{i+1}] (3);") 
-    
-    return True
+    def write(self, folder, results):
+        """
+        Adds one folder's pixels to the file.
+        :param folder: Where they came from, goes in the "folder" column
+        :param results: Output of analyze_db
+        """
+        variables = var_columns(results)
+        if self.columns is None:
+            self.columns = ["folder", *ID_COLUMNS, *variables, *METRIC_COLUMNS, "other_vars"]
+            self._open()
+        others = [name for name in variables if name not in self.columns]
+        n_rows = len(results["key"])
+        table = {}
+        for name in self.columns:
+            if name == "folder":
+                table[name] = [str(folder)] * n_rows
+            elif name == "other_vars":
+                table[name] = ["; ".join(f"{other}={results[other][row]}" for other in others)
+                               for row in range(n_rows)]
+            elif name in METRIC_COLUMNS:
+                table[name] = [None if np.isnan(value) else float(value) for value in results[name]]
+            elif name in results:
+                table[name] = [None if value is None else str(value) for value in results[name]]
+            else:
+                table[name] = [None] * n_rows  # An extra variable this folder doesn't have
+
+        if self.format == "csv":
+            self.__writer.writerows(zip(*(["" if value is None else value for value in table[name]]
+                                          for name in self.columns)))
+        elif self.format == "json":
+            for row in range(n_rows):
+                self.__file.write("," if self.rows + row else "")
+                self.__file.write("\n" + json.dumps({name: table[name][row] for name in self.columns}))
+        else:
+            self.__writer.write_table(self.__pa.table(table, schema=self.__writer.schema))
+        if self.__file is not None:
+            self.__file.flush()
+        self.rows += n_rows
+
+    def close(self):
+        if self.columns is None:
+            self.columns = ["folder", *ID_COLUMNS, *METRIC_COLUMNS, "other_vars"]  # Nothing written, empty table
+            self._open()
+        if self.format == "json":
+            self.__file.write("\n]\n")
+        if self.format == "parquet":
+            self.__writer.close()
+        else:
+            self.__file.close()
 
-def isdatafolder(path):
-    for root,dirs,files in os.walk(path):
-        if 'csv' in [i.split('.')[-1] for i in files] and 'yaml' in [i.split('.')[-1] for i in files]:
-            return True
+
+def run_date(path):
+    """
+    When a run was measured: the earliest unix time stamp on the end of its file names (e.g.
+    A_cell_device1_1600000000.liv1.tsv), or when the csv was last changed if there aren't any. Archives don't keep
+    the file names, so they go by when they were packed.
+    :param path: Run folder or archive
+    :return: Local time as "YYYY-MM-DD HH:MM:SS", sorts (and compares) the right way as a string
+    """
+    if isarchive(path):
+        stamp = os.path.getmtime(os.path.join(path, "index.json"))
+    else:
+        index = RunIndex(path)
+        stamps = [int(stem[stem.rfind("_") + 1:]) for stem, _, _ in index.sweep_files
+                  if stem[stem.rfind("_") + 1:].isdigit()]
+        stamp = min(stamps) if stamps else file_state(index.csv_files[0])[1] / 1e9
+    return datetime.fromtimestamp(stamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ResultStore:
+    """
+    Every pixel ever analysed, in one SQLite file: a row per run folder (runs), a row per pixel with its IDs and every
+    metric (pixels), and a row per extra variable from the run csv (vars, the value as text and as a number if it is
+    one). Indexed on the things people search by: user label, slot, run date, and variable name/value, so queries
+    across years of runs come straight back without touching any data files.
+
+    Filters are strings like "additive=X", "pce_1>20", "user_label=cell*" or "anneal_temp>=100": an ID column (slot
+    is sys_label), folder, run_date, a metric from METRIC_COLUMNS, or otherwise an extra variable. = and != take *
+    wildcards, the others compare numbers (dates as text).
+    """
+    FILTER = re.compile(r"^\s*([^<>=!]+?)\s*(>=|<=|!=|=|>|<)\s*(.*?)\s*$")
+
+    def __init__(self, db_path=RESULTS_DB_DEFAULT):
+        """
+        :param db_path: SQLite file, made (along with its folder) if it isn't there
+        """
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, folder TEXT UNIQUE NOT NULL,
+                                                 run_date TEXT, analysed TEXT);
+                CREATE TABLE IF NOT EXISTS pixels (pixel_id INTEGER PRIMARY KEY, run_id INTEGER NOT NULL,
+                                                   key TEXT NOT NULL, sys_label TEXT, user_label TEXT,
+                                                   mux_index TEXT, UNIQUE (run_id, key));
+                CREATE TABLE IF NOT EXISTS vars (pixel_id INTEGER NOT NULL, name TEXT NOT NULL, value TEXT,
+                                                 num REAL, PRIMARY KEY (pixel_id, name));
+                CREATE INDEX IF NOT EXISTS runs_date ON runs (run_date);
+                CREATE INDEX IF NOT EXISTS pixels_user_label ON pixels (user_label);
+                CREATE INDEX IF NOT EXISTS pixels_sys_label ON pixels (sys_label);
+                CREATE INDEX IF NOT EXISTS vars_value ON vars (name, value);
+                CREATE INDEX IF NOT EXISTS vars_num ON vars (name, num);
+            """)
+            # Metrics get a column each, new ones are added on as they turn up:
+            have = {row[1] for row in self.connection.execute("PRAGMA table_info(pixels)")}
+            for name in METRIC_COLUMNS:
+                if name not in have:
+                    self.connection.execute(f'ALTER TABLE pixels ADD COLUMN "{name}" REAL')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def upsert(self, folder, results, date=None):
+        """
+        Puts a folder's results in, replacing whatever was there for it before (pixels no longer in the results go).
+        :param folder: Run folder or archive the results came from
+        :param results: Output of analyze_db
+        :param date: When it was measured, worked out with run_date if not given
+        """
+        folder = os.path.abspath(folder)
+        date = run_date(folder) if date is None else date
+        variables = var_columns(results)
+        keys = [str(key) for key in results["key"]]
+        metrics = list(METRIC_COLUMNS)
+        with profiled("store", "store", folder=folder, pixels=len(keys)), self.connection as connection:
+            connection.execute("INSERT INTO runs (folder, run_date, analysed) VALUES (?, ?, ?) "
+                               "ON CONFLICT (folder) DO UPDATE SET run_date = excluded.run_date, "
+                               "analysed = excluded.analysed",
+                               (folder, date, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            run_id = connection.execute("SELECT run_id FROM runs WHERE folder = ?", (folder,)).fetchone()[0]
+            # Clear out the old pixels' variables (and the pixels that aren't there any more):
+            old = dict(connection.execute("SELECT key, pixel_id FROM pixels WHERE run_id = ?", (run_id,)))
+            connection.executemany("DELETE FROM vars WHERE pixel_id = ?", [(pixel_id,) for pixel_id in old.values()])
+            current = set(keys)
+            connection.executemany("DELETE FROM pixels WHERE pixel_id = ?",
+                                   [(pixel_id,) for key, pixel_id in old.items() if key not in current])
+
+            columns = ["run_id", *ID_COLUMNS, *metrics]
+            names = ", ".join(f'"{name}"' for name in columns)
+            updates = ", ".join(f'"{name}" = excluded."{name}"' for name in columns[2:])
+            rows = [(run_id, key, *(None if results[name][row] is None else str(results[name][row])
+                                    for name in ID_COLUMNS[1:]),
+                     *(None if np.isnan(results[name][row]) else float(results[name][row]) for name in metrics))
+                    for row, key in enumerate(keys)]
+            connection.executemany(f"INSERT INTO pixels ({names}) VALUES ({', '.join('?' * len(columns))}) "
+                                   f"ON CONFLICT (run_id, key) DO UPDATE SET {updates}", rows)
+
+            ids = dict(connection.execute("SELECT key, pixel_id FROM pixels WHERE run_id = ?", (run_id,)))
+            var_rows = []
+            for row, key in enumerate(keys):
+                for name in variables:
+                    value = results[name][row]
+                    if value is None:
+                        continue
+                    try:
+                        number = float(value)
+                    except ValueError:
+                        number = None
+                    var_rows.append((ids[key], name, str(value), number))
+            connection.executemany("INSERT INTO vars (pixel_id, name, value, num) VALUES (?, ?, ?, ?)", var_rows)
+
+    def _condition(self, text):
+        """SQL (and its parameters) for one filter string"""
+        match = self.FILTER.match(text)
+        if match is None:
+            raise ValueError(f"Can't make sense of the filter '{text}', should be like name=value or name>number")
+        name, operator, value = match.groups()
+        name = {"slot": "sys_label", "date": "run_date"}.get(name, name)
+        wildcard = operator in ("=", "!=") and "*" in value
+        text_operator = ("NOT GLOB" if operator == "!=" else "GLOB") if wildcard else operator
+
+        if name in ID_COLUMNS or name in ("folder", "run_date"):
+            column = f"r.{name}" if name in ("folder", "run_date") else f"p.{name}"
+            if name == "folder" and not wildcard:
+                value = os.path.abspath(value)
+            return f"{column} {text_operator} ?", [value]
+        if name in METRIC_COLUMNS:
+            return f'p."{name}" {operator} ?', [float(value)]
+        # An extra variable, text match for = and !=, numbers for the rest. Looked up through the vars indexes:
+        if operator in ("=", "!="):
+            condition = f"value {'GLOB' if wildcard else '='} ?"
+            membership = "NOT IN" if operator == "!=" else "IN"
         else:
-            return False
+            condition, membership = f"num {operator} ?", "IN"
+            value = float(value)
+        return f"p.pixel_id {membership} (SELECT pixel_id FROM vars WHERE name = ? AND {condition})", [name, value]
 
-if __name__ == '__main__':
-    # Ask user for where the data lives:
-    datapath = input("Please enter the path to your data: ")
+    def query(self, filters=(), since=None, until=None):
+        """
+        Finds pixels.
+        :param filters: Filter strings (see the class docstring), all of them have to match
+        :param since: Only runs measured on or after this date ("YYYY-MM-DD", or with a time too)
+        :param until: Only runs measured before this date
+        :return: List of (folder, run date, results table) per run, oldest run first. The results tables are laid
+        out like analyze_db's, so they go straight into SummaryWriter
+        """
+        conditions, parameters = [], []
+        for text in filters:
+            condition, values = self._condition(text)
+            conditions.append(condition)
+            parameters += values
+        if since is not None:
+            conditions.append("r.run_date >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("r.run_date < ?")
+            parameters.append(until)
+        where = " AND ".join(conditions) or "1"
+        metrics = list(METRIC_COLUMNS)
+        columns = ", ".join([f"p.{name}" for name in ID_COLUMNS] + [f'p."{name}"' for name in metrics])
+        sql = (f"SELECT r.folder, r.run_date, p.pixel_id, {columns} "
+               f"FROM pixels p JOIN runs r USING (run_id) WHERE {where} ORDER BY r.run_date, r.folder, p.pixel_id")
+        with profiled("query", "store", filters=list(filters)):
+            # Filtered once into a temporary table, which the variables are then picked up against:
+            self.connection.execute("DROP TABLE IF EXISTS temp.hits")
+            self.connection.execute(f"CREATE TEMP TABLE hits AS {sql}", parameters)
+            rows = self.connection.execute("SELECT * FROM temp.hits ORDER BY rowid").fetchall()
+            variables = {}
+            for pixel_id, name, value in self.connection.execute(
+                    "SELECT v.pixel_id, v.name, v.value FROM temp.hits h JOIN vars v ON v.pixel_id = h.pixel_id"):
+                variables.setdefault(pixel_id, {})[name] = value
+            self.connection.execute("DROP TABLE temp.hits")
+
+        runs = []
+        for row in rows:
+            if not runs or runs[-1][0] != row[0]:
+                runs.append((row[0], row[1], []))
+            runs[-1][2].append(row)
+        found = []
+        for folder, date, run_rows in runs:
+            names = list(dict.fromkeys(name for row in run_rows for name in variables.get(row[2], {})))
+            results = {name: np.array([row[3 + column] for row in run_rows], dtype=object)
+                       for column, name in enumerate(ID_COLUMNS)}
+            for name in names:
+                results[name] = np.array([variables.get(row[2], {}).get(name) for row in run_rows], dtype=object)
+            for column, name in enumerate(metrics):
+                results[name] = np.array([row[3 + len(ID_COLUMNS) + column] for row in run_rows], dtype=np.float64)
+            found.append((folder, date, results))
+        return found
+
+
+class GroupStats:
+    """
+    Statistics of every metric for groups of pixels, grouped by any combination of the extra variables from the run
+    csvs (composition, anneal temperature...), across as many run folders as it gets given.
+
+    Each folder is boiled down to its share of every group as it's added (pixel counts, the best pixel, and the
+    metric values themselves, so the medians and quartiles come out exact rather than estimated), and the shares
+    just get added onto the totals, so adding a folder never means re-reading or re-analysing the rest of the
+    campaign. Adding a folder again (e.g. it's been re-analysed) swaps its old shares out. The statistics are only
+    worked out, over all the values of a group, when a table is asked for. save()/load() keep the shares between
+    sessions.
+    """
+
+    def __init__(self, by, metrics=None, yield_pce=YIELD_MIN_PCE):
+        """
+        :param by: Names of the variables to group by, pixels without one of them get "" for it
+        :param metrics: Metrics to do, None for every one in METRIC_COLUMNS
+        :param yield_pce: Pixels with a best PCE (of the two light sweeps) at least this count as working for the yield
+        """
+        self.by = tuple(by)
+        self.metrics = tuple(METRIC_COLUMNS) if metrics is None else tuple(metrics)
+        self.yield_pce = yield_pce
+        self.folders = {}  # {folder: {group: share}}, what each folder added
+        self.groups = {}  # {group: share}, all of them added up. group is a tuple of values, in the order of by
+
+    def shares(self, folder, results):
+        """
+        Boils down one folder's results table (see analyze_db) into its share of each group.
+        :return: {group: {"pixels", "working", "values": {metric: [array]}, "best": (best PCE, folder, key, {metric:
+        value}) or None}}
+        """
+        n = len(results["key"])
+        columns = [results[name] if name in results else np.full(n, "", dtype=object) for name in self.by]
+        rows = {}
+        for row, group in enumerate(zip(*columns)):
+            rows.setdefault(tuple("" if value is None else str(value) for value in group), []).append(row)
+        best_pce = np.fmax(results["pce_1"], results["pce_2"]) if n else np.empty(0)
+        shares = {}
+        for group, indices in rows.items():
+            indices = np.array(indices)
+            scores = best_pce[indices]
+            best = None
+            if np.isfinite(scores).any():
+                top = indices[np.nanargmax(scores)]
+                best = (float(best_pce[top]), folder, str(results["key"][top]),
+                        {metric: float(results[metric][top]) for metric in self.metrics})
+            shares[group] = {"pixels": len(indices), "working": int(np.sum(scores >= self.yield_pce)),
+                             "values": {metric: [np.asarray(results[metric][indices], dtype=np.float64)]
+                                        for metric in self.metrics},
+                             "best": best}
+        return shares
+
+    @staticmethod
+    def _merge(into, share):
+        """Adds one share onto another, the value arrays are only concatenated once a table is made"""
+        into["pixels"] += share["pixels"]
+        into["working"] += share["working"]
+        for metric, values in share["values"].items():
+            into["values"][metric].extend(values)
+        if share["best"] is not None and (into["best"] is None or share["best"][0] > into["best"][0]):
+            into["best"] = share["best"]
+
+    def _merge_groups(self, shares):
+        for group, share in shares.items():
+            if group not in self.groups:
+                self.groups[group] = {"pixels": 0, "working": 0, "values": {metric: [] for metric in self.metrics},
+                                      "best": None}
+            self._merge(self.groups[group], share)
+
+    def add(self, folder, results):
+        """Adds (or replaces) a folder's pixels. results is its results table, see analyze_db"""
+        folder = os.path.abspath(folder)
+        shares = self.shares(folder, results)
+        if folder in self.folders:
+            # Only the shares get added up again, nothing gets re-analysed:
+            self.folders[folder] = shares
+            self.groups = {}
+            for previous in self.folders.values():
+                self._merge_groups(previous)
+        else:
+            self.folders[folder] = shares
+            self._merge_groups(shares)
+
+    def merge(self, other):
+        """Adds everything from another GroupStats (same by and metrics), e.g. one that did the other half of a batch"""
+        for folder, shares in other.folders.items():
+            if folder in self.folders:
+                raise ValueError(f"{folder} is in both")
+            self.folders[folder] = shares
+            self._merge_groups(shares)
+
+    def _finished(self):
+        """(group, share, metric, finite values sorted) for every group and metric that has any values"""
+        for group in sorted(self.groups):
+            share = self.groups[group]
+            for metric in self.metrics:
+                values = np.concatenate(share["values"][metric]) if share["values"][metric] else np.empty(0)
+                values = np.sort(values[np.isfinite(values)])
+                if len(values):
+                    yield group, share, metric, values
+
+    def table(self):
+        """
+        The statistics, one row per group and metric (metrics nobody in a group has are left out).
+        :return: List of dicts: the by variables, then metric, pixels (in the group), n (with this metric), yield
+        (fraction of the group working), mean, median, q1, q3, iqr, min, max, best (the value of the best pixel by
+        PCE) and best_pixel ("folder: key")
+        """
+        rows = []
+        for group, share, metric, values in self._finished():
+            q1, median, q3 = np.percentile(values, [25, 50, 75])
+            best = share["best"]
+            rows.append({**dict(zip(self.by, group)), "metric": metric, "pixels": share["pixels"],
+                         "n": len(values), "yield": share["working"] / share["pixels"],
+                         "mean": float(np.mean(values)), "median": float(median), "q1": float(q1), "q3": float(q3),
+                         "iqr": float(q3 - q1), "min": float(values[0]), "max": float(values[-1]),
+                         "best": np.nan if best is None else best[3][metric],
+                         "best_pixel": "" if best is None else f"{best[1]}: {best[2]}"})
+        return rows
+
+    def boxplot_table(self):
+        """
+        Box plot numbers, one per group and metric, with the same keys matplotlib's Axes.bxp takes (whiskers at the
+        furthest points within 1.5 IQR, anything past them in fliers).
+        :return: List of dicts: metric, label (the group as "name=value, ..."), med, q1, q3, whislo, whishi, mean,
+        fliers (list)
+        """
+        boxes = []
+        for group, _, metric, values in self._finished():
+            q1, median, q3 = np.percentile(values, [25, 50, 75])
+            inside = values[(values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))]
+            boxes.append({"metric": metric, "label": ", ".join(f"{name}={value}" for name, value in zip(self.by, group)),
+                          "med": float(median), "q1": float(q1), "q3": float(q3),
+                          "whislo": float(inside[0]), "whishi": float(inside[-1]), "mean": float(np.mean(values)),
+                          "fliers": [float(value) for value in values if value < inside[0] or value > inside[-1]]})
+        return boxes
+
+    def write(self, path):
+        """
+        Writes table() to path (csv, or json if it ends in .json), and boxplot_table() next to it as
+        <name>_boxplot.json.
+        :return: Path of the box plot file
+        """
+        rows = self.table()
+        if path.lower().endswith(".json"):
+            with open(path, 'w') as file:
+                json.dump(rows, file, indent=1, default=float)
+        else:
+            with open(path, 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=[*self.by, "metric", "pixels", "n", "yield", "mean", "median",
+                                                          "q1", "q3", "iqr", "min", "max", "best", "best_pixel"])
+                writer.writeheader()
+                writer.writerows(rows)
+        boxplot_path = f"{os.path.splitext(path)[0]}_boxplot.json"
+        with open(boxplot_path, 'w') as file:
+            json.dump(self.boxplot_table(), file, indent=1)
+        return boxplot_path
+
+    def print_table(self, metrics=("pce_1", "voc_1", "jsc_1", "ff_1")):
+        """Median (IQR) of a few metrics and the yield for every group"""
+        by_group = {}
+        for row in self.table():
+            if row["metric"] in metrics:
+                by_group.setdefault(tuple(row[name] for name in self.by), {})[row["metric"]] = row
+        print(f"  {'Group':<40}{'Pixels':>8}{'Yield':>8}" + "".join(f"{metric:>20}" for metric in metrics))
+        for group, rows in by_group.items():
+            first = next(iter(rows.values()))
+            label = ", ".join(f"{name}={value}" for name, value in zip(self.by, group))
+            print(f"  {label:<40}{first['pixels']:>8}{first['yield']:>8.0%}"
+                  + "".join(f"{rows[metric]['median']:>10.4g} ({rows[metric]['iqr']:.2g})".rjust(20)
+                            if metric in rows else f"{'':>20}" for metric in metrics))
+
+    def save(self, path):
+        """Keeps the shares (not the tables) for next time, see load"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            pickle.dump({"version": 2, "by": self.by, "metrics": self.metrics, "yield_pce": self.yield_pce,
+                         "folders": self.folders}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, by, metrics=None, yield_pce=YIELD_MIN_PCE):
+        """
+        A GroupStats carrying on from one that was saved, or a new one if there's nothing saved for the same by,
+        metrics and yield_pce (any of those changing means the shares don't fit any more).
+        """
+        stats = cls(by, metrics, yield_pce)
+        try:
+            with open(path, 'rb') as file:
+                saved = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return stats
+        if saved.get("version") in (1, 2) and (saved["by"], saved["metrics"], saved["yield_pce"]) == \
+                (stats.by, stats.metrics, stats.yield_pce):
+            for folder, shares in saved["folders"].items():
+                if saved["version"] == 1:  # v1 put pixels missing a variable under "None", now it's ""
+                    shares = {tuple("" if value == "None" else value for value in group): share
+                              for group, share in shares.items()}
+                stats.folders[folder] = shares
+                stats._merge_groups(shares)
+        return stats
+
+
+def run_files(path):
+    """Every file the analysis of a run folder (or archive) depends on, in a fixed order"""
+    if isarchive(path):
+        return [os.path.join(path, name) for name in ("index.json", "data.npy", "offsets.npy")]
+    index = RunIndex(path)
+    return index.csv_files + sorted(file_path for _, _, file_path in index.sweep_files)
+
+
+def folder_state(path):
+    """What has to stay the same for anything worked out from a run folder (or archive) to still count"""
+    return tuple((file_path,) + file_state(file_path) for file_path in run_files(path))
+
+
+class AnalysisServer:
+    """
+    Keeps the most recently used run folders parsed and analysed in memory, and does jobs on them for clients (see
+    AnalysisClient, serve). A folder is only parsed again once something in it changes. Every job is a tuple of its
+    name and arguments, and gets back ("ok", value), or ("error", message) if it went wrong:
+
+    ("analyse", path)          number of pixels, once the folder is in memory
+    ("summary", path)          results table, see analyze_db
+    ("curves", path, key)      {"id": ..., "var": ..., sweep: (4, n) array} for one pixel
+    ("folder", path, keep_db)  (database or None, results), same as process_folder
+    ("folders",)               paths in memory, least recently used first
+    ("forget", path)           drops a folder from memory
+    ("stats",)                 {"jobs", "hits", "loads"} so far
+    ("stop",)                  shuts the server down
+    """
+
+    def __init__(self, cache=None, max_folders=SERVER_MAX_FOLDERS):
+        """
+        :param cache: ResultCache folders that aren't in memory get loaded through, None to parse from scratch
+        :param max_folders: Most folders kept in memory, the least recently used go first
+        """
+        self.cache = cache
+        self.max_folders = max_folders
+        self.hot = {}  # {path: (folder_state, database, results)}, least recently used first
+        self.stats = {"jobs": 0, "hits": 0, "loads": 0}
+        self.stopping = False
+        self.__lock = threading.Lock()  # Held while a folder loads, so two clients don't both parse it
+        self.__stats_lock = threading.Lock()  # Every client has its own thread, and jobs don't wait on loads for this
+
+    def count(self, name):
+        """Adds one to stats[name]"""
+        with self.__stats_lock:
+            self.stats[name] += 1
+
+    def folder(self, path):
+        """(database, results) for a folder, only parsed and analysed if it isn't in memory or has changed since"""
+        state = folder_state(path)
+        with self.__lock:
+            entry = self.hot.pop(path, None)
+            if entry is not None and entry[0] == state:
+                self.count("hits")
+            else:
+                entry = (state,) + process_folder(path, self.cache)
+                self.count("loads")
+            self.hot[path] = entry  # (Back) on the end, as the most recently used
+            while len(self.hot) > self.max_folders:
+                self.hot.pop(next(iter(self.hot)))
+        return entry[1], entry[2]
+
+    def handle(self, job):
+        """Does one job, see the class docstring. Raises ValueError for jobs it doesn't know"""
+        name, *arguments = job
+        self.count("jobs")
+        if name == "analyse":
+            return len(self.folder(*arguments)[1]["key"])
+        if name == "summary":
+            return self.folder(*arguments)[1]
+        if name == "curves":
+            path, key = arguments
+            pixel = self.folder(path)[0][key]
+            curves = {sweep: pixel.get_sweep(sweep) for sweep in SWEEP_TYPES if pixel.get_sweep(sweep) is not None}
+            return {"id": pixel.get_id(), "var": pixel.get_var(), **curves}
+        if name == "folder":
+            path, keep_db = arguments
+            db, results = self.folder(path)
+            return db if keep_db else None, results
+        if name == "folders":
+            with self.__lock:
+                return list(self.hot)
+        if name == "forget":
+            with self.__lock:
+                return self.hot.pop(arguments[0], None) is not None
+        if name == "stats":
+            with self.__stats_lock:
+                return dict(self.stats)
+        if name == "stop":
+            self.stopping = True
+            return True
+        raise ValueError(f"No such job: {name}")
+
+    def talk(self, connection):
+        """Does jobs for one client until it hangs up (or stops the server)"""
+        with connection:
+            while not self.stopping:
+                try:
+                    job = connection.recv()
+                except (EOFError, OSError):
+                    return
+                start = time.perf_counter()
+                try:
+                    reply = ("ok", self.handle(job))
+                except Exception as err:  # One bad job (missing folder, wrong key...) mustn't take the server down
+                    reply = ("error", f"{type(err).__name__}: {err}")
+                print(f"{job[0]} {' '.join(str(argument) for argument in job[1:])}: {reply[0]}, "
+                      f"{(time.perf_counter() - start) * 1e3:.0f} ms")
+                try:
+                    connection.send(reply)
+                except (EOFError, OSError):
+                    return
+
+
+def serve(address=SERVER_ADDRESS, key_file=SERVER_KEY_FILE, cache=None, max_folders=SERVER_MAX_FOLDERS):
+    """
+    Runs an AnalysisServer until a client sends it "stop". Every client gets its own thread. Only clients with the
+    random key written to key_file (readable by this user only) are let in, as jobs come in pickled.
+    :param address: Named pipe (Windows) or unix socket to listen on
+    :param key_file: Where the key goes
+    :param cache: See AnalysisServer
+    :param max_folders: See AnalysisServer
+    """
+    running = connect_server(address, key_file)
+    if running is not None:
+        running.close()
+        print(f"There's already an analysis server on {address}")
+        return
+    # makedirs and os.open only use the mode for things they create, so whatever was already there gets tightened too:
+    if not address.startswith("\\\\"):
+        os.makedirs(os.path.dirname(address), mode=0o700, exist_ok=True)
+        os.chmod(os.path.dirname(address), 0o700)
+        if os.path.exists(address):
+            os.remove(address)  # Left over from a server that didn't get to tidy up
+    os.makedirs(os.path.dirname(key_file), mode=0o700, exist_ok=True)
+    os.chmod(os.path.dirname(key_file), 0o700)
+    authkey = os.urandom(32)
+    with os.fdopen(os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as file:
+        os.chmod(key_file, 0o600)
+        file.write(authkey)
+
+    server = AnalysisServer(cache, max_folders)
+    with Listener(address, authkey=authkey) as listener:
+        print(f"Analysis server listening on {address}, Ctrl+C to stop")
+        try:
+            while not server.stopping:  # Whoever stops the server knocks again after, so this gets looked at
+                try:
+                    connection = listener.accept()
+                except AuthenticationError:
+                    continue
+                threading.Thread(target=server.talk, args=(connection,), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+    print(f"Analysis server stopped after {server.stats['jobs']} jobs "
+          f"({server.stats['hits']} from memory, {server.stats['loads']} loaded)")
+
+
+class AnalysisClient:
+    """Sends jobs to a running AnalysisServer (see serve), one method per job. Errors on the server raise RuntimeError"""
+
+    def __init__(self, address=SERVER_ADDRESS, key_file=SERVER_KEY_FILE):
+        with open(key_file, 'rb') as file:
+            authkey = file.read()
+        self.address = address
+        self.__authkey = authkey
+        self.connection = Client(address, authkey=authkey)
+
+    def job(self, name, *arguments):
+        self.connection.send((name, *arguments))
+        status, value = self.connection.recv()
+        if status != "ok":
+            raise RuntimeError(f"The analysis server couldn't do {name}: {value}")
+        return value
+
+    # Paths are made absolute, the server isn't running wherever this is:
+    def analyse(self, path):
+        return self.job("analyse", os.path.abspath(path))
+
+    def summary(self, path):
+        return self.job("summary", os.path.abspath(path))
+
+    def curves(self, path, key):
+        return self.job("curves", os.path.abspath(path), key)
+
+    def folder(self, path, keep_db=True):
+        return self.job("folder", os.path.abspath(path), keep_db)
+
+    def folders(self):
+        return self.job("folders")
+
+    def forget(self, path):
+        return self.job("forget", os.path.abspath(path))
+
+    def stats(self):
+        return self.job("stats")
+
+    def stop(self):
+        self.job("stop")
+        self.close()
+        try:  # Knock, so the server stops waiting for the next client
+            Client(self.address, authkey=self.__authkey).close()
+        except (OSError, EOFError):
+            pass
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def connect_server(address=SERVER_ADDRESS, key_file=SERVER_KEY_FILE):
+    """AnalysisClient for the server if there's one running, None if not"""
+    try:
+        return AnalysisClient(address, key_file)
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+
+def write_stats(stats, path=None, state=None):
+    """Prints and writes out a GroupStats at the end of main, and keeps its shares in state (if given)"""
+    print(f"\nBy {', '.join(stats.by)}, median (IQR):")
+    stats.print_table()
+    path = path or "a4_stats.csv"
+    boxplot_path = stats.write(path)
+    print(f"Statistics of {len(stats.groups)} groups written to {path}, box plots to {boxplot_path}")
+    if state is not None:
+        stats.save(state)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="a^4.py",
+        description="Akash's amazing analysis automator. With no paths it asks for one, like it does inside Origin.")
+    parser.add_argument("paths", nargs="*",
+                        help="Run folders, archives, or folders of them (see --depth)")
+    parser.add_argument("--depth", type=int, default=1,
+                        help="How many levels below each path to look for run folders (default: 1)")
+    parser.add_argument("-r", "--recursive", action="store_const", const=None, dest="depth",
+                        help="Look for run folders at any depth below each path, remembering what was found so the "
+                             "next look only goes through folders that changed")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Processes to parse and analyse with (default: one per CPU, 1 for no pool)")
+    parser.add_argument("-o", "--output",
+                        help="Write the summary table here as well, one row per pixel")
+    parser.add_argument("--format", choices=SUMMARY_FORMATS,
+                        help="Format of --output (default: from its extension, csv if it hasn't got one)")
+    parser.add_argument("--no-origin", action="store_true",
+                        help="Don't plot anything, just analyse (and write --output, a4_summary.csv by default)")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use or fill the results cache")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, metavar="DIR",
+                        help=f"Where the results cache lives, kept under {CACHE_MAX_BYTES / 1024**3:g} GB "
+                             "(default: %(default)s)")
+    parser.add_argument("--store", action="store_true", default=RESULTS_DB is not None,
+                        help="Also put every result in the --db results database, so --query can find it later")
+    parser.add_argument("--no-store", action="store_false", dest="store", help="Don't, even if RESULTS_DB is set")
+    parser.add_argument("--db", default=RESULTS_DB or RESULTS_DB_DEFAULT,
+                        help="SQLite results database for --store and --query (default: %(default)s)")
+    parser.add_argument("--query", nargs="*", metavar="FILTER",
+                        help="Search the --db database instead of analysing anything, e.g. --query additive=X "
+                             "\"pce_1>20\" (nothing after it lists everything)")
+    parser.add_argument("--since", help="With --query, only runs measured on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="With --query, only runs measured before this date")
+    parser.add_argument("--group-by", nargs="+", metavar="VARIABLE",
+                        help="Statistics of every metric for each combination of these run csv variables, over all "
+                             "the runs (also works with --query)")
+    parser.add_argument("--stats", help="Where --group-by writes its table (csv or json, default a4_stats.csv), the box "
+                                        "plot numbers go next to it")
+    parser.add_argument("--stats-state", metavar="FILE",
+                        help="Keep what --group-by has gathered here, so later runs add onto it")
+    parser.add_argument("--lazy", action="store_true", default=LAZY_GRAPHS,
+                        help="Only draw the best --top pixels up front, the rest when clicked on")
+    parser.add_argument("--top", type=int, default=RENDER_TOP, help="Pixels drawn up front with --lazy")
+    parser.add_argument("--plot-points", type=int, default=PLOT_MAX_POINTS,
+                        help="Most points per plotted curve, longer traces get downsampled (0 for all of them)")
+    parser.add_argument("--render", metavar="DIR",
+                        help="Draw the graphs with matplotlib into this folder (with an index.html), instead of Origin")
+    parser.add_argument("--render-format", choices=RENDER_FORMATS, default="png", help="Image format for --render")
+    parser.add_argument("--watch", action="store_true",
+                        help="Follow a run while it is being measured (one path, a run folder)")
+    parser.add_argument("--pack", action="store_true", help="Pack the run folders into archives and stop")
+    parser.add_argument("--dest", help="Where --pack puts the archives (default: next to each run folder)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Start the resident analysis server, which keeps recent folders in memory for later runs")
+    parser.add_argument("--stop-server", action="store_true", help="Stop the resident analysis server")
+    parser.add_argument("--no-server", action="store_true",
+                        help="Do everything here even if the analysis server is running")
+    parser.add_argument("--profile", metavar="TRACE",
+                        help="Time everything and write a trace (.json for chrome://tracing, .jsonl for lines)")
+    return parser
+
+
+def main(argv=None):
+    """Runs A^4 on the command line (see build_parser), or interactively when given no paths"""
+    global op, PROFILER, PLOT_MAX_POINTS
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    PLOT_MAX_POINTS = args.plot_points or None
+    plot = args.render is not None or ("op" in globals() and not args.no_origin)
+    output, fmt = args.output, args.format
+    if output is None and (fmt is not None or args.no_origin):
+        output = f"a4_summary.{fmt or 'csv'}"
+    if output is not None and fmt is None:
+        extension = os.path.splitext(output)[1].lstrip('.').lower()
+        fmt = extension if extension in SUMMARY_FORMATS else "csv"
+    if args.watch and len(args.paths) != 1:
+        parser.error("--watch needs exactly one run folder")
+
+    cache = None if args.cache_dir is None or args.no_cache else ResultCache(args.cache_dir)
+    if cache is not None and not os.path.isdir(cache.cache_dir):
+        print(f"Parsed runs will be cached in {cache.cache_dir} (up to {cache.max_bytes / 1024**3:.3g} GB, the least "
+              f"recently used go first) so they open faster next time. --no-cache turns that off, --cache-dir "
+              f"moves it")
+    if args.profile:
+        PROFILER = Profiler()
+        if "op" in globals():
+            op = PROFILER.wrap_origin(op)
+    try:
+        writer = None if output is None else SummaryWriter(output, fmt)
+    except (ValueError, ModuleNotFoundError) as err:
+        parser.error(str(err))
+    if args.query is not None and not os.path.isfile(args.db):
+        parser.error(f"There's no results database at {args.db}, analyse some runs with --store first")
+    store = ResultStore(args.db) if args.store or args.query is not None else None
+    stats = None
+    if args.group_by:
+        stats = GroupStats(args.group_by) if args.stats_state is None else GroupStats.load(args.stats_state,
+                                                                                            args.group_by)
+    backend = None
+    if args.render is not None and args.query is None and not (args.pack or args.serve or args.stop_server):
+        try:
+            backend = MatplotlibBackend(args.render, args.render_format, args.workers)
+        except (ValueError, ModuleNotFoundError) as err:
+            parser.error(str(err))
+
+    if args.query is not None:
+        try:
+            found = store.query(args.query, args.since, args.until)
+        except ValueError as err:
+            parser.error(str(err))
+        columns = RunWatcher.TABLE_COLUMNS
+        for folder, date, results in found:
+            print(f"\n{date}  {folder}")
+            variables = var_columns(results)
+            print(f"  {'Pixel':<30}" + "".join(f"{name:>14}" for name in variables)
+                  + "".join(f"{heading:>12}" for heading in columns.values()))
+            for row, key in enumerate(results["key"]):
+                print(f"  {key:<30}" + "".join(f"{str(results[name][row]):>14}" for name in variables)
+                      + "".join(f"{results[name][row]:>12.4g}" for name in columns))
+            if writer is not None:
+                writer.write(folder, results)
+            if stats is not None:
+                stats.add(folder, results)
+        print(f"\n{sum(len(results['key']) for _, _, results in found)} pixels in {len(found)} runs")
+        if stats is not None:
+            write_stats(stats, args.stats, args.stats_state)
+        if writer is not None:
+            writer.close()
+            print(f"Written to {writer.path}")
+        store.close()
+        return
+
+    if args.serve:
+        serve(cache=cache)
+        return
+    if args.stop_server:
+        client = connect_server()
+        if client is None:
+            print("The analysis server isn't running")
+        else:
+            client.stop()
+        return
+
+    if args.pack:
+        for path in args.paths:
+            convert_tree(path, args.dest, args.workers, cache, args.depth)
+        return
+
+    paths = args.paths
+    if not paths:
+        # Ask user for where the data lives:
+        paths = [input("Please enter the path to your data: ")]
     print_logo()  # most important part of the code, without a doubt
-    
-    
 
-    if isdatafolder(datapath):
-        print('Running on single directory mode')
-        database = create_db(datapath)
-        err = origin_create_plots(database)
-        print("\n\nALL DONE!! You can close this window now") 
-        
+    if args.watch:
+        watcher = RunWatcher(paths[0], cache)
+        results = watcher.run()
+        if writer is not None:
+            writer.write(paths[0], results)
+        if store is not None and len(results["key"]):
+            store.upsert(paths[0], results)
+        if stats is not None:
+            stats.add(paths[0], results)
+        if plot and len(results["key"]):
+            err = origin_create_plots(watcher.db, results, args.lazy, args.top, backend=backend, name=paths[0])
     else:
-        for root,dirs,files in os.walk(datapath):
-            for dir in dirs:
-                if isdatafolder(f"{datapath}/{dir}"):
-                    print('Running on multi directory mode')
-                    break
-                
-                
-            for dir in dirs: 
-                # checks directories are ok
-                if isdatafolder(f"{datapath}/{dir}"):
-                    database = create_db(f"{datapath}/{dir}")
-                    err = origin_create_plots(database)
-                   
-            break
-            
+        folders = [folder for path in paths for folder in find_data_folders(path, args.depth)]
+        if folders == paths[:1] and len(paths) == 1:
+            print('Running on single directory mode')
+        elif folders:
+            print('Running on multi directory mode')
+        else:
+            print(f"Couldn't find any run folders in {', '.join(paths)}")
+        client = None if args.no_server else connect_server()
+        if client is not None:
+            print("Getting the data from the analysis server")
+        if plot and len(folders) == 1 and client is None:
+            # Only the one folder to overlap Origin with, so its pixels get parsed while the earlier ones are drawn:
+            database, results = plot_folder(folders[0], cache, args.lazy, args.top, backend)
+            if writer is not None:
+                writer.write(folders[0], results)
+            if store is not None:
+                store.upsert(folders[0], results)
+            if stats is not None:
+                stats.add(folders[0], results)
+        else:
+            # The pool's workers (or the server) parse the folders and only send the results back, the curves are read
+            # again here to be plotted. Without a cache the pool's would be parsed twice, so it gets a throwaway one:
+            scratch = plot and cache is None and client is None and len(folders) > 1 and args.workers != 1
+            with scratch_cache() if scratch else nullcontext(cache) as folder_cache:
+                processed = (process_folders(folders, args.workers, folder_cache, keep_db=False) if client is None
+                             else ((folder,) + client.folder(folder, keep_db=False) for folder in folders))
+                for folder, database, results in processed:
+                    if writer is not None:
+                        writer.write(folder, results)
+                    if store is not None:
+                        store.upsert(folder, results)
+                    if stats is not None:
+                        stats.add(folder, results)
+                    if plot:
+                        pixels = None
+                        if database is None:  # Just the numbers, the curves get read again a pixel at a time
+                            database, pixels = {}, prefetch(iter_plot_pixels(folder, results, folder_cache))
+                        with profiled_context(folder=folder):
+                            err = origin_create_plots(database, results, args.lazy, args.top, pixels=pixels,
+                                                      release=True, backend=backend, name=folder)
+        if client is not None:
+            client.close()
+        print("\n\nALL DONE!! You can close this window now")
+
+    if backend is not None:
+        backend.close()
+    if stats is not None:
+        write_stats(stats, args.stats, args.stats_state)
+    if writer is not None:
+        writer.close()
+        print(f"Summary of {writer.rows} pixels written to {writer.path}")
+    if store is not None:
+        store.close()
+    if cache is not None:
+        cache.evict()
+        cache.report()
+    if PROFILER is not None:
+        PROFILER.write_trace(args.profile)
+        PROFILER.summary()
+        print(f"Full trace in {args.profile}")
+
 
-       
+if __name__ == '__main__':
+    # Origin's embedded python doesn't always give us an argv, which just means no arguments:
+    main(sys.argv[1:] if hasattr(sys, "argv") else [])
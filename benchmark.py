@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+BENCHMARKS FOR A^4.
+
+Makes realistic fake run folders (diode model JV curves, MPPT traces, the lot) and times each stage of A^4 on them:
+finding the files, parsing, analysis, and plotting into a FakeOrigin (so no Origin needed). Timings can be saved as a
+baseline, and later runs get compared against it to catch anything that got slower.
+
+python benchmark.py                   run, compare against the baseline if there is one
+python benchmark.py --save            run and save the results as the new baseline
+python benchmark.py --pixels 48 ...   bigger/smaller runs, see --help
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import importlib.util
+
+import numpy as np
+
+
+def load_a4():
+    """Imports a^4.py (which can't be imported by name, thanks to the ^)"""
+    spec = importlib.util.spec_from_file_location("a4", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                     "a^4.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["a4"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+a4 = load_a4()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests"))
+from fake_origin import FakeOrigin  # noqa: E402
+
+
+def diode_current(v, jsc, j0, n, rs, rsh, temp=300.0):
+    """
+    Current density of a single diode solar cell, solved with a few Newton steps since Rs makes it implicit.
+    :param v: Voltages (V)
+    :param jsc: Photocurrent (mA/cm^2), 0 for a dark curve
+    :param j0: Saturation current (mA/cm^2)
+    :param n: Ideality factor
+    :param rs: Series resistance (ohm cm^2)
+    :param rsh: Shunt resistance (ohm cm^2)
+    :param temp: Temperature (K)
+    :return: Current densities (mA/cm^2), negative in the power quadrant like the real files
+    """
+    vt = n * 1.380649e-23 * temp / 1.602176634e-19
+    j = np.full_like(v, -jsc, dtype=np.float64)
+    for _ in range(50):
+        vd = v - j * 1e-3 * rs  # j in mA, drop across rs in V
+        exp_term = j0 * np.exp(np.minimum(vd / vt, 200))
+        f = -jsc + exp_term - j0 + vd / rsh * 1e3 - j
+        df = -exp_term * 1e-3 * rs / vt - 1e-3 * rs / rsh * 1e3 - 1
+        j = j - f / df
+    return j
+
+
+def write_tsv(file_path, v, i, t):
+    """Writes one sweep file the way the Wavelabs software does"""
+    data = np.column_stack([v, i, t, np.zeros_like(v)])
+    np.savetxt(file_path, data, delimiter='\t', fmt='%.10g',
+               header='voltage (V)\tcurrent (A)\ttime (s)\tstatus', comments='')
+
+
+def make_run(path, substrates=6, pixels=24, points=200, mppt_seconds=300.0, mppt_rate=10.0, seed=0):
+    """
+    Makes a fake run folder: the run csv (with a couple of extra variable columns), the yaml and all seven sweep files
+    for every pixel.
+    :param path: Folder to make
+    :param substrates: Number of substrates (slots)
+    :param pixels: Pixels per substrate
+    :param points: Points per JV sweep
+    :param mppt_seconds: Length of the MPPT trace
+    :param mppt_rate: MPPT points per second
+    :param seed: Random seed, same seed same data
+    :return: path
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    slots = [chr(ord('A') + index) for index in range(substrates)]
+    area, dark_area = 0.1, 0.15
+    rows = []
+    for slot_number, slot in enumerate(slots):
+        for pad in range(1, pixels + 1):
+            rows.append((slot, f"sub{slot_number}", pad, ["FAPbI3", "CsFAPbI3"][slot_number % 2],
+                         str(100 + 10 * (slot_number // 2))))
+    with open(os.path.join(path, "run.csv"), 'w') as file:
+        file.write("slot,user_label,area,dark_area,layout,pad,composition,anneal_temp\n")
+        for slot, label, pad, composition, anneal in rows:
+            file.write(f"{slot},{label},{area},{dark_area},30x30,{pad},{composition},{anneal}\n")
+    with open(os.path.join(path, "run.yaml"), 'w') as file:
+        file.write("# fake run made by benchmark.py\nsmu:\n  nplc: 1\n")
+
+    v_sweep = np.linspace(-0.2, 1.2, points)
+    t_sweep = np.arange(points) * 0.05
+    t_mppt = 1000 + np.arange(int(mppt_seconds * mppt_rate)) / mppt_rate
+    t_stable = 1000 + np.arange(int(10 * mppt_rate)) / mppt_rate
+    for slot, label, pad, _, _ in rows:
+        stem = os.path.join(path, f"{slot}_{label}_device{pad}_1600000000")
+        jsc = rng.normal(22, 1)
+        params = dict(j0=10 ** rng.uniform(-11, -9), n=rng.uniform(1.2, 1.8),
+                      rs=rng.uniform(1, 5), rsh=10 ** rng.uniform(2.5, 4))
+        scale = area / 1e3  # mA/cm^2 to A
+        for index, direction in ((1, 1), (2, -1)):
+            v = v_sweep[::direction]
+            t = t_sweep + index * t_sweep[-1]
+            light = diode_current(v, jsc * (1 - 0.01 * index), **params) + rng.normal(0, 0.02, points)
+            dark = diode_current(v, 0, **params)
+            write_tsv(f"{stem}.liv{index}.tsv", v, light * scale, t)
+            write_tsv(f"{stem}.div{index}.tsv", v, dark * dark_area / 1e3, t)
+
+        v_grid = np.linspace(0, 1.2, 2000)
+        j_grid = diode_current(v_grid, jsc, **params)
+        best = np.argmin(v_grid * j_grid)
+        decay = 1 - 0.1 * (1 - np.exp(-(t_mppt - t_mppt[0]) / (mppt_seconds / 3)))
+        write_tsv(f"{stem}.mppt.tsv", v_grid[best] + rng.normal(0, 0.002, len(t_mppt)),
+                  j_grid[best] * decay * scale + rng.normal(0, 1e-6, len(t_mppt)), t_mppt)
+        voc = v_grid[np.argmin(np.abs(j_grid))]
+        write_tsv(f"{stem}.vt.tsv", voc + rng.normal(0, 0.001, len(t_stable)), np.zeros(len(t_stable)), t_stable)
+        write_tsv(f"{stem}.it.tsv", np.zeros(len(t_stable)),
+                  -jsc * scale + rng.normal(0, 1e-6, len(t_stable)), t_stable)
+    return path
+
+
+def folder_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def measure(function, repeat):
+    """
+    Best time out of repeat goes, and the peak memory of one go.
+    :return: (seconds, peak bytes, what function returned)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, result
+
+
+def run_benchmarks(path, repeat=3):
+    """
+    Times every stage on one run folder.
+    :param path: Run folder (e.g. from make_run)
+    :param repeat: Goes per stage, the best one counts
+    :return: {stage: {"seconds", "peak_mb", "pixels_per_s", "mb_per_s"}}
+    """
+    size_mb = folder_bytes(path) / 1e6
+    keys = list(a4.read_run_csv(a4.RunIndex(path).csv_files[0]).keys())
+    n_pixels = len(keys)
+
+    def old_discovery():
+        return [a4.find_starts_with(key, path) for key in keys]
+
+    def discovery():
+        index = a4.RunIndex(path)
+        return index.match(keys)
+
+    def parse():
+        return a4.create_db(path)
+
+    db = parse()
+
+    def analysis():
+        return a4.analyze_db(db)
+
+    results = analysis()
+
+    def plotting():
+        a4.op = FakeOrigin()
+        a4.origin_create_plots(db, results)
+        return a4.op
+
+    stages = {"find_starts_with": old_discovery, "discovery": discovery, "create_db": parse,
+              "analyze_db": analysis, "origin_create_plots": plotting}
+    report = {}
+    for name, function in stages.items():
+        seconds, peak, returned = measure(function, repeat)
+        report[name] = {"seconds": seconds, "peak_mb": peak / 1e6,
+                        "pixels_per_s": n_pixels / seconds if seconds else float('inf'),
+                        "mb_per_s": size_mb / seconds if seconds else float('inf')}
+        if name == "origin_create_plots":
+            report[name]["origin_calls"] = sum(returned.calls.values())
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Checks a report against a baseline.
+    :param tolerance: How much slower (as a fraction) a stage is allowed to get
+    :return: List of (stage, baseline seconds, now seconds) for every stage that got too slow
+    """
+    regressions = []
+    for name, now in report.items():
+        if name in baseline and now["seconds"] > baseline[name]["seconds"] * (1 + tolerance):
+            regressions.append((name, baseline[name]["seconds"], now["seconds"]))
+    return regressions
+
+
+def print_report(report, baseline=None):
+    print(f"{'Stage':<22}{'Time (ms)':>12}{'Pixels/s':>12}{'MB/s':>10}{'Peak (MB)':>11}{'vs baseline':>13}")
+    for name, row in report.items():
+        change = ""
+        if baseline and name in baseline and baseline[name]["seconds"]:
+            change = f"{row['seconds'] / baseline[name]['seconds'] - 1:+.0%}"
+        print(f"{name:<22}{row['seconds'] * 1e3:>12.1f}{row['pixels_per_s']:>12.0f}{row['mb_per_s']:>10.1f}"
+              f"{row['peak_mb']:>11.1f}{change:>13}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks A^4 on generated data")
+    parser.add_argument("--substrates", type=int, default=6)
+    parser.add_argument("--pixels", type=int, default=24, help="Pixels per substrate")
+    parser.add_argument("--points", type=int, default=200, help="Points per JV sweep")
+    parser.add_argument("--mppt-seconds", type=float, default=300.0, help="Length of each MPPT trace")
+    parser.add_argument("--mppt-rate", type=float, default=10.0, help="MPPT points per second")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data", help="Where to make the fake run (default: a temporary folder)")
+    parser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           "benchmark_baseline.json"))
+    parser.add_argument("--save", action="store_true", help="Save this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="How much slower than the baseline counts as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_path = args.data or os.path.join(temp_dir, "run")
+        if not a4.isdatafolder(data_path):
+            print(f"Making {args.substrates * args.pixels} fake pixels in {data_path}...")
+            make_run(data_path, args.substrates, args.pixels, args.points, args.mppt_seconds, args.mppt_rate)
+        report = run_benchmarks(data_path, args.repeat)
+
+    baseline = None
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+    print_report(report, None if args.save else baseline)
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Saved as the baseline: {args.baseline}")
+    elif baseline:
+        regressions = compare(report, baseline, args.tolerance)
+        for name, before, now in regressions:
+            print(f"REGRESSION: {name} took {now * 1e3:.1f} ms, baseline was {before * 1e3:.1f} ms")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Shared bits for the tests: a^4.py loaded as the module a4 (through benchmark.py, which also makes the fake runs),
+a small fake run folder, and a FakeOrigin standing in for originpro.
+
+Run them from the top folder with: python -m pytest
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import benchmark  # noqa: E402
+from fake_origin import FakeOrigin  # noqa: E402
+
+a4 = benchmark.a4
+
+
+@pytest.fixture(scope="session")
+def run_folder(tmp_path_factory):
+    """A fake run: 2 substrates of 4 pixels, all seven sweeps each. Shared, so don't change it"""
+    return benchmark.make_run(str(tmp_path_factory.mktemp("runs") / "run"), substrates=2, pixels=4, points=120,
+                              mppt_seconds=30.0)
+
+
+@pytest.fixture
+def fake_origin(monkeypatch):
+    origin = FakeOrigin()
+    monkeypatch.setattr(a4, "op", origin, raising=False)
+    return origin
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in for the originpro module, for the tests and benchmark.py, which run without Origin. Nothing gets drawn, but
+what gets written to sheets is kept so it can be checked, and every call that would have gone across to Origin is
+counted.
+"""
+
+import os
+import re
+from collections import Counter
+
+
+def column_index(col):
+    """Origin takes columns as an index from 0 or a letter name ('A', 'B', ... 'AA'), this makes it the index"""
+    if isinstance(col, str):
+        index = 0
+        for letter in col.upper():
+            index = index * 26 + ord(letter) - ord('A') + 1
+        return index - 1
+    return col
+
+
+class FakeOrigin:
+    """
+    Stands in for the originpro module when there's no Origin (tests, benchmarks, trying the plotting code on
+    Linux...): a4.op = FakeOrigin(). Nothing gets drawn, but every call that would have gone across to Origin is
+    counted in self.calls, by name, which is what makes Origin slow. The Project Explorer folder the LabTalk pe_cd
+    commands have moved to is kept track of, and every sheet and graph knows which folder it was made in.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.sheets = []  # Newest last
+        self.graphs = []  # Newest first, same as op.graph_list()
+        self.folder = "/"
+
+    def count(self, name):
+        self.calls[name] += 1
+
+    def __getattr__(self, name):
+        # Anything not faked below just gets counted and does nothing
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.count(name)
+
+    def lt_exec(self, script):
+        self.count("lt_exec")
+        for command in script.split(";"):
+            match = re.match(r'\s*pe_cd\s+"?([^"]*)"?\s*$', command)
+            if match is not None:
+                name = match.group(1)
+                self.folder = "/" if name == "/" else f"{self.folder.rstrip('/')}/{name}"
+
+    def path(self, kind='u'):
+        self.count("path")
+        return os.getcwd()
+
+    def new_sheet(self, type='w', lname='', template='', hidden=False):
+        self.count("new_sheet")
+        self.sheets.append(FakeSheet(self, lname, self.folder))
+        return self.sheets[-1]
+
+    def new_graph(self, lname='', template='', hidden=False):
+        self.count("new_graph")
+        self.graphs.insert(0, FakeGraph(self, f"Graph{len(self.graphs) + 1}", lname, self.folder))
+        return self.graphs[0]
+
+    def graph_list(self):
+        self.count("graph_list")
+        return list(self.graphs)
+
+
+class FakeSheet:
+    """Worksheet of a FakeOrigin, keeps hold of whatever gets written to it so it can be checked"""
+
+    def __init__(self, origin, lname, folder):
+        self.origin = origin
+        self.lname = lname
+        self.folder = folder
+        self.data = {}  # column index: data
+        self.labels = {}  # label type ('L', 'U', 'C'): list
+        self.designations = ''
+        self.__cols = 2
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.origin.count(f"wks.{name}")
+
+    @property
+    def cols(self):
+        return self.__cols
+
+    @cols.setter
+    def cols(self, value):
+        self.origin.count("wks.cols")
+        self.__cols = value
+
+    def from_list(self, col, data, lname='', units='', comments='', axis='', start=None):
+        """Fills a column, or with start, writes over just the rows from there on and leaves the rest"""
+        self.origin.count("wks.from_list")
+        col = column_index(col)
+        column = [] if start is None else self.data.get(col, [])
+        start = start or 0
+        column.extend([''] * (start + len(data) - len(column)))
+        column[start:start + len(data)] = list(data)
+        self.data[col] = column
+        # Labels and designation of just this column, same as Origin:
+        for type_, label in (('L', lname), ('U', units), ('C', comments)):
+            if label:
+                labels = self.labels.setdefault(type_, [])
+                labels.extend([''] * (col + 1 - len(labels)))
+                labels[col] = label
+        if axis:
+            designations = self.designations.ljust(col + 1, 'y')
+            self.designations = designations[:col] + axis.lower() + designations[col + 1:]
+
+    def from_df(self, df, c1=0, head=''):
+        self.origin.count("wks.from_df")
+        for offset, name in enumerate(df.columns):
+            self.data[c1 + offset] = df[name].tolist()
+
+    def set_labels(self, labels, type_='L', offset=0):
+        self.origin.count("wks.set_labels")
+        self.labels[type_] = list(labels)
+
+    def cols_axis(self, types, c1=0, c2=-1, repeat=True):
+        self.origin.count("wks.cols_axis")
+        self.designations = types
+
+
+class FakeGraph:
+    """Graph of a FakeOrigin, every layer is the graph itself, which is good enough to add plots to"""
+
+    def __init__(self, origin, name, lname, folder):
+        self.origin = origin
+        self.name = name
+        self.lname = lname
+        self.folder = folder
+        self.plotted = []  # What add_plot was given, on any layer
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.origin.count(f"graph.{name}")
+
+    def add_plot(self, obj, coly='', colx='', type=''):
+        self.origin.count("graph.add_plot")
+        self.plotted.append(obj)
+
+    def __getitem__(self, index):
+        return self
+
+    def add_layer(self, type='noxy'):
+        self.origin.count("graph.add_layer")
+        return self
+
+    def get_str(self, name):
+        return self.name
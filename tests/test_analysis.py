@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""The number crunching: figures of merit and the diode fits, on curves where the right answer is known"""
+
+import numpy as np
+import pytest
+
+from conftest import a4
+
+V = np.linspace(-0.2, 1.2, 200)
+# jph, j0 (A/cm^2), n, rs, rsh (ohm cm^2) of a few made up cells:
+CELLS = np.array([[22e-3, 1e-10, 1.3, 2.0, 5e3],
+                  [20e-3, 1e-9, 1.7, 4.0, 800.0],
+                  [24e-3, 3e-11, 1.5, 1.0, 2e4]])
+
+
+def padded(cells, jph=True):
+    curves = [(V, a4.diode_current(V, cell[0] if jph else 0, *cell[1:])) for cell in cells]
+    return a4.pad_sweeps(curves)
+
+
+def fit_all(light_cells, dark_cells):
+    light = {1: padded(light_cells), 2: padded(light_cells)}
+    dark = {1: padded(dark_cells, jph=False), 2: padded(dark_cells, jph=False)}
+    metrics = {}
+    for index in (1, 2):
+        for name, values in zip(("voc", "jsc", "vmp", "jmp", "ff", "pce"), a4.solve_light_iv(*light[index])):
+            metrics[f"{name}_{index}"] = values
+    return a4.diode_fits(light, dark, metrics)
+
+
+def grid_search(v, j):
+    """How the figures of merit used to be worked out, with interp1d and a 10000 point grid"""
+    interpolate = pytest.importorskip("scipy.interpolate")
+    j_from_v = interpolate.interp1d(v, j, bounds_error=False)
+    voc, jsc = float(interpolate.interp1d(j, v, bounds_error=False)(0)), float(j_from_v(0))
+    grid = np.arange(min(v), max(v), (max(v) - min(v)) / 10000)
+    best = np.nanargmin(grid * j_from_v(grid))
+    vmp, jmp = grid[best], float(j_from_v(grid[best]))
+    return voc, jsc, vmp, jmp, (vmp * jmp) / (voc * jsc), abs(vmp * jmp), (max(v) - min(v)) / 10000
+
+
+def test_light_iv_matches_grid_search(run_folder):
+    curves = [(V, a4.diode_current(V, *cell)) for cell in CELLS]
+    for pixel in a4.create_db(run_folder).values():
+        area = float(pixel.get_id()["area"])
+        curves += [(sweep[0], sweep[1] * 1e3 / area) for sweep in pixel.get_light_iv()]
+    found = np.array(a4.solve_light_iv(*a4.pad_sweeps(curves))).T
+    for (v, j), (voc, jsc, vmp, jmp, ff, pce) in zip(curves, found):
+        old_voc, old_jsc, old_vmp, old_jmp, old_ff, old_pce, step = grid_search(v, j)
+        assert voc == pytest.approx(old_voc, rel=1e-9) and jsc == pytest.approx(old_jsc, rel=1e-9)
+        # Exact now, so never below the grid's answer, and above it by no more than the power changes over a grid step
+        # (V*J is a parabola on every segment, so its slope is steepest at the measured points):
+        slope = np.diff(j) / np.diff(v)
+        missed = step * np.max(np.abs(np.concatenate([j[:-1] + v[:-1] * slope, j[1:] + v[1:] * slope])))
+        assert abs(vmp - old_vmp) <= 2 * step
+        assert old_pce - 1e-12 <= pce <= old_pce + missed
+        assert abs(ff - old_ff) <= missed / abs(voc * jsc)
+
+
+def assert_cells(fits, sweep, cells, rtol):
+    assert np.allclose(fits[f"n_{sweep}"], cells[:, 2], rtol=rtol)
+    assert np.allclose(fits[f"rs_{sweep}"], cells[:, 3], rtol=rtol)
+    assert np.allclose(fits[f"rsh_{sweep}"], cells[:, 4], rtol=rtol)
+    assert np.allclose(fits[f"j0_{sweep}"], cells[:, 1] * 1e3, rtol=10 * rtol)
+
+
+def test_fits_find_known_parameters():
+    fits = fit_all(CELLS, CELLS)
+    for sweep in ("1", "2", "d1", "d2"):
+        assert_cells(fits, sweep, CELLS, rtol=0.01)
+
+
+def test_dark_fits_dont_inherit_a_bad_warm_start():
+    # The light curves belong to a very different cell, so starting the dark fits from them is a bad start:
+    light_cells = CELLS.copy()
+    light_cells[:, 2], light_cells[:, 3], light_cells[:, 4] = 3.0, 30.0, 60.0
+    fits = fit_all(light_cells, CELLS)
+    assert_cells(fits, "d1", CELLS, rtol=0.01)
+    assert np.all(fits["rmse_d1"] < 1e-3)
+
+
+def test_parameter_on_a_limit_is_nan():
+    # No shunt to speak of, so Rsh runs off to its upper limit: that's not a number worth reporting
+    cell = CELLS[:1].copy()
+    cell[0, 4] = 1e14
+    seeds = np.tile([0, 1e-12, 1.5, 1.0, 1e4], (1, 1))
+    params, rmse, settled = a4.fit_diode(*padded(cell, jph=False), seeds, dark=True)
+    assert np.isnan(params[0, 4])
+    assert np.isclose(params[0, 2], 1.3, rtol=0.01)
+
+
+def test_unsettled_fits_are_nan():
+    V_, J = padded(CELLS, jph=False)
+    seeds = np.tile([0, 1e-12, 1.5, 1.0, 1e4], (len(CELLS), 1))
+    params, rmse, settled = a4.fit_diode(V_, J, seeds, dark=True, iterations=1)
+    assert not settled.any()
+    assert np.isfinite(rmse).all()
+
+
+def test_fits_that_stay_bad_are_nan():
+    # Nothing like a diode, no seed will make this fit
+    J = np.where(V > 0.5, 30.0, -30.0) * np.cos(40 * V)
+    light = {1: a4.pad_sweeps([(V, J)]), 2: a4.pad_sweeps([(V, J)])}
+    metrics = {}
+    for index in (1, 2):
+        for name, values in zip(("voc", "jsc", "vmp", "jmp", "ff", "pce"), a4.solve_light_iv(*light[index])):
+            metrics[f"{name}_{index}"] = values
+    fits = a4.diode_fits(light, light, metrics)
+    for name in ("n", "rs", "rsh", "j0"):
+        assert np.isnan(fits[f"{name}_1"]).all()
+    assert (fits["rmse_1"] > a4.FIT_MAX_RMSE).all()
+
+
+def test_streamed_mppt_gives_the_same_numbers(run_folder):
+    whole = a4.analyze_db(a4.create_db(run_folder, stream_bytes=None))
+    db = a4.create_db(run_folder, stream_bytes=0)
+    streamed = a4.analyze_db(db)
+    for name in a4.METRIC_COLUMNS:
+        assert np.allclose(streamed[name], whole[name], equal_nan=True), name
+    pixel = next(iter(db.values()))
+    assert pixel.get_mppt_summary()["points"] == pixel.get_mppt().shape[1]
+    with pytest.raises(ValueError):
+        a4.export_archive(db, str(run_folder) + "_streamed")
+
+
+def test_streamed_mppt_is_cut_down_keeping_the_extremes(run_folder):
+    path = next(path for _, sweep, path in a4.RunIndex(run_folder).sweep_files if sweep == "mppt")
+    whole = a4.load_tsv(path)
+    trace, summary = a4.stream_mppt_file(path, 0.1, rows=37, target=40)
+    assert summary["points"] == whole.shape[1]
+    assert trace.shape[1] <= 40
+    assert np.isin(trace[2], whole[2]).all()
+    assert np.abs(trace[0]).max() == np.abs(whole[0]).max() and np.abs(trace[0]).min() == np.abs(whole[0]).min()
+    stability = a4.mppt_stability(whole, 0.1, rows=37)
+    assert all(summary["metrics"][name] == value or np.isnan(value) for name, value in stability.items())
+
+
+def interp_nan(grid, v, j):
+    """np.interp of one curve, NaN outside it (and everywhere for less than 2 points)"""
+    order = np.argsort(v)
+    if len(v) < 2:
+        return np.full(len(grid), np.nan)
+    return np.interp(grid, v[order], j[order], left=np.nan, right=np.nan)
+
+
+def test_resample_rows_matches_interp():
+    rng = np.random.default_rng(3)
+    curves = [(np.sort(rng.uniform(-1, 2, n)), rng.normal(size=n)) for n in (50, 7, 2, 1, 0, 30)]
+    curves.append((np.linspace(0, 1, 11), np.linspace(0, 1, 11) ** 2))
+    X, Y = a4.pad_sweeps(curves)
+    # Off the ends of every row, between points, and right on some of them:
+    grid = np.union1d(np.linspace(-1.5, 2.5, 401), np.linspace(0, 1, 11))
+    resampled = a4.resample_rows(grid, *a4.sort_rows(X, Y))
+    for row, (v, j) in enumerate(curves):
+        assert np.allclose(resampled[row], interp_nan(grid, v, j), equal_nan=True, rtol=1e-12, atol=1e-12), row
+
+
+def test_compare_sweeps_matches_interp():
+    forward = [(V, a4.diode_current(V, *cell)) for cell in CELLS]
+    slower = CELLS.copy()
+    slower[:, 3] *= 3  # More series resistance on the way back, so there's some hysteresis
+    reverse = [(V[::-1], a4.diode_current(V[::-1], *cell)) for cell in slower]
+    reverse[1] = (reverse[1][0][::2], reverse[1][1][::2])  # Ragged
+    reverse[2] = (reverse[2][0][:-40], reverse[2][1][:-40])  # Stops short of Jsc
+    dark = [(V, a4.diode_current(V, 0, *cell[1:])) for cell in CELLS]
+    dark[1] = None
+    dark[2] = (np.where(V > 0.8, np.nan, V), dark[2][1])  # NaN padded, stops before the rectification bias
+
+    light = {1: a4.pad_sweeps(forward), 2: a4.pad_sweeps(reverse)}
+    dark = {1: a4.pad_sweeps(dark), 2: a4.pad_sweeps(dark)}
+    metrics = {}
+    for index in (1, 2):
+        for name, values in zip(("voc", "jsc", "vmp", "jmp", "ff", "pce"), a4.solve_light_iv(*light[index])):
+            metrics[f"{name}_{index}"] = values
+    compared = a4.compare_sweeps(light, dark, metrics)
+
+    step = a4.COMPARE_GRID_STEP
+    grid = np.union1d(np.arange(np.floor(V.min() / step), np.ceil(V.max() / step) + 1) * step,
+                      [a4.LEAKAGE_BIAS, a4.RECTIFICATION_BIAS])
+    for row in range(len(CELLS)):
+        curves = [a4.pad_sweeps([forward[row]]), a4.pad_sweeps([reverse[row]])]
+        j_forward, j_reverse = (interp_nan(grid, X[0][np.isfinite(X[0])], Y[0][np.isfinite(X[0])])
+                                for X, Y in curves)
+        quadrant = (grid >= 0) & (grid <= metrics["voc_2"][row])
+        area = np.trapezoid(np.abs(j_reverse - j_forward)[quadrant], grid[quadrant]) / \
+            np.trapezoid(np.abs(j_reverse)[quadrant], grid[quadrant])
+        assert np.allclose(compared["hi_area"][row], area, equal_nan=True), row
+        pce_forward, pce_reverse = metrics["pce_1"][row], metrics["pce_2"][row]
+        assert np.isclose(compared["hi"][row], (pce_reverse - pce_forward) / pce_reverse)
+
+        X, Y = dark[1]
+        v, j = X[row][np.isfinite(X[row])], Y[row][np.isfinite(X[row])]
+        leak = np.abs(interp_nan([a4.LEAKAGE_BIAS], v, j)[0])
+        rect = np.abs(interp_nan([a4.RECTIFICATION_BIAS], v, j)[0]) / leak
+        assert np.allclose([compared["leak_d1"][row], compared["rect_d1"][row]], [leak, rect], equal_nan=True), row
+    assert np.isnan(compared["hi_area"][2]) and np.isfinite(compared["hi_area"][:2]).all()
+    assert np.isnan(compared["leak_d1"][1]) and np.isnan(compared["rect_d1"][2])
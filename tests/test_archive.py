@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Packing run folders into archives (--pack) and reading them back"""
+
+import shutil
+
+import numpy as np
+
+from conftest import a4
+
+
+def test_pack_finds_runs_at_depth(run_folder, tmp_path, capsys):
+    campaign = tmp_path / "campaign"
+    shutil.copytree(run_folder, campaign / "2024" / "batch" / "run")
+    dest = tmp_path / "packed"
+    dest.mkdir()
+
+    assert a4.convert_tree(str(campaign), str(dest), workers=1) == []
+    assert "Couldn't find any run folders" in capsys.readouterr().out
+    assert a4.convert_tree(str(campaign), str(dest), workers=1, depth=3) == [str(dest / "run.a4")]
+
+
+def test_archive_round_trip(run_folder, tmp_path):
+    db = a4.create_db(run_folder, stream_bytes=None)
+    loaded = a4.load_archive(a4.export_archive(db, str(tmp_path / "run")))
+    assert list(loaded) == list(db)
+    for key, pixel in db.items():
+        assert loaded[key].get_id() == pixel.get_id()
+        assert loaded[key].get_var() == pixel.get_var()
+        for sweep in a4.SWEEP_TYPES:
+            if pixel.get_sweep(sweep) is None:
+                assert loaded[key].get_sweep(sweep) is None
+            else:
+                assert np.array_equal(loaded[key].get_sweep(sweep), pixel.get_sweep(sweep))
+
+    expected, found = a4.analyze_db(db), a4.analyze_db(loaded)
+    assert list(found) == list(expected)
+    for name, column in expected.items():
+        if np.asarray(column).dtype.kind == "f":
+            assert np.array_equal(found[name], column, equal_nan=True), name
+        else:
+            assert list(found[name]) == list(column), name
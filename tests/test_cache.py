@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""ResultCache: what hits, what has to miss, and keeping it under its size"""
+
+import os
+import shutil
+
+import numpy as np
+
+from conftest import a4
+
+
+def sweep_file(tmp_path, rows=5):
+    path = tmp_path / "pixel.liv1.tsv"
+    path.write_text("voltage (V)\tcurrent (A)\ttime (s)\tstatus\n"
+                    + "".join(f"{i * 0.1}\t{-i * 1e-3}\t{i}\t0\n" for i in range(rows)))
+    return str(path)
+
+
+def test_tsv_hits_until_the_file_changes(tmp_path):
+    cache = a4.ResultCache(str(tmp_path / "cache"))
+    path = sweep_file(tmp_path)
+    first = cache.load_tsv(path)
+    assert np.array_equal(cache.load_tsv(path), first)
+    assert (cache.stats["hits"], cache.stats["misses"]) == (1, 1)
+
+    # Touched, same size:
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert np.array_equal(cache.load_tsv(path), first)
+    assert cache.stats["misses"] == 2
+
+    # Grown, same modified time:
+    stat = os.stat(path)
+    sweep_file(tmp_path, rows=6)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.load_tsv(path).shape == (4, 6)
+    assert (cache.stats["hits"], cache.stats["misses"]) == (1, 3)
+
+
+def test_results_miss_when_the_analysis_settings_change(run_folder, tmp_path, monkeypatch):
+    run = tmp_path / "run"
+    shutil.copytree(run_folder, run)
+    cache = a4.ResultCache(str(tmp_path / "cache"))
+    _, results = a4.process_folder(str(run), cache, keep_db=False)
+    assert cache.get_results(str(run)) is not None
+
+    monkeypatch.setattr(a4, "LEAKAGE_BIAS", -0.5)
+    assert cache.get_results(str(run)) is None
+    monkeypatch.undo()
+    assert cache.get_results(str(run)) is not None
+
+    next(run.glob("*.liv1.tsv")).unlink()
+    assert cache.get_results(str(run)) is None
+
+
+def test_evict_throws_out_the_least_recently_used(tmp_path):
+    cache = a4.ResultCache(str(tmp_path / "cache"), max_bytes=10**6)
+    paths = []
+    for index in range(4):
+        folder = tmp_path / f"sweeps{index}"
+        folder.mkdir()
+        paths.append(sweep_file(folder, rows=2000))
+        cache.load_tsv(paths[-1])
+    entries = sorted(cache.entries())
+    for age, (_, _, entry_path) in enumerate(entries):
+        os.utime(entry_path, (1e9 + age, 1e9 + age))
+    size = entries[0][1]
+
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert sorted(path for _, _, path in cache.entries()) == sorted(path for _, _, path in entries[2:])
+    assert cache.stats["evicted"] == 2
+
+
+def test_cache_dir_option(run_folder, tmp_path, capsys):
+    cache_dir = tmp_path / "cache"
+    output = str(tmp_path / "summary.csv")
+    a4.main([run_folder, "--no-origin", "-o", output, "--cache-dir", str(cache_dir)])
+    assert f"Parsed runs will be cached in {cache_dir}" in capsys.readouterr().out
+    assert a4.ResultCache(str(cache_dir)).entries()
+
+    a4.main([run_folder, "--no-origin", "-o", output, "--cache-dir", str(cache_dir)])
+    out = capsys.readouterr().out
+    assert "will be cached" not in out and "Cache: 1/1 hits" in out
+
+    a4.main([run_folder, "--no-origin", "-o", output, "--cache-dir", str(tmp_path / "other"), "--no-cache"])
+    assert not (tmp_path / "other").exists()
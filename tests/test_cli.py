@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""The summary files (SummaryWriter) and running the whole thing from the command line without Origin"""
+
+import csv
+import json
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import a4
+
+
+@pytest.fixture(scope="module")
+def results(run_folder):
+    return a4.analyze_db(a4.create_db(run_folder))
+
+
+def with_extra(results):
+    """The same pixels again, with a variable the first folder didn't have"""
+    return {**results, "extra": np.array([f"x{row}" for row in range(len(results["key"]))], dtype=object)}
+
+
+def check_rows(rows, results, folders, extra=True):
+    """
+    rows as read back from a file, every value a string or number (None/"" for nothing). With extra, the second
+    folder is with_extra(results)
+    """
+    n = len(results["key"])
+    assert len(rows) == n * len(folders)
+    for index, row in enumerate(rows):
+        folder, pixel = folders[index // n], index % n
+        assert row["folder"] == folder and row["key"] == results["key"][pixel]
+        for metric in a4.METRIC_COLUMNS:
+            expected = results[metric][pixel]
+            if np.isnan(expected):
+                assert row[metric] in (None, "")
+            else:
+                assert float(row[metric]) == expected
+        assert row["other_vars"] == (f"extra=x{pixel}" if extra and index >= n else "")
+
+
+def test_csv_summary(results, tmp_path):
+    path = str(tmp_path / "summary.csv")
+    with a4.SummaryWriter(path) as writer:
+        writer.write("run1", results)
+        writer.write("run2", with_extra(results))
+    with open(path, newline='') as file:
+        check_rows(list(csv.DictReader(file)), results, ["run1", "run2"])
+
+
+def test_json_summary(results, tmp_path):
+    path = str(tmp_path / "summary.txt")
+    with a4.SummaryWriter(path, "json") as writer:
+        writer.write("run1", results)
+        writer.write("run2", with_extra(results))
+    with open(path) as file:
+        check_rows(json.load(file), results, ["run1", "run2"])
+
+
+def test_empty_summary(tmp_path):
+    a4.SummaryWriter(str(tmp_path / "summary.json")).close()
+    with open(tmp_path / "summary.json") as file:
+        assert json.load(file) == []
+
+
+def test_parquet_summary(results, tmp_path):
+    pytest.importorskip("pyarrow")
+    pd = pytest.importorskip("pandas")
+    path = str(tmp_path / "summary.parquet")
+    with a4.SummaryWriter(path) as writer:
+        writer.write("run1", results)
+        writer.write("run2", with_extra(results))
+    rows = [{name: None if value is None or value != value else value for name, value in row.items()}
+            for row in pd.read_parquet(path).to_dict("records")]
+    check_rows(rows, results, ["run1", "run2"])
+
+
+def test_parquet_without_pyarrow(run_folder, tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ModuleNotFoundError, match="pip install pyarrow"):
+        a4.SummaryWriter(str(tmp_path / "summary.parquet"))
+    with pytest.raises(SystemExit):
+        a4.main([run_folder, "--no-origin", "--no-cache", "-o", str(tmp_path / "summary.parquet")])
+    assert "pip install pyarrow" in capsys.readouterr().err
+    with pytest.raises(ValueError):
+        a4.SummaryWriter(str(tmp_path / "summary.xlsx"))
+
+
+def test_no_origin_run(run_folder, results, tmp_path, monkeypatch, capsys):
+    runs = tmp_path / "runs"
+    runs.mkdir()
+    for name in ("run1", "run2"):
+        shutil.copytree(run_folder, runs / name)
+    monkeypatch.chdir(tmp_path)
+    a4.main([str(runs), "--no-origin", "--no-cache", "--workers", "1"])  # Folder of runs, default output
+    assert "Summary of 16 pixels written to a4_summary.csv" in capsys.readouterr().out
+    with open(tmp_path / "a4_summary.csv", newline='') as file:
+        rows = list(csv.DictReader(file))
+    check_rows(rows, results, [str(runs / "run1"), str(runs / "run2")], extra=False)
+
+    a4.main([run_folder, "--no-origin", "--no-cache", "--format", "json"])
+    with open(tmp_path / "a4_summary.json") as file:
+        assert len(json.load(file)) == 8
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Runs read straight out of zips and tars, they have to come out the same as the loose files"""
+
+import gzip
+import os
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+
+from conftest import a4
+
+
+def pack(run_folder, archive):
+    """run_folder into archive as campaign/run/..., the tars with ./ on the front like tar -C . makes them"""
+    names = sorted(os.listdir(run_folder))
+    if archive.endswith(".zip"):
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as file:
+            for name in names:
+                file.write(os.path.join(run_folder, name), f"campaign/run/{name}")
+    else:
+        with tarfile.open(archive, 'w:gz' if archive.endswith(".gz") else 'w') as file:
+            for name in names:
+                file.add(os.path.join(run_folder, name), f"./campaign/run/{name}")
+    return names
+
+
+@pytest.mark.parametrize("ext", [".zip", ".tar", ".tar.gz"])
+def test_archived_run_matches_loose_files(run_folder, tmp_path, ext):
+    archive = str(tmp_path / f"runs{ext}")
+    names = pack(run_folder, archive)
+    run = os.path.join(archive, "campaign", "run")
+
+    assert a4.split_compressed(os.path.join(run, names[0])) == (archive, f"campaign/run/{names[0]}")
+    assert a4.split_compressed(archive) == (archive, "")
+    assert a4.split_compressed(os.path.join(run_folder, names[0])) == (None, os.path.join(run_folder, names[0]))
+
+    assert a4.list_dirs(archive) == [os.path.join(archive, "campaign")]
+    assert sorted(a4.list_files(run)) == [(name, os.path.join(run, name)) for name in names]
+    compressed = a4.open_compressed(archive)
+    assert compressed is a4.open_compressed(archive)  # Kept open
+    for name in names:
+        assert compressed.size(f"campaign/run/{name}") == os.path.getsize(os.path.join(run_folder, name))
+        with a4.open_file(os.path.join(run, name)) as file, open(os.path.join(run_folder, name), 'rb') as loose:
+            assert file.read() == loose.read()
+    assert a4.file_state(os.path.join(run, names[0]))[1] == os.stat(archive).st_mtime_ns
+
+    index, loose_index = a4.RunIndex(run), a4.RunIndex(run_folder)
+    assert [stem_sweep for *stem_sweep, _ in index.sweep_files] == \
+           [stem_sweep for *stem_sweep, _ in sorted(loose_index.sweep_files)]
+    assert [os.path.basename(path) for path in index.csv_files] == \
+           [os.path.basename(path) for path in loose_index.csv_files]
+
+    db, loose = a4.create_db(run), a4.create_db(run_folder)
+    assert list(db) == list(loose)
+    for key, pixel in loose.items():
+        for sweep in a4.SWEEP_TYPES:
+            assert np.array_equal(db[key].get_sweep(sweep), pixel.get_sweep(sweep))
+    results, loose_results = a4.analyze_db(db), a4.analyze_db(loose)
+    for name in a4.METRIC_COLUMNS:
+        assert np.array_equal(results[name], loose_results[name], equal_nan=True), name
+
+
+def test_gzipped_files_in_a_zip(run_folder, tmp_path):
+    archive = str(tmp_path / "runs.zip")
+    with zipfile.ZipFile(archive, 'w') as file:
+        for name in os.listdir(run_folder):
+            with open(os.path.join(run_folder, name), 'rb') as loose:
+                file.writestr(f"run/{name}.gz", gzip.compress(loose.read()))
+    db, loose = a4.create_db(os.path.join(archive, "run")), a4.create_db(run_folder)
+    assert list(db) == list(loose)
+    for key, pixel in loose.items():
+        assert np.array_equal(db[key].get_light_iv()[0], pixel.get_light_iv()[0])
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""What ends up in Origin (a FakeOrigin here): the batched sheet writes, the data sheets, and lazy graphs"""
+
+import re
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import a4
+from fake_origin import FakeOrigin
+
+
+def write_sheet_per_column(wks, columns):
+    """How the sheets used to be filled: one from_list per column, labels and designation going with it"""
+    for index, (data, lname, units, comments, axis) in enumerate(columns):
+        wks.from_list(a4.letter_i(index + 1), list(data), lname, units, comments, axis=axis)
+
+
+def sheet_contents(sheet):
+    labels = {type_: [label for label in sheet.labels.get(type_, [])] for type_ in "LUC"}
+    n_columns = max(sheet.data) + 1
+    for type_ in labels:
+        labels[type_] += [''] * (n_columns - len(labels[type_]))
+    data = [[float(value) for value in sheet.data[index] if not np.isnan(value)] for index in range(n_columns)]
+    return data, labels, sheet.designations.ljust(n_columns, 'y')
+
+
+COLUMNS = [(np.linspace(0, 1, 7), 'Voltage', 'V', '', 'X'),
+           (np.linspace(-20, 5, 7), 'Current', 'mA/cm^2', 'Illuminated, 1', 'Y'),
+           (np.linspace(1, 0, 4), 'Voltage', 'V', '', 'X'),
+           (np.linspace(5, -20, 4), 'Current', 'mA/cm^2', 'Illuminated, 2', 'Y')]
+
+
+@pytest.mark.parametrize("with_pandas", [True, False])
+def test_write_sheet_matches_per_column(monkeypatch, with_pandas):
+    if not with_pandas:
+        monkeypatch.setattr(a4, "pd", None)
+    elif a4.pd is None:
+        pytest.skip("needs pandas")
+    origin = FakeOrigin()
+    batched, per_column = origin.new_sheet(), origin.new_sheet()
+    a4.write_sheet(batched, COLUMNS)
+    write_sheet_per_column(per_column, COLUMNS)
+    assert sheet_contents(batched) == sheet_contents(per_column)
+
+
+def test_write_sheet_is_a_handful_of_calls():
+    origin = FakeOrigin()
+    a4.write_sheet(origin.new_sheet(), COLUMNS * 10)
+    assert sum(origin.calls.values()) < 10
+
+
+def test_data_sheets_hold_the_pixel_curves(run_folder, fake_origin):
+    db = a4.create_db(run_folder)
+    key, pixel = next(iter(db.items()))
+    wks, wks_mpp = a4.origin_data_sheets(key, pixel)
+
+    area = float(pixel.get_id()["area"])
+    expected = []
+    for sweep, (V, I) in (("liv1", pixel.get_light_iv()[0][:2]), ("liv2", pixel.get_light_iv()[1][:2])):
+        expected.append((V, 'Voltage', 'V', '', 'X'))
+        expected.append((np.asarray(I) * 1e3 / area, 'Current', 'mA/cm^2', f"Illuminated, {sweep[-1]}", 'Y'))
+    data, labels, designations = sheet_contents(wks)
+    for index, (values, lname, units, comments, axis) in enumerate(expected):
+        assert np.allclose(data[index], values)
+        assert (labels['L'][index], labels['U'][index], labels['C'][index]) == (lname, units, comments)
+        assert designations[index] == axis.lower()
+    assert wks_mpp is not None
+
+
+def test_plotting_pixels_read_back_matches_plotting_the_database(run_folder, monkeypatch):
+    db = a4.create_db(run_folder)
+    results = a4.analyze_db(db)
+    whole, streamed = FakeOrigin(), FakeOrigin()
+    monkeypatch.setattr(a4, "op", whole, raising=False)
+    a4.origin_create_plots(db, results)
+    monkeypatch.setattr(a4, "op", streamed)
+    kept = {}
+    a4.origin_create_plots(kept, results, pixels=a4.iter_plot_pixels(run_folder, results), release=True)
+    assert [sheet.lname for sheet in whole.sheets] == [sheet.lname for sheet in streamed.sheets]
+    for a, b in zip(whole.sheets, streamed.sheets):
+        assert a.data.keys() == b.data.keys()
+        for column in a.data:
+            assert [str(value) for value in a.data[column]] == [str(value) for value in b.data[column]]
+
+
+@pytest.mark.parametrize("stream_bytes", [None, 0])
+def test_empty_mppt_file_just_means_no_mppt(run_folder, tmp_path, fake_origin, stream_bytes):
+    run = tmp_path / "run"
+    shutil.copytree(run_folder, run)
+    emptied = sorted(run.glob("*.mppt.tsv"))[0]
+    emptied.write_text(emptied.read_text().splitlines()[0] + "\n")  # Header only
+
+    db = a4.create_db(str(run), stream_bytes=stream_bytes)
+    a4.origin_create_plots(db, lazy=False)
+    mppt_sheets = [sheet.lname for sheet in fake_origin.sheets if sheet.lname.startswith("MPPT DATA")]
+    assert len(mppt_sheets) == len(db) - 1
+    assert not any(emptied.name.startswith(name.split()[-1]) for name in mppt_sheets)
+
+
+def quoted_run(run_folder, tmp_path):
+    """The fake run, with a quote in the user label of the first substrate (so in its pixel keys too)"""
+    run = tmp_path / "run"
+    shutil.copytree(run_folder, run)
+    for path in run.iterdir():
+        if "sub0" in path.name:
+            path.rename(run / path.name.replace("sub0", "it's"))
+    csv_path = next(run.glob("*.csv"))
+    csv_path.write_text(csv_path.read_text().replace(",sub0,", ",it's,"))
+    return str(run)
+
+
+def summary_links(origin, name="IV curve"):
+    """The IV curve (or MPPT) column of the newest summary sheet"""
+    summary = [sheet for sheet in origin.sheets if sheet.lname.startswith("DATA SUMMARY")][-1]
+    return summary.data[summary.labels['L'].index(name)]
+
+
+@pytest.mark.parametrize("data_sheets", [True, False])
+def test_lazy_graphs_draw_in_their_folder_when_clicked(run_folder, tmp_path, fake_origin, monkeypatch, data_sheets):
+    monkeypatch.setattr(a4, "PENDING_GRAPHS", {})
+    db = a4.create_db(quoted_run(run_folder, tmp_path))
+    assert any("'" in key for key in db)
+    results = a4.origin_create_plots(db, lazy=True, top=2, data_sheets=data_sheets)
+    links = summary_links(fake_origin)
+    drawn = [link for link in links if link.startswith("graph://")]
+    assert len(drawn) == 2 and len(a4.PENDING_GRAPHS) == len(db) - 2
+    assert len(fake_origin.graphs) == 2 * 2  # JV and MPPT of the top two
+
+    for row, key in enumerate(results["key"]):
+        link = links[row]
+        if link.startswith("graph://"):
+            continue
+        number = int(re.fullmatch(r'lt://run -pys "render_pixel\((\d+)\)"', link).group(1))
+        fake_origin.lt_exec('pe_cd /; pe_cd "SUMMARY";')  # Wherever the user happens to be
+        a4.render_pixel(number)
+        jv, mppt = fake_origin.graphs[1], fake_origin.graphs[0]
+        assert (jv.lname, mppt.lname) == (f"JV: {key}", f"MPPT: {key}")
+        assert jv.folder == mppt.folder == f"/FULL_IV_CURVES/{key}"
+        assert [sheet.folder for sheet in fake_origin.sheets if sheet.lname.endswith(f"DATA for {key}")] == \
+               [f"/FULL_IV_CURVES/{key}"] * 2
+        assert summary_links(fake_origin)[row].startswith("graph://")
+        assert summary_links(fake_origin, "MPPT")[row].startswith("graph://")
+        graphs = len(fake_origin.graphs)
+        a4.render_pixel(number)  # Only the first click does anything
+        assert len(fake_origin.graphs) == graphs
+    assert a4.PENDING_GRAPHS == {}
+    assert all(link.startswith("graph://") for link in summary_links(fake_origin))
+
+
+def test_lazy_runs_with_the_same_keys_dont_mix(run_folder, fake_origin, monkeypatch):
+    monkeypatch.setattr(a4, "PENDING_GRAPHS", {})
+    a4.origin_create_plots(a4.create_db(run_folder), lazy=True, top=0)
+    first = list(summary_links(fake_origin))
+    a4.origin_create_plots(a4.create_db(run_folder), lazy=True, top=0)
+    second = list(summary_links(fake_origin))
+    assert not set(first) & set(second)
+    a4.render_pending()
+    assert all(link.startswith("graph://") for link in summary_links(fake_origin))
+    summaries = [sheet for sheet in fake_origin.sheets if sheet.lname.startswith("DATA SUMMARY")]
+    assert all(link.startswith("graph://") for link in summaries[0].data[summaries[0].labels['L'].index("IV curve")])
+
+
+def test_pool_folders_are_only_parsed_once(run_folder, tmp_path, fake_origin, monkeypatch):
+    runs = tmp_path / "runs"
+    for name in ("run1", "run2"):
+        shutil.copytree(run_folder, runs / name)
+    parsed = []
+    parse_tsv = a4.parse_tsv
+    monkeypatch.setattr(a4, "parse_tsv", lambda *args: parsed.append(args[1]) or parse_tsv(*args))
+    scratch = []
+    scratch_cache = a4.scratch_cache
+    monkeypatch.setattr(a4, "scratch_cache", lambda: scratch.append(1) or scratch_cache())
+    monkeypatch.setattr(a4, "_pool_executable", lambda: sys.executable)
+
+    a4.main([str(runs), "--no-cache", "--no-server", "--workers", "2"])
+    assert parsed == []  # All done in the pool, and read back from there
+    assert scratch == [1]
+    assert len([sheet for sheet in fake_origin.sheets if sheet.lname.startswith("DATA for")]) == 16
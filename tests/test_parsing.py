@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Reading the sweep files: has to give the same numbers as reading them cell by cell, and fail loudly otherwise"""
+
+import csv
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import a4
+
+
+def write(path, rows, header="voltage (V)\tcurrent (A)\ttime (s)\tstatus"):
+    path.write_text(header + "\n" + "".join("\t".join(str(value) for value in row) + "\n" for row in rows))
+    return str(path)
+
+
+def read_per_cell(path):
+    """What the sweep files were read with before: csv, first four columns, float() on each"""
+    with open(path) as file:
+        rows = list(csv.reader(file, delimiter='\t'))[1:]
+    return np.array([[float(value) for value in row[:4]] for row in rows]).T
+
+
+def test_load_tsv_matches_per_cell(run_folder):
+    index = a4.RunIndex(run_folder)
+    for _, _, path in index.sweep_files[:10]:
+        assert np.array_equal(a4.load_tsv(path), read_per_cell(path))
+
+
+def test_extra_columns_are_ignored(tmp_path):
+    # 5 columns and 4 rows: 20 values, which used to reshape into four scrambled columns
+    rows = [(0.1 * i, -0.002 + i * 1e-4, i, 0, 99) for i in range(4)]
+    data = a4.load_tsv(write(tmp_path / "a.liv1.tsv", rows))
+    assert np.array_equal(data, np.array(rows, dtype=float)[:, :4].T)
+
+
+@pytest.mark.parametrize("rows", [[(0.1, -0.002, 0, 0), (0.2, "oops", 1, 0)],
+                                  [(0.1, -0.002, 0, 0), (0.2, -0.001, 1)],
+                                  [(0.1, -0.002, 0), (0.2, -0.001, 1)]])
+def test_malformed_rows_raise(tmp_path, rows):
+    path = write(tmp_path / "a.liv1.tsv", rows)
+    with pytest.raises(ValueError, match="a.liv1.tsv"):
+        a4.load_tsv(path)
+    with pytest.raises(ValueError, match="a.liv1.tsv"):
+        list(a4.iter_tsv_chunks(path, rows=1))
+
+
+def test_header_only(tmp_path):
+    assert a4.load_tsv(write(tmp_path / "a.liv1.tsv", [])).shape == (4, 0)
+
+
+def test_chunks_add_up_to_the_whole_file(run_folder):
+    path = a4.RunIndex(run_folder).sweep_files[0][2]
+    whole = a4.load_tsv(path)
+    chunks = list(a4.iter_tsv_chunks(path, rows=7))
+    assert all(chunk.shape[1] <= 7 for chunk in chunks)
+    assert np.array_equal(np.concatenate(chunks, axis=1), whole)
+
+
+def test_crlf_and_gzip(tmp_path):
+    import gzip
+    rows = [(0.1 * i, -0.002, i, 0) for i in range(5)]
+    text = ("v\ti\tt\ts\n" + "".join("\t".join(map(str, row)) + "\n" for row in rows)).replace("\n", "\r\n")
+    (tmp_path / "a.liv1.tsv").write_bytes(text.encode())
+    with gzip.open(tmp_path / "b.liv1.tsv.gz", 'wb') as file:
+        file.write(text.encode())
+    expected = np.array(rows, dtype=float).T
+    assert np.array_equal(a4.load_tsv(str(tmp_path / "a.liv1.tsv")), expected)
+    assert np.array_equal(a4.load_tsv(str(tmp_path / "b.liv1.tsv.gz")), expected)
+
+
+def test_missing_sweeps_are_summed_up_per_sweep(run_folder, tmp_path, capsys):
+    run = tmp_path / "run"
+    shutil.copytree(run_folder, run)
+    for path in run.glob("*.mppt.tsv"):
+        path.unlink()
+    next(iter(sorted(run.glob("*.div2.tsv")))).unlink()
+
+    index = a4.RunIndex(str(run))
+    index.match(a4.read_run_csv(index.csv_files[0]).keys())
+    index.report()
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2
+    assert lines[0].startswith("No div2 sweep for 1 of 8 pixels (")
+    assert lines[1].startswith("No mppt sweep for 8 of 8 pixels (") and lines[1].endswith(", ...)")
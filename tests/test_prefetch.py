@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""prefetch: the background thread that parses ahead of whoever is drawing"""
+
+import itertools
+import threading
+
+import pytest
+
+from conftest import a4
+
+
+def prefetch_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "a4-prefetch"]
+
+
+def test_same_items_at_most_depth_ahead():
+    produced = []
+
+    def items():
+        for item in range(20):
+            produced.append(item)
+            yield item
+
+    found = []
+    for item in a4.prefetch(items(), depth=2):
+        # The one being used, up to 2 waiting and one more the thread is trying to hand over
+        assert len(produced) <= item + 1 + 2 + 1
+        found.append(item)
+    assert found == list(range(20))
+    assert prefetch_threads() == []
+
+
+def test_errors_come_out_after_the_items_before_them():
+    def items():
+        yield from range(3)
+        raise ValueError("bad file")
+
+    found = []
+    with pytest.raises(ValueError, match="bad file"):
+        for item in a4.prefetch(items(), depth=1):
+            found.append(item)
+    assert found == [0, 1, 2]
+    assert prefetch_threads() == []
+
+
+def test_stopping_early_stops_the_thread():
+    produced = itertools.count()
+    pixels = a4.prefetch((next(produced) for _ in itertools.count()), depth=1)  # Would go on forever
+    assert list(itertools.islice(pixels, 3)) == [0, 1, 2]
+    assert len(prefetch_threads()) == 1
+    pixels.close()
+    assert prefetch_threads() == []
+    assert next(produced) <= 3 + 1 + 1  # The 3 used, one waiting and one being handed over, nothing since
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Profiler (--profile) and the ProfiledProxy it wraps Origin in"""
+
+import json
+
+from conftest import a4
+from fake_origin import FakeGraph, FakeOrigin, FakeSheet
+
+
+def test_profiler_events_and_traces(tmp_path):
+    profiler = a4.Profiler()
+    with profiler.context(folder="run1"):
+        with profiler.span("parse", "io", file="a.liv1") as args:
+            args["rows"] = 10
+        with profiler.context(pixel="A_sub0_device1"):
+            with profiler.span("analyse", "analysis"):
+                pass
+        with profiler.span("parse", "io"):
+            pass
+    assert profiler.folder is None and profiler.pixel is None  # Back to nothing after the with blocks
+
+    assert [(event["name"], event["folder"], event["pixel"]) for event in profiler.events] == \
+           [("parse", "run1", None), ("analyse", "run1", "A_sub0_device1"), ("parse", "run1", None)]
+    assert profiler.events[0]["args"] == {"file": "a.liv1", "rows": 10}
+    assert all(event["dur"] >= 0 for event in profiler.events)
+    assert {name: count for name, (_, count) in profiler.totals("name").items()} == {"parse": 2, "analyse": 1}
+    assert list(profiler.totals("pixel")) == ["A_sub0_device1"]
+
+    worker = a4.Profiler()
+    with worker.context(folder="run2"), worker.span("parse", "io"):
+        pass
+    profiler.merge(worker.events)
+    assert profiler.totals("folder")["run2"][1] == 1
+
+    profiler.write_trace(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json") as file:
+        trace = json.load(file)["traceEvents"]
+    assert [event["name"] for event in trace] == ["parse", "analyse", "parse", "parse"]
+    assert all(event["ph"] == "X" for event in trace)
+    assert trace[1]["args"] == {"folder": "run1", "pixel": "A_sub0_device1"}
+
+    profiler.write_trace(str(tmp_path / "trace.jsonl"))
+    with open(tmp_path / "trace.jsonl") as file:
+        lines = [json.loads(line) for line in file]
+    assert [(event["name"], event["folder"]) for event in lines] == \
+           [(event["name"], event["folder"]) for event in profiler.events]
+
+
+def test_profiled_proxy_unwraps_what_goes_back_in():
+    profiler = a4.Profiler()
+    origin = FakeOrigin()
+    op = profiler.wrap_origin(origin)
+    wks = op.new_sheet(lname="DATA")
+    graph = op.new_graph(lname="JV")
+    assert isinstance(wks, a4.ProfiledProxy) and isinstance(graph, a4.ProfiledProxy)
+    graph[0].add_plot(wks, coly="B", colx="A", type='line')
+    graph[0].add_plot(obj=wks)
+    assert origin.graphs[0].plotted == [origin.sheets[0], origin.sheets[0]]
+    graph.lname = wks  # Setting attributes too
+    assert origin.graphs[0].lname is origin.sheets[0]
+    assert [event["name"] for event in profiler.events] == \
+           ["op.new_sheet", "op.new_graph", "FakeGraph.add_plot", "FakeGraph.add_plot", "FakeGraph.lname="]
+
+
+def test_profiled_run(run_folder, tmp_path, fake_origin, monkeypatch, capsys):
+    monkeypatch.setattr(a4, "PROFILER", None)
+    trace_path = str(tmp_path / "trace.jsonl")
+    a4.main([run_folder, "--no-cache", "--no-server", "--profile", trace_path])
+    assert f"Full trace in {trace_path}" in capsys.readouterr().out
+
+    graphs = fake_origin.graphs
+    assert len(graphs) == 16
+    assert all(isinstance(graph, FakeGraph) for graph in graphs)
+    assert all(isinstance(sheet, FakeSheet) for graph in graphs for sheet in graph.plotted)
+    assert sum(len(graph.plotted) for graph in graphs) == 8 * (4 + 3)
+    with open(trace_path) as file:
+        names = {json.loads(line)["name"] for line in file}
+    assert {"op.new_sheet", "op.new_graph", "FakeGraph.add_plot"} <= names
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Drawing without Origin (--render), with matplotlib's Agg backend"""
+
+import os
+
+import pytest
+
+from conftest import a4
+
+
+@pytest.mark.parametrize("fmt", a4.RENDER_FORMATS)
+def test_matplotlib_backend_draws_a_pixel(run_folder, tmp_path, fmt):
+    matplotlib = pytest.importorskip("matplotlib")
+    matplotlib.use("Agg")
+    db = a4.create_db(run_folder)
+    key = next(iter(db))
+    db = {key: db[key]}
+
+    out_dir = str(tmp_path / "graphs")
+    backend = a4.MatplotlibBackend(out_dir, fmt, workers=1)
+    a4.origin_create_plots(db, backend=backend, name=run_folder)
+    backend.close()
+
+    run_dir = os.path.join(out_dir, os.path.basename(run_folder))
+    for graph in ("JV", "MPPT"):
+        path = os.path.join(run_dir, f"{key}_{graph}.{fmt}")
+        with open(path, 'rb') as file:
+            start = file.read(64)
+        assert start.startswith(b"\x89PNG") if fmt == "png" else b"<?xml" in start or b"<svg" in start
+    with open(os.path.join(run_dir, "summary.html")) as file:
+        page = file.read()
+    assert f'href="{key}_JV.{fmt}"' in page and f'href="{key}_MPPT.{fmt}"' in page
+    with open(os.path.join(out_dir, "index.html")) as file:
+        assert f'href="{os.path.basename(run_folder)}/summary.html"' in file.read()
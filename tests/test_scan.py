@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Finding runs in a campaign tree (scan_campaign) and only looking again where something changed"""
+
+import os
+import shutil
+
+import pytest
+
+from conftest import a4
+
+
+def make_runs(top, *relatives):
+    for relative in relatives:
+        os.makedirs(top / relative)
+        (top / relative / "run.csv").write_text("slot,user_label,area,dark_area,layout,pad\n")
+        (top / relative / "run.yaml").write_text("smu:\n")
+
+
+def bump(path):
+    """Makes sure path's modified time moves on, however coarse the clock"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def listed(monkeypatch, tmp_path):
+    """Where scan_campaign's manifests go, and the folders it really lists (rather than taking from the manifest)"""
+    monkeypatch.setattr(a4, "SCAN_MANIFEST_DIR", str(tmp_path / "manifests"))
+    folders = []
+    scandir = os.scandir
+
+    def counting(path="."):
+        if isinstance(path, str) and path.startswith(str(tmp_path / "campaign")):
+            folders.append(os.path.relpath(path, tmp_path / "campaign"))
+        return scandir(path)
+    monkeypatch.setattr(a4.os, "scandir", counting)
+    return folders
+
+
+def test_rescan_only_lists_what_changed(tmp_path, listed):
+    top = tmp_path / "campaign"
+    make_runs(top, "2024/jan/run1", "2024/feb/run2", "2025/run3", ".trash/run4")
+    expected = [str(top / relative) for relative in ("2024/feb/run2", "2024/jan/run1", "2025/run3")]
+
+    assert a4.scan_campaign(str(top), workers=2) == expected
+    assert ".trash" not in listed and not any(folder.startswith(".trash") for folder in listed)
+    assert len(os.listdir(tmp_path / "manifests")) == 1
+
+    listed.clear()
+    assert a4.scan_campaign(str(top), workers=2) == expected
+    assert listed == []  # Nothing changed, nothing listed
+
+    make_runs(top, "2024/feb/run5")
+    bump(top / "2024" / "feb")
+    listed.clear()
+    assert a4.scan_campaign(str(top), workers=2) == sorted(expected + [str(top / "2024/feb/run5")])
+    assert sorted(listed) == [os.path.join("2024", "feb"), os.path.join("2024", "feb", "run5")]
+
+    shutil.rmtree(top / "2024" / "jan" / "run1")
+    bump(top / "2024" / "jan")
+    listed.clear()
+    assert a4.scan_campaign(str(top), workers=2) == [str(top / relative)
+                                                     for relative in ("2024/feb/run2", "2024/feb/run5", "2025/run3")]
+    assert listed == [os.path.join("2024", "jan")]
+
+    # Without the manifest, everything gets listed
+    listed.clear()
+    a4.scan_campaign(str(top), workers=2, manifest=False)
+    assert len(listed) == 8
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""The resident analysis server (--serve), without the pipe in between"""
+
+import threading
+
+from conftest import a4
+
+
+def test_server_counts_jobs_from_many_clients(run_folder):
+    server = a4.AnalysisServer()
+    clients = [threading.Thread(target=lambda: [server.handle(("summary", run_folder)) for _ in range(50)])
+               for _ in range(8)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    assert server.handle(("stats",)) == {"jobs": 401, "hits": 399, "loads": 1}
+
+
+class LocalClient:
+    """Sends jobs straight to a server, and keeps them"""
+
+    def __init__(self, server):
+        self.server = server
+        self.jobs = []
+
+    def folder(self, path, keep_db=True):
+        self.jobs.append(("folder", path, keep_db))
+        return self.server.handle(("folder", path, keep_db))
+
+    def close(self):
+        pass
+
+
+def test_plotting_from_the_server_only_gets_the_results(run_folder, fake_origin, monkeypatch):
+    server = a4.AnalysisServer()
+    client = LocalClient(server)
+    monkeypatch.setattr(a4, "connect_server", lambda: client)
+    a4.main([run_folder, "--no-cache"])
+    assert client.jobs == [("folder", run_folder, False)]  # The curves are read here, not sent over
+    assert server.handle(("folders",)) == [run_folder]
+    assert len([sheet for sheet in fake_origin.sheets if sheet.lname.startswith("DATA for")]) == 8
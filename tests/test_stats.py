@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""GroupStats (--group-by), across folders and sessions"""
+
+import numpy as np
+import pytest
+
+from conftest import a4
+
+METRICS = ("pce_1", "pce_2", "voc_1")
+
+
+def results(seed, n, anneal):
+    rng = np.random.default_rng(seed)
+    return {"key": np.array([f"S{i // 4 + 1}P{i % 4 + 1}" for i in range(n)]),
+            "anneal": np.array(anneal, dtype=object),
+            "pce_1": rng.uniform(0, 20, n), "pce_2": rng.uniform(0, 20, n), "voc_1": rng.uniform(0.8, 1.2, n)}
+
+
+def check(stats, tables):
+    """Compares stats.table() against numpy on all the tables put together"""
+    merged = {name: np.concatenate([table[name] for table in tables]) for name in ("anneal", *METRICS)}
+    groups = np.array(["" if value is None else str(value) for value in merged["anneal"]])
+    best_pce = np.fmax(merged["pce_1"], merged["pce_2"])
+    rows = stats.table()
+    assert len(rows) == len(set(groups)) * len(METRICS)
+    for row in rows:
+        mask = groups == row["anneal"]
+        values = merged[row["metric"]][mask]
+        assert row["pixels"] == row["n"] == mask.sum()
+        assert row["yield"] == pytest.approx(np.mean(best_pce[mask] >= stats.yield_pce))
+        assert row["median"] == pytest.approx(np.median(values))
+        assert [row["q1"], row["q3"]] == pytest.approx(np.percentile(values, [25, 75]))
+        assert row["best"] == pytest.approx(values[np.argmax(best_pce[mask])])
+
+
+def test_group_stats_add_merge_and_reload(tmp_path):
+    first = results(1, 8, ["100", "150", None, "100", "150", "100", None, "150"])
+    second = results(2, 8, ["150", "100", "100", "", "150", "150", "100", "100"])
+
+    stats = a4.GroupStats(["anneal"], METRICS)
+    stats.add("run1", first)
+    stats.add("run2", second)
+    assert sorted(stats.groups) == [("",), ("100",), ("150",)]  # Missing values aren't a group of their own
+    check(stats, [first, second])
+
+    # Adding a folder again swaps its pixels out, rather than counting them twice
+    redone = results(3, 8, ["100"] * 8)
+    stats.add("run2", redone)
+    check(stats, [first, redone])
+
+    other = a4.GroupStats(["anneal"], METRICS)
+    other.add("run3", second)
+    stats.merge(other)
+    check(stats, [first, redone, second])
+    with pytest.raises(ValueError):
+        stats.merge(other)
+
+    stats.save(str(tmp_path / "stats.pkl"))
+    loaded = a4.GroupStats.load(str(tmp_path / "stats.pkl"), ["anneal"], METRICS)
+    assert loaded.table() == stats.table()
+    # A different grouping doesn't carry on from it
+    assert a4.GroupStats.load(str(tmp_path / "stats.pkl"), ["other"], METRICS).groups == {}
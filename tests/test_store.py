@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""ResultStore (--store/--query): results in, the same results back out"""
+
+import numpy as np
+import pytest
+
+from conftest import a4
+
+
+@pytest.fixture(scope="module")
+def results(run_folder):
+    return a4.analyze_db(a4.create_db(run_folder))
+
+
+def pick(results, rows):
+    return {name: column[rows] for name, column in results.items()}
+
+
+def assert_same(found, expected):
+    assert list(found["key"]) == list(expected["key"])
+    for name, column in expected.items():
+        if name in a4.METRIC_COLUMNS:
+            assert np.array_equal(found[name], column.astype(np.float64), equal_nan=True), name
+        else:
+            assert list(found[name]) == [None if value is None else str(value) for value in column], name
+
+
+def test_store_round_trip(results, tmp_path):
+    db_path = str(tmp_path / "store" / "results.sqlite")
+    first, second = str(tmp_path / "run1"), str(tmp_path / "run2")
+    with a4.ResultStore(db_path) as store:
+        store.upsert(first, results, date="2026-01-01 10:00:00")
+        store.upsert(second, results, date="2026-02-01 10:00:00")
+        # Analysed again with fewer pixels and different numbers, replaces what was there:
+        redone = pick(results, np.arange(4))
+        redone["pce_1"] = redone["pce_1"] + 1
+        store.upsert(first, redone, date="2026-01-01 10:00:00")
+        assert store.connection.execute("SELECT COUNT(*) FROM pixels").fetchone()[0] == 4 + 8
+        assert store.connection.execute("SELECT COUNT(*) FROM vars").fetchone()[0] == (4 + 8) * 2
+
+    with a4.ResultStore(db_path) as store:  # Still there when opened again
+        found = store.query()
+        assert [(folder, date) for folder, date, _ in found] == [(first, "2026-01-01 10:00:00"),
+                                                                 (second, "2026-02-01 10:00:00")]
+        assert_same(found[0][2], redone)
+        assert_same(found[1][2], results)
+
+        assert [folder for folder, _, _ in store.query(since="2026-01-15")] == [second]
+        assert [folder for folder, _, _ in store.query(until="2026-01-15")] == [first]
+
+        composition = results["composition"] == "FAPbI3"
+        (_, _, table), = store.query(["composition=FAPbI3", f"folder={second}"])
+        assert_same(table, pick(results, composition))
+        (_, _, table), = store.query(["composition!=FAPbI3", "slot=B"])
+        assert_same(table, pick(results, ~composition & (results["sys_label"] == "B")))
+
+        cut = np.nanmedian(results["pce_1"])
+        (_, _, table), = store.query([f"pce_1>{cut}", "user_label=sub*", "anneal_temp>=100", "date<2026-01-15"])
+        assert_same(table, pick(redone, redone["pce_1"] > cut))
+
+        with pytest.raises(ValueError):
+            store.query(["pce_1"])
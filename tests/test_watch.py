@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Watch mode: a run folder filling up a pixel at a time"""
+
+import os
+import shutil
+
+import numpy as np
+
+from conftest import a4
+
+
+def test_watcher_only_reanalyses_new_pixels(run_folder, tmp_path):
+    index = a4.RunIndex(run_folder)
+    db = a4.create_db(run_folder)
+    index.match(db.keys())
+    keys = list(db)
+
+    run = tmp_path / "run"
+    watcher = a4.RunWatcher(str(run), settle=5)
+    assert watcher.poll(now=0) == []  # Not there yet
+    run.mkdir()
+    for file_path in index.csv_files + index.yaml_files:
+        shutil.copy(file_path, run)
+    assert watcher.poll(now=10) == []  # csv only just seen
+    assert watcher.poll(now=20) == []  # csv settled, but no sweeps
+
+    clock = 20
+    for key in keys[:2]:
+        for file_path in index.files[key].values():
+            shutil.copy(file_path, run)
+        assert watcher.poll(now=clock + 1) == []  # Still being written, as far as the watcher can tell
+        assert watcher.poll(now=clock + 10) == [key]
+        assert watcher.poll(now=clock + 20) == []
+        clock += 30
+
+    # A file of a pixel that's already in gets rewritten, only that pixel is done again:
+    rewritten = run / os.path.basename(index.files[keys[0]]["liv2"])
+    rewritten.write_text("".join(rewritten.read_text().splitlines(keepends=True)[:-10]))
+    assert watcher.poll(now=clock) == []
+    assert watcher.poll(now=clock + 10) == [keys[0]]
+    db[keys[0]].set_sweep("liv2", a4.load_tsv(str(rewritten)))
+
+    summary = watcher.summary()
+    assert list(summary["key"]) == keys[:2]
+    for row, key in enumerate(keys[:2]):
+        expected = a4.analyze_pixel(db[key])
+        for metric, value in expected.items():
+            assert np.array_equal(summary[metric][row], value, equal_nan=True), (key, metric)